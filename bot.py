@@ -5,64 +5,186 @@ from datetime import time
 from telegram.ext import Application, Defaults
 
 from config import (
+    BOT_MODE,
     BOT_TOKEN,
-    SHEETS_EXPORT_HOUR,
-    SHEETS_EXPORT_MINUTE,
-    REMINDER_AFTER_HOURS,
+    BOT_WORKERS,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    REMINDER_CHECK_INTERVAL,
+    ANALYTICS_ROLLUP_HOUR,
+    ANALYTICS_ROLLUP_MINUTE,
+    RATE_LIMIT_PERSIST_INTERVAL,
 )
-from database import init_db
+from database import init_db, close_pool
+from database.db import start_analytics_sink, stop_analytics_sink
+from database import adb
+from database.adb import shutdown_executor
+from database.persistence import SQLitePersistence
 from handlers import (
+    register_guard_handlers,
     register_start_handlers,
     get_quiz_conversation_handler,
     register_order_handlers,
     register_admin_handlers,
 )
+from handlers.guard import load_rate_limits, persist_rate_limits
+from utils.broadcast import broadcast_jobs
+from utils.images import portfolio_pipeline
 from utils.logger import setup_logging
-from utils.integrations import export_orders_to_sheets, remind_managers_new_orders
+from utils.metrics import InstrumentedRequest, instrument_handlers, metrics_server, timed_job
+from utils.outbox import outbox
+from utils.tracing import tracer
+from utils.pipeline import export_pipeline
+from utils.updates import ChatOrderedUpdateProcessor
+from utils.webhook import run_webhook
+from utils.workers import WorkerPool, build_receiver
+from utils.integrations import remind_managers_new_orders
 
 
-def main() -> None:
-    setup_logging(logging.INFO)
-    logger = logging.getLogger("bot")
+async def on_startup(application: Application) -> None:
+    """Запуск: ограничитель частоты, незавершённые рассылки, доставка уведомлений, выгрузка заявок, копии портфолио."""
+    await load_rate_limits()
+    await broadcast_jobs.resume_all(application)
+    await outbox.start(application.bot)
+    await export_pipeline.start()
+    await metrics_server.start(application)
+    if portfolio_pipeline.available:
+        # В фоне: запуск не ждёт обработки изображений, /portfolio дождётся её сам
+        portfolio_pipeline.start()
+    else:
+        logging.getLogger("bot").warning("Pillow не установлен: портфолио отправляется без обработки")
 
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN не задан. Укажите в .env")
+
+async def on_worker_startup(application: Application) -> None:
+    """Запуск обработчика 1..N-1 (BOT_WORKERS > 1): задачи, outbox, рассылки, выгрузку и копии портфолио ведёт обработчик 0."""
+    await load_rate_limits()
+    await metrics_server.start(application, shared=False)
+    portfolio_pipeline.readonly = True
+
+
+async def on_shutdown(application: Application) -> None:
+    """Остановка: дождаться запросов к БД, дописать аналитику и закрыть подключения."""
+    await metrics_server.stop()
+    await broadcast_jobs.shutdown()
+    await outbox.stop()
+    await export_pipeline.stop()
+    await persist_rate_limits()
+    portfolio_pipeline.shutdown()
+    shutdown_executor()
+    stop_analytics_sink()
+    close_pool()
+    tracer.shutdown()
+
+
+# Типы апдейтов, которые запрашиваются у Telegram (polling и вебхук)
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+async def job_remind(context) -> None:
+    await remind_managers_new_orders(context.application.bot)
+
+
+async def job_analytics_maintenance(context) -> None:
+    """Ночью: агрегаты аналитики за прошедшие дни и архив старых событий."""
+    result = await adb.run_analytics_maintenance()
+    logging.getLogger("bot").info(f"Обслуживание аналитики: {result}")
+
+
+def register_jobs(application: Application, primary: bool = True) -> None:
+    """Периодические задачи (если установлен job_queue); общие для бота — только при primary."""
+    job_queue = application.job_queue
+    if not job_queue:
+        return
+    # Окна ограничителя у каждого процесса свои
+    job_queue.run_repeating(
+        timed_job(persist_rate_limits),
+        interval=RATE_LIMIT_PERSIST_INTERVAL,
+        first=RATE_LIMIT_PERSIST_INTERVAL,
+    )
+    if not primary:
         return
+    job_queue.run_repeating(
+        timed_job(job_remind),
+        interval=REMINDER_CHECK_INTERVAL,
+        first=REMINDER_CHECK_INTERVAL,
+    )
+    job_queue.run_daily(
+        timed_job(job_analytics_maintenance),
+        time=time(hour=ANALYTICS_ROLLUP_HOUR, minute=ANALYTICS_ROLLUP_MINUTE),
+    )
 
-    init_db()
+
+def build_application(primary: bool = True) -> Application:
+    """Собрать Application со всеми обработчиками и задачами.
+
+    primary=False — обработчик 1..N-1 в режиме нескольких процессов (utils/workers.py).
+    """
     defaults = Defaults(parse_mode="Markdown")
     application = (
         Application.builder()
         .token(BOT_TOKEN)
         .defaults(defaults)
+        # Запросы к Bot API с замером по методу (размеры пулов — как по умолчанию в PTB)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest())
+        # Разные чаты — параллельно, апдейты одного чата — по порядку
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+        # user_data и шаги квиза переживают перезапуск
+        .persistence(SQLitePersistence())
+        .post_init(on_startup if primary else on_worker_startup)
+        .post_shutdown(on_shutdown)
         .build()
     )
 
-    # Обработчики: сначала ConversationHandler (квиз), потом остальные
+    # Обработчики: ограничитель частоты (отдельная группа), ConversationHandler (квиз), остальные
+    register_guard_handlers(application)
     application.add_handler(get_quiz_conversation_handler())
     register_start_handlers(application)
     register_order_handlers(application)
     register_admin_handlers(application)
+    register_jobs(application, primary)
+    instrument_handlers(application)
+    return application
 
-    # Ежедневный экспорт в Google Sheets в 23:00
-    job_queue = application.job_queue
-    if job_queue:
-        job_queue.run_daily(
-            lambda ctx: export_orders_to_sheets(),
-            time=time(hour=SHEETS_EXPORT_HOUR, minute=SHEETS_EXPORT_MINUTE),
-        )
-
-        async def job_remind(ctx):
-            await remind_managers_new_orders(ctx.application.bot)
-
-        job_queue.run_repeating(
-            job_remind,
-            interval=1800,
-            first=1800,
-        )
-
-    logger.info("Бот запущен (polling)")
-    application.run_polling(allowed_updates=["message", "callback_query"])
+
+# Заглушки из примеров конфигурации: такой секрет легко угадать
+WEBHOOK_SECRET_PLACEHOLDERS = ("change_me", "changeme", "secret")
+
+
+def main() -> None:
+    setup_logging(logging.INFO)
+    logger = logging.getLogger("bot")
+
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN не задан. Укажите в .env")
+        return
+    if BOT_MODE not in ("polling", "webhook"):
+        logger.error(f"Неизвестный BOT_MODE={BOT_MODE!r}: допустимо polling или webhook")
+        return
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET_TOKEN:
+        logger.error("WEBHOOK_SECRET_TOKEN не задан: без него вебхук принимал бы запросы от кого угодно")
+        return
+    if BOT_MODE == "webhook" and WEBHOOK_SECRET_TOKEN in WEBHOOK_SECRET_PLACEHOLDERS:
+        logger.error("WEBHOOK_SECRET_TOKEN — пример из .env.example: задайте длинную случайную строку")
+        return
+
+    init_db()
+    if BOT_WORKERS > 1:
+        # Этот процесс только получает апдейты, обрабатывают их BOT_WORKERS процессов
+        close_pool()
+        application = build_receiver(WorkerPool(BOT_WORKERS))
+        workers = f", обработчиков: {BOT_WORKERS}"
+    else:
+        start_analytics_sink()
+        application = build_application()
+        workers = ""
+
+    if BOT_MODE == "webhook":
+        logger.info(f"Бот запущен (webhook, порт {WEBHOOK_PORT}{workers})")
+        run_webhook(application, allowed_updates=ALLOWED_UPDATES)
+    else:
+        logger.info(f"Бот запущен (polling{workers})")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -12,10 +12,52 @@ DB_PATH = BASE_DIR / "data" / "bot.db"
 LOG_PATH = BASE_DIR / "bot.log"
 ASSETS_DIR = BASE_DIR / "assets"
 PORTFOLIO_DIR = ASSETS_DIR / "portfolio"
+# Подготовленные для Telegram копии изображений портфолио
+PORTFOLIO_CACHE_DIR = Path(os.getenv("PORTFOLIO_CACHE_DIR", BASE_DIR / "data" / "portfolio_cache"))
 
 # Бот
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 STUDIO_NAME = os.getenv("STUDIO_NAME", "Лендинг Студия")
+# Режим получения апдейтов: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+# Процессов-обработчиков апдейтов (1 — всё в одном процессе, как раньше)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+# Время на завершение обработчиков при остановке, секунды
+BOT_WORKERS_STOP_TIMEOUT = float(os.getenv("BOT_WORKERS_STOP_TIMEOUT", "30"))
+
+# Вебхук: публичный адрес (без пути; если пуст — setWebhook не вызывается),
+# путь, адрес и порт встроенного HTTP-сервера, секрет из заголовка
+# X-Telegram-Bot-Api-Secret-Token, максимум одновременных соединений,
+# время на завершение запросов при остановке
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "/telegram").lstrip("/")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+# Метрики Prometheus: адрес и порт HTTP-сервера с /metrics (0 — не запускать).
+# При BOT_WORKERS > 1 обработчик i слушает METRICS_PORT + i
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Трассировка апдейтов (utils/tracing.py): файл JSON Lines со спанами (пусто — не писать),
+# доля апдейтов, попадающих в файл (медленные — всегда), пороги медленного апдейта
+# и медленной функции БД в мс (0 — не отслеживать), размер файла до ротации в МБ
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_SLOW_UPDATE_MS = float(os.getenv("TRACE_SLOW_UPDATE_MS", "2000"))
+TRACE_SLOW_QUERY_MS = float(os.getenv("TRACE_SLOW_QUERY_MS", "200"))
+TRACE_FILE_MAX_MB = float(os.getenv("TRACE_FILE_MAX_MB", "100"))
+
+# Параллельная обработка апдейтов: одновременно выполняемых, принятых в работу
+# (включая ожидающих свой чат), число шардов для метрик очередей
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "4096"))
+UPDATE_SHARDS = int(os.getenv("UPDATE_SHARDS", "16"))
+# Сохранение user_data и состояний разговоров в SQLite: раз в N секунд
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "15"))
 
 # Админ и уведомления
 ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
@@ -27,16 +69,92 @@ _orders_channel_id = os.getenv("ORDERS_CHANNEL_ID", "").strip()
 ORDERS_CHANNEL_ID = int(_orders_channel_id) if _orders_channel_id else None
 MANAGER_TELEGRAM_IDS = [int(x) for x in os.getenv("MANAGER_TELEGRAM_IDS", "").split(",") if x.strip()]
 
+
+def _parse_limit(value: str) -> tuple[int, float]:
+    """Лимит вида «5/60»: не больше 5 действий за 60 секунд."""
+    count, _, seconds = value.partition("/")
+    return int(count), float(seconds or 60)
+
+
 # Лимиты
-MAX_ORDERS_PER_HOUR = 5
+MAX_ORDERS_PER_HOUR = int(os.getenv("MAX_ORDERS_PER_HOUR", "5"))
+# Скользящие окна по пользователю: заявки, /start, любые апдейты (флуд)
+RATE_LIMITS = {
+    "orders": (MAX_ORDERS_PER_HOUR, 3600.0),
+    "start": _parse_limit(os.getenv("RATE_LIMIT_START", "5/60")),
+    "updates": _parse_limit(os.getenv("RATE_LIMIT_UPDATES", "30/10")),
+}
+RATE_LIMIT_PERSIST_INTERVAL = 60
+# Исходящие сообщения: общий лимит бота в секунду и параметры рассылки
+TELEGRAM_SEND_RATE = float(os.getenv("TELEGRAM_SEND_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_PROGRESS_INTERVAL = 5.0
+# Outbox уведомлений менеджерам: опрос очереди, размер пачки, попыток до «мёртвых»
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# Получателей за один заход из журнала доставки
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "200"))
 REMINDER_AFTER_HOURS = 1
+# Интервалы между повторными напоминаниями по одной заявке, часы (последний повторяется)
+REMINDER_ESCALATION_HOURS = [
+    float(x) for x in os.getenv("REMINDER_ESCALATION_HOURS", "2,4,8,24").split(",") if x.strip()
+]
+REMINDER_CHECK_INTERVAL = 1800
 FOLLOWUP_AFTER_HOURS = 24
-SHEETS_EXPORT_HOUR = 23
-SHEETS_EXPORT_MINUTE = 0
+# Номера заявок выделяются блоками такого размера (1 — без предвыделения)
+ORDER_SEQ_BLOCK_SIZE = int(os.getenv("ORDER_SEQ_BLOCK_SIZE", "1"))
+
+# База данных (пул подключений SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+# Потоки для асинхронного доступа к БД из обработчиков (ограничивают параллелизм)
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE + 1)))
+# Буфер аналитики: сброс раз в N мс или по M событий, ограничение очереди
+ANALYTICS_FLUSH_INTERVAL_MS = int(os.getenv("ANALYTICS_FLUSH_INTERVAL_MS", "500"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "200"))
+ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000"))
+ANALYTICS_ENQUEUE_TIMEOUT_MS = int(os.getenv("ANALYTICS_ENQUEUE_TIMEOUT_MS", "50"))
+# Агрегаты и архив аналитики: сырые события старше N дней уходят в архив
+ANALYTICS_ROLLUP_HOUR = int(os.getenv("ANALYTICS_ROLLUP_HOUR", "0"))
+ANALYTICS_ROLLUP_MINUTE = int(os.getenv("ANALYTICS_ROLLUP_MINUTE", "10"))
+ANALYTICS_RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", "90"))
+ANALYTICS_ARCHIVE_DIR = Path(os.getenv("ANALYTICS_ARCHIVE_DIR", BASE_DIR / "data" / "archive"))
+ANALYTICS_ARCHIVE_BATCH = int(os.getenv("ANALYTICS_ARCHIVE_BATCH", "500"))
+
+# Обработка изображений портфолио: максимальная сторона, формат и качество
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
 
 # Google Sheets
 GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH", BASE_DIR / "credentials.json")
 GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID", "")
+# Синхронизация заявок с листом: окно (с) — изменения за окно уходят одной синхронизацией,
+# заявок за один batch_update, повторов при 429/5xx и сетевых ошибках, начальная задержка повтора (с)
+SHEETS_SYNC_INTERVAL = float(os.getenv("SHEETS_SYNC_INTERVAL", "15"))
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "500"))
+SHEETS_RETRIES = int(os.getenv("SHEETS_RETRIES", "5"))
+SHEETS_BACKOFF = float(os.getenv("SHEETS_BACKOFF", "2"))
+
+# Потоковая выгрузка изменений заявок (utils/pipeline.py): файл .csv или .ndjson,
+# HTTP-вебхук (тело подписывается HMAC-SHA256 секретом), окна микропакетов (с), событий за пакет
+EXPORT_FILE_PATH = os.getenv("EXPORT_FILE_PATH", "")
+EXPORT_FILE_WINDOW = float(os.getenv("EXPORT_FILE_WINDOW", "5"))
+EXPORT_WEBHOOK_URL = os.getenv("EXPORT_WEBHOOK_URL", "")
+EXPORT_WEBHOOK_SECRET = os.getenv("EXPORT_WEBHOOK_SECRET", "")
+EXPORT_WEBHOOK_WINDOW = float(os.getenv("EXPORT_WEBHOOK_WINDOW", "5"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# Предел отставания приёмника: дальше журнал очищается без него (событий, дней; 0 — без предела)
+EXPORT_MAX_LAG_EVENTS = int(os.getenv("EXPORT_MAX_LAG_EVENTS", "100000"))
+EXPORT_MAX_LAG_DAYS = float(os.getenv("EXPORT_MAX_LAG_DAYS", "7"))
+# /admin_export: строк, читаемых из БД за раз
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
 
 # Состояния ConversationHandler
 (
@@ -1,4 +1,4 @@
 """Модуль базы данных."""
-from database.db import init_db, get_db
+from database.db import init_db, get_db, close_pool
 
-__all__ = ["init_db", "get_db"]
+__all__ = ["init_db", "get_db", "close_pool"]
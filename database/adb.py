@@ -0,0 +1,162 @@
+"""Асинхронные обёртки над database.db для обработчиков.
+
+Каждая функция выполняется в отдельном пуле потоков, поэтому медленный
+fsync или тяжёлый запрос не останавливает цикл событий бота.
+Синхронный API в database.db остаётся для скриптов.
+"""
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from config import DB_EXECUTOR_WORKERS
+from database import db, rollups
+from database.pool import add_statement_hook
+from utils.metrics import DB_ERRORS, DB_SECONDS, DB_WAIT_SECONDS
+from utils.tracing import begin_db, describe, finish, record_statement
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+# SQL функций БД — в их спаны
+add_statement_hook(record_statement)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+def _timed_call(func: Callable, name: str, timing: list, args: tuple, kwargs: dict):
+    timing.append(time.perf_counter())
+    span = begin_db(name)
+    error = ""
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        error = describe(e)
+        raise
+    finally:
+        timing.append(time.perf_counter())
+        if span is not None:
+            finish(span, error)
+
+
+async def run(func: Callable, *args, **kwargs):
+    """Выполнить синхронную функцию работы с БД в пуле потоков БД.
+
+    Ожидание потока и время функции попадают в метрики (utils/metrics.py),
+    вызов с его SQL — в трассировку апдейта (utils/tracing.py): контекст
+    вызывающей задачи переносится в поток БД.
+    """
+    loop = asyncio.get_running_loop()
+    # Отметки ставит поток БД, в метрики они пишутся здесь, в потоке цикла событий
+    timing = [time.perf_counter()]
+    name = getattr(func, "__name__", "unknown")
+    try:
+        return await loop.run_in_executor(
+            _get_executor(), contextvars.copy_context().run, _timed_call, func, name, timing, args, kwargs
+        )
+    except Exception:
+        DB_ERRORS.labels(name).inc()
+        raise
+    finally:
+        if len(timing) == 3:
+            DB_WAIT_SECONDS.observe(timing[1] - timing[0])
+            DB_SECONDS.labels(name).observe(timing[2] - timing[1])
+
+
+def shutdown_executor() -> None:
+    """Дождаться завершения запросов и остановить пул потоков (при остановке бота)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _wrap(func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+
+    return wrapper
+
+
+# --- Пользователи ---
+get_or_create_user = _wrap(db.get_or_create_user)
+update_user_phone = _wrap(db.update_user_phone)
+get_all_active_user_ids = _wrap(db.get_all_active_user_ids)
+get_user_by_telegram_id = _wrap(db.get_user_by_telegram_id)
+
+# --- Заявки ---
+count_orders_last_hour = _wrap(db.count_orders_last_hour)
+create_order = _wrap(db.create_order)
+submit_order = _wrap(db.submit_order)
+get_last_order_by_telegram_user = _wrap(db.get_last_order_by_telegram_user)
+get_order_by_id = _wrap(db.get_order_by_id)
+get_orders_new_longer_than_hours = _wrap(db.get_orders_new_longer_than_hours)
+get_orders_due_for_reminder = _wrap(db.get_orders_due_for_reminder)
+mark_orders_reminded = _wrap(db.mark_orders_reminded)
+update_order_status = _wrap(db.update_order_status)
+get_orders_changed_since = _wrap(db.get_orders_changed_since)
+
+# --- Ограничение частоты ---
+load_rate_limits = _wrap(db.load_rate_limits)
+save_rate_limits = _wrap(db.save_rate_limits)
+get_recent_order_hits = _wrap(db.get_recent_order_hits)
+
+# --- Рассылки ---
+create_broadcast_job = _wrap(db.create_broadcast_job)
+set_broadcast_status_message = _wrap(db.set_broadcast_status_message)
+get_broadcast_job = _wrap(db.get_broadcast_job)
+get_broadcast_job_ids = _wrap(db.get_broadcast_job_ids)
+set_broadcast_job_status = _wrap(db.set_broadcast_job_status)
+claim_broadcast_deliveries = _wrap(db.claim_broadcast_deliveries)
+release_broadcast_deliveries = _wrap(db.release_broadcast_deliveries)
+fail_interrupted_deliveries = _wrap(db.fail_interrupted_deliveries)
+record_broadcast_deliveries = _wrap(db.record_broadcast_deliveries)
+
+# --- Outbox уведомлений ---
+claim_due_notifications = _wrap(db.claim_due_notifications)
+mark_notification_sent = _wrap(db.mark_notification_sent)
+reschedule_notification = _wrap(db.reschedule_notification)
+dead_letter_notification = _wrap(db.dead_letter_notification)
+requeue_notifications = _wrap(db.requeue_notifications)
+get_outbox_stats = _wrap(db.get_outbox_stats)
+
+# --- Кэш медиа ---
+get_media_file_ids = _wrap(db.get_media_file_ids)
+save_media_file_ids = _wrap(db.save_media_file_ids)
+forget_media_file_ids = _wrap(db.forget_media_file_ids)
+
+# --- Состояние бота (persistence) ---
+load_persisted_user_data = _wrap(db.load_persisted_user_data)
+load_persisted_conversations = _wrap(db.load_persisted_conversations)
+save_persistence = _wrap(db.save_persistence)
+
+# --- Синхронизация с внешними системами ---
+get_sync_state = _wrap(db.get_sync_state)
+set_sync_state = _wrap(db.set_sync_state)
+get_sheet_rows = _wrap(db.get_sheet_rows)
+get_sheet_last_row = _wrap(db.get_sheet_last_row)
+save_sheet_rows = _wrap(db.save_sheet_rows)
+get_order_events = _wrap(db.get_order_events)
+get_order_events_head = _wrap(db.get_order_events_head)
+get_export_backlog = _wrap(db.get_export_backlog)
+get_order_events_floor = _wrap(db.get_order_events_floor)
+delete_export_cursors = _wrap(db.delete_export_cursors)
+prune_order_events = _wrap(db.prune_order_events)
+
+# --- Аналитика ---
+log_event = _wrap(db.log_event)
+run_analytics_maintenance = _wrap(rollups.run_analytics_maintenance)
+get_funnel = _wrap(rollups.get_funnel)
+
+# --- Админ / статистика ---
+get_stats = _wrap(db.get_stats)
+reconcile_stats_counters = _wrap(db.reconcile_stats_counters)
+get_pool_stats = _wrap(db.get_pool_stats)
+get_analytics_sink_stats = _wrap(db.get_analytics_sink_stats)
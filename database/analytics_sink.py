@@ -0,0 +1,136 @@
+"""Фоновая пакетная запись событий аналитики.
+
+События складываются в ограниченную очередь в памяти, отдельный поток
+сбрасывает их в БД одной транзакцией (executemany) каждые N мс или по
+накоплении M событий. При переполнении очереди запись ждёт не дольше
+enqueue_timeout, после чего событие отбрасывается и учитывается в счётчике.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("bot")
+
+# (event_type, user_id, order_id, payload, created_at)
+EventRow = tuple[str, Optional[int], Optional[str], str, str]
+
+
+class AnalyticsSink:
+    """Буфер событий аналитики с фоновым сбросом в БД."""
+
+    def __init__(
+        self,
+        write_rows: Callable[[list[EventRow]], None],
+        flush_interval: float = 0.5,
+        batch_size: int = 200,
+        max_queue: int = 10000,
+        enqueue_timeout: float = 0.05,
+    ) -> None:
+        self._write_rows = write_rows
+        self._flush_interval = flush_interval
+        self._batch_size = max(1, batch_size)
+        self._enqueue_timeout = enqueue_timeout
+        self._queue: "queue.Queue[EventRow]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "flushed": 0, "dropped": 0, "flushes": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Запустить фоновый поток сброса."""
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="analytics-sink", daemon=True)
+        self._thread.start()
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def put(
+        self,
+        event_type: str,
+        user_id: Optional[int] = None,
+        order_id: Optional[str] = None,
+        payload: Optional[str] = None,
+    ) -> bool:
+        """Поставить событие в очередь. False — событие отброшено (очередь полна)."""
+        created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        row = (event_type, user_id, order_id, payload or "", created_at)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Очередь полна: просим поток сбросить её немедленно и ждём место
+            self._wakeup.set()
+            try:
+                self._queue.put(row, timeout=self._enqueue_timeout)
+            except queue.Full:
+                self._count("dropped")
+                return False
+        self._count("enqueued")
+        if self._queue.qsize() >= self._batch_size:
+            self._wakeup.set()
+        return True
+
+    def _drain(self) -> list[EventRow]:
+        batch: list[EventRow] = []
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list[EventRow]) -> None:
+        try:
+            self._write_rows(batch)
+        except Exception:
+            logger.exception(f"Не удалось записать {len(batch)} событий аналитики")
+            self._count("errors")
+            self._count("dropped", len(batch))
+            return
+        self._count("flushes")
+        self._count("flushed", len(batch))
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            batch = self._drain()
+            while batch:
+                self._flush(batch)
+                # Остаток сбрасываем сразу, только если набралась полная пачка
+                if len(batch) < self._batch_size:
+                    break
+                batch = self._drain()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Остановить поток и сбросить всё, что осталось в очереди."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        deadline = time.monotonic() + timeout
+        batch = self._drain()
+        while batch and time.monotonic() < deadline:
+            self._flush(batch)
+            batch = self._drain()
+        if batch:
+            self._count("dropped", len(batch) + self._queue.qsize())
+
+    def stats(self) -> dict[str, Any]:
+        """Счётчики: поставлено в очередь, записано, отброшено, число сбросов и ошибок."""
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["queued"] = self._queue.qsize()
+        return s
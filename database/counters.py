@@ -0,0 +1,55 @@
+"""Пересчёт счётчиков статистики из исходных таблиц.
+
+В обычной работе stats_counters и stats_daily_events обновляются триггерами
+(database.models.STATS_TRIGGERS); здесь — полный пересчёт для первичного
+заполнения (миграция) и сверки (/admin_reconcile).
+"""
+import sqlite3
+
+
+def compute_counters(conn: sqlite3.Connection) -> dict[str, int]:
+    """Счётчики пользователей и заявок по статусам, посчитанные по сырым таблицам."""
+    counters = {
+        "users_total": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+        "orders_total": conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0],
+    }
+    for status, cnt in conn.execute("SELECT COALESCE(status, ''), COUNT(*) FROM orders GROUP BY 1"):
+        counters[f"orders_status:{status}"] = cnt
+    return counters
+
+
+def compute_daily_events(conn: sqlite3.Connection) -> dict[tuple[str, str], int]:
+    """Число событий по (день, тип) для дней, по которым есть сырые строки analytics."""
+    cur = conn.execute(
+        "SELECT date(created_at), event_type, COUNT(*) FROM analytics GROUP BY 1, 2"
+    )
+    return {(day, event_type): cnt for day, event_type, cnt in cur}
+
+
+def write_counters(
+    conn: sqlite3.Connection,
+    counters: dict[str, int],
+    daily: dict[tuple[str, str], int],
+) -> None:
+    """Перезаписать счётчики значениями пересчёта (без commit)."""
+    conn.execute("UPDATE stats_counters SET value = 0")
+    conn.executemany(
+        """
+        INSERT INTO stats_counters (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+        """,
+        counters.items(),
+    )
+    days = sorted({day for day, _ in daily})
+    if days:
+        # Дни, сырые события которых уже в архиве, не трогаем
+        conn.execute("DELETE FROM stats_daily_events WHERE day >= ?", (days[0],))
+    conn.executemany(
+        "INSERT INTO stats_daily_events (day, event_type, count) VALUES (?, ?, ?)",
+        [(day, event_type, cnt) for (day, event_type), cnt in daily.items()],
+    )
+
+
+def backfill(conn: sqlite3.Connection) -> None:
+    """Первичное заполнение счётчиков (шаг миграции)."""
+    write_counters(conn, compute_counters(conn), compute_daily_events(conn))
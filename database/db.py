@@ -1,56 +1,130 @@
 """Работа с SQLite базой данных."""
+import json
+import logging
 import sqlite3
-from contextlib import contextmanager
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional
 
-from config import DB_PATH
+from config import (
+    DB_PATH,
+    DB_POOL_SIZE,
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+    DB_SYNCHRONOUS,
+    ORDER_SEQ_BLOCK_SIZE,
+    ANALYTICS_FLUSH_INTERVAL_MS,
+    ANALYTICS_BATCH_SIZE,
+    ANALYTICS_QUEUE_SIZE,
+    ANALYTICS_ENQUEUE_TIMEOUT_MS,
+)
+from database.analytics_sink import AnalyticsSink, EventRow
+from database import counters
+from database.migrations import run_migrations
 from database.models import ALL_TABLES
+from database.pool import ConnectionPool, count_queries
 
+logger = logging.getLogger("bot")
 
-def init_db() -> None:
-    """Создание таблиц и директории для БД."""
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_analytics_sink: Optional[AnalyticsSink] = None
+
+
+def set_db_path(path: Path) -> Path:
+    """Переключить процесс на другой файл БД (скрипты, замеры, тесты). Возвращает прежний путь.
+
+    Открытый пул закрывается, следующий запрос откроет новый на path.
+    """
+    global DB_PATH
+    close_pool()
+    previous, DB_PATH = DB_PATH, Path(path)
+    return previous
+
+
+def init_db(path: Optional[Path] = None) -> None:
+    """Создание таблиц и директории для БД, применение миграций (path — другой файл БД, см. set_db_path)."""
+    if path is not None:
+        set_db_path(path)
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     with get_connection() as conn:
         for table_sql in ALL_TABLES:
             conn.execute(table_sql)
         conn.commit()
+        run_migrations(conn)
 
 
-@contextmanager
-def get_connection():
-    """Контекстный менеджер подключения к БД."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
+def get_pool() -> ConnectionPool:
+    """Пул подключений процесса (создаётся при первом обращении)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DB_PATH,
+                    size=DB_POOL_SIZE,
+                    busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+                    cache_size_kb=DB_CACHE_SIZE_KB,
+                    mmap_size=DB_MMAP_SIZE,
+                    synchronous=DB_SYNCHRONOUS,
+                )
+    return _pool
+
+
+def close_pool() -> None:
+    """Закрыть пул подключений (при остановке бота)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_pool_stats() -> dict[str, Any]:
+    """Статистика пула: выдачи подключений и время ожидания."""
+    return get_pool().stats()
 
 
-def get_db():
+def get_connection(readonly: bool = False):
+    """Контекстный менеджер подключения к БД.
+
+    По умолчанию выдаётся подключение-писатель (записи сериализуются),
+    при readonly=True — свободный читатель из пула.
+    """
+    return get_pool().connection(readonly=readonly)
+
+
+def get_db(readonly: bool = False):
     """Возвращает контекстный менеджер для использования в with."""
-    return get_connection()
+    return get_connection(readonly=readonly)
 
 
 # --- Пользователи ---
 
-def get_or_create_user(user_id: int, username: Optional[str], full_name: Optional[str]) -> int:
-    """Получить или создать пользователя. Возвращает id в таблице users."""
-    with get_connection() as conn:
+def _ensure_user(conn, user_id: int, username: Optional[str], full_name: Optional[str]) -> int:
+    """id пользователя в таблице users; создаёт запись без commit (внутри чужой транзакции)."""
+    row = conn.execute("SELECT id FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if row:
+        return row["id"]
+    try:
         cur = conn.execute(
-            "SELECT id FROM users WHERE user_id = ?", (user_id,)
-        )
-        row = cur.fetchone()
-        if row:
-            return row["id"]
-        conn.execute(
             "INSERT INTO users (user_id, username, full_name) VALUES (?, ?, ?)",
             (user_id, username or "", full_name or ""),
         )
+    except sqlite3.IntegrityError:
+        # Пользователя только что создал другой процесс (BOT_WORKERS, скрипт)
+        return conn.execute("SELECT id FROM users WHERE user_id = ?", (user_id,)).fetchone()["id"]
+    return cur.lastrowid
+
+
+def get_or_create_user(user_id: int, username: Optional[str], full_name: Optional[str]) -> int:
+    """Получить или создать пользователя. Возвращает id в таблице users."""
+    with get_connection() as conn:
+        user_pk = _ensure_user(conn, user_id, username, full_name)
         conn.commit()
-        return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return user_pk
 
 
 def update_user_phone(user_id: int, phone: str) -> None:
@@ -62,14 +136,14 @@ def update_user_phone(user_id: int, phone: str) -> None:
 
 def get_all_active_user_ids() -> list[int]:
     """Список Telegram user_id всех активных пользователей (для рассылки)."""
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         cur = conn.execute("SELECT user_id FROM users WHERE status = 'active'")
         return [row["user_id"] for row in cur.fetchall()]
 
 
 def get_user_by_telegram_id(telegram_user_id: int) -> Optional[dict]:
     """Получить пользователя по Telegram user_id."""
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         cur = conn.execute(
             "SELECT * FROM users WHERE user_id = ?", (telegram_user_id,)
         )
@@ -81,7 +155,7 @@ def get_user_by_telegram_id(telegram_user_id: int) -> Optional[dict]:
 
 def count_orders_last_hour(telegram_user_id: int) -> int:
     """Количество заявок пользователя за последний час."""
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         cur = conn.execute(
             """
             SELECT COUNT(*) as cnt FROM orders o
@@ -93,6 +167,64 @@ def count_orders_last_hour(telegram_user_id: int) -> int:
         return cur.fetchone()["cnt"]
 
 
+class _OrderNumberBlocks:
+    """Выданные заранее блоки номеров заявок по дням (ORDER_SEQ_BLOCK_SIZE > 1)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._blocks: dict[str, tuple[int, int]] = {}
+
+    def take(self, day: str) -> Optional[int]:
+        with self._lock:
+            nxt, last = self._blocks.get(day, (1, 0))
+            if nxt > last:
+                return None
+            self._blocks = {day: (nxt + 1, last)}
+            return nxt
+
+    def put(self, day: str, first: int, last: int) -> None:
+        with self._lock:
+            self._blocks = {day: (first, last)}
+
+
+_order_blocks = _OrderNumberBlocks()
+
+
+def _reserve_order_numbers(conn, day: str, count: int) -> int:
+    """Атомарно сдвинуть счётчик дня на count. Возвращает последний выделенный номер."""
+    conn.execute(
+        """
+        INSERT INTO order_sequences (day, last_value) VALUES (?, ?)
+        ON CONFLICT(day) DO UPDATE SET last_value = last_value + excluded.last_value
+        """,
+        (day, count),
+    )
+    return conn.execute("SELECT last_value FROM order_sequences WHERE day = ?", (day,)).fetchone()[0]
+
+
+def _next_order_id(conn) -> str:
+    """Следующий номер заявки вида #2024-0315-001 на подключении-писателе.
+
+    При ORDER_SEQ_BLOCK_SIZE = 1 номер выделяется в текущей транзакции и
+    откатывается вместе с ней. При больших блоках блок резервируется
+    отдельным коммитом, поэтому вызывать нужно до остальных записей
+    транзакции; неиспользованный остаток блока при перезапуске теряется.
+    День — по UTC, как created_at (CURRENT_TIMESTAMP).
+    """
+    now = datetime.now(timezone.utc)
+    day = now.strftime("%Y-%m-%d")
+    if ORDER_SEQ_BLOCK_SIZE <= 1:
+        number = _reserve_order_numbers(conn, day, 1)
+    else:
+        number = _order_blocks.take(day)
+        if number is None:
+            last = _reserve_order_numbers(conn, day, ORDER_SEQ_BLOCK_SIZE)
+            conn.commit()
+            number = last - ORDER_SEQ_BLOCK_SIZE + 1
+            _order_blocks.put(day, number + 1, last)
+    return f"#{now.strftime('%Y-%m%d')}-{number:03d}"
+
+
 def create_order(
     telegram_user_id: int,
     business_type: str,
@@ -103,15 +235,10 @@ def create_order(
     contact_preference: str,
     phone: str,
 ) -> str:
-    """Создать заявку. Возвращает order_id (например #2024-001)."""
-    user_pk = get_or_create_user(telegram_user_id, None, None)
-    with get_connection() as conn:
-        cur = conn.execute(
-            "SELECT COUNT(*) as cnt FROM orders WHERE date(created_at) = date('now')"
-        )
-        daily_count = cur.fetchone()["cnt"]
-    order_id = f"#{datetime.now().strftime('%Y')}-{daily_count + 1:03d}"
+    """Создать заявку. Возвращает order_id (например #2024-0315-001)."""
     with get_connection() as conn:
+        order_id = _next_order_id(conn)
+        user_pk = _ensure_user(conn, telegram_user_id, None, None)
         conn.execute(
             """
             INSERT INTO orders (
@@ -125,9 +252,66 @@ def create_order(
         return order_id
 
 
+def submit_order(
+    telegram_user_id: int,
+    username: Optional[str],
+    full_name: Optional[str],
+    phone: str,
+    business_type: str,
+    goal: str,
+    budget: str,
+    timeline: str = "",
+    materials: str = "",
+    contact_preference: str = "phone",
+    notifications: Optional[Callable[[str], list[tuple[int, str]]]] = None,
+) -> str:
+    """Оформить заявку одной транзакцией. Возвращает order_id.
+
+    Создаёт/обновляет пользователя вместе с телефоном, выделяет номер,
+    добавляет заявку, событие order_created и уведомления в outbox —
+    всё или ничего. notifications(order_id) возвращает [(chat_id, текст)].
+    Число выражений видно в count_queries() вокруг вызова: BEGIN, номер (2),
+    пользователь (2), заявка, событие, по одному на уведомление, COMMIT.
+    """
+    with count_queries() as queries, get_connection() as conn:
+        order_id = _next_order_id(conn)
+        conn.execute(
+            """
+            INSERT INTO users (user_id, username, full_name, phone) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                username = COALESCE(NULLIF(excluded.username, ''), users.username),
+                full_name = COALESCE(NULLIF(excluded.full_name, ''), users.full_name),
+                phone = excluded.phone
+            """,
+            (telegram_user_id, username or "", full_name or "", phone),
+        )
+        user_pk = conn.execute("SELECT id FROM users WHERE user_id = ?", (telegram_user_id,)).fetchone()["id"]
+        conn.execute(
+            """
+            INSERT INTO orders (
+                order_id, user_id, business_type, goal, budget, timeline,
+                materials, contact_preference, phone, status
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'new')
+            """,
+            (order_id, user_pk, business_type, goal, budget, timeline, materials, contact_preference, phone),
+        )
+        conn.execute(
+            "INSERT INTO analytics (event_type, user_id, order_id, payload) VALUES ('order_created', ?, ?, '')",
+            (telegram_user_id, order_id),
+        )
+        if notifications is not None:
+            conn.executemany(
+                "INSERT INTO notification_outbox (order_id, chat_id, text) VALUES (?, ?, ?)",
+                [(order_id, chat_id, text) for chat_id, text in notifications(order_id)],
+            )
+        conn.commit()
+    logger.debug(f"submit_order {order_id}: {queries.executed} SQL-выражений")
+    return order_id
+
+
 def get_last_order_by_telegram_user(telegram_user_id: int) -> Optional[dict]:
     """Последняя заявка пользователя по Telegram user_id."""
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         cur = conn.execute(
             """
             SELECT o.order_id, o.status, o.created_at
@@ -143,8 +327,8 @@ def get_last_order_by_telegram_user(telegram_user_id: int) -> Optional[dict]:
 
 
 def get_order_by_id(order_id: str) -> Optional[dict]:
-    """Получить заявку по order_id (например #2024-001)."""
-    with get_connection() as conn:
+    """Получить заявку по order_id (например #2024-0315-001)."""
+    with get_connection(readonly=True) as conn:
         cur = conn.execute(
             """
             SELECT o.*, u.user_id as telegram_user_id, u.username, u.full_name, u.phone as user_phone
@@ -160,7 +344,7 @@ def get_order_by_id(order_id: str) -> Optional[dict]:
 
 def get_orders_new_longer_than_hours(hours: float) -> list[dict]:
     """Заявки в статусе 'new' старше N часов (для напоминаний)."""
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         cur = conn.execute(
             """
             SELECT o.*, u.user_id as telegram_user_id, u.full_name
@@ -173,6 +357,56 @@ def get_orders_new_longer_than_hours(hours: float) -> list[dict]:
         return [dict(r) for r in cur.fetchall()]
 
 
+def get_orders_due_for_reminder(first_after_hours: float, escalation_hours: list[float]) -> list[dict]:
+    """Заявки 'new', по которым пора напомнить.
+
+    Первое напоминание — через first_after_hours после создания, следующие —
+    через escalation_hours[reminder_count - 1] после предыдущего (последний
+    интервал повторяется).
+    """
+    intervals = escalation_hours or [first_after_hours]
+    cases = " ".join(
+        "WHEN ? THEN datetime(o.last_reminded_at, ?)" for _ in intervals[:-1]
+    )
+    params: list[Any] = [f"-{first_after_hours} hours", f"+{first_after_hours} hours"]
+    for i, hours in enumerate(intervals[:-1], start=1):
+        params += [i, f"+{hours} hours"]
+    params.append(f"+{intervals[-1]} hours")
+    with get_connection(readonly=True) as conn:
+        cur = conn.execute(
+            f"""
+            SELECT o.order_id, o.created_at, o.reminder_count, u.user_id as telegram_user_id, u.full_name,
+                   (julianday('now') - julianday(o.created_at)) * 24 AS age_hours
+            FROM orders o
+            JOIN users u ON o.user_id = u.id
+            WHERE o.status = 'new' AND o.created_at <= datetime('now', ?)
+              AND CASE o.reminder_count
+                    WHEN 0 THEN datetime(o.created_at, ?)
+                    {cases}
+                    ELSE datetime(o.last_reminded_at, ?)
+                  END <= datetime('now')
+            ORDER BY o.created_at
+            """,
+            params,
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+
+def mark_orders_reminded(order_ids: list[str]) -> None:
+    """Отметить отправленное напоминание по заявкам."""
+    if not order_ids:
+        return
+    with get_connection() as conn:
+        conn.executemany(
+            """
+            UPDATE orders SET last_reminded_at = CURRENT_TIMESTAMP, reminder_count = reminder_count + 1
+            WHERE order_id = ?
+            """,
+            [(order_id,) for order_id in order_ids],
+        )
+        conn.commit()
+
+
 def update_order_status(order_id: str, status: str, manager_id: Optional[int] = None, notes: Optional[str] = None) -> None:
     """Обновить статус заявки."""
     with get_connection() as conn:
@@ -196,35 +430,590 @@ def update_order_status(order_id: str, status: str, manager_id: Optional[int] =
         conn.commit()
 
 
-def get_orders_for_export(since: Optional[datetime] = None) -> list[dict]:
-    """Заявки для экспорта (например за день). Если since не указан — все новые за сегодня."""
+def iter_orders_for_export(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    statuses: Optional[list[str]] = None,
+    chunk_size: int = 1000,
+) -> Iterator[list[tuple]]:
+    """Заявки для экспорта пачками по chunk_size, по порядку created_at.
+
+    Строка — (created_at, order_id, full_name, phone, status); date_from
+    включительно, date_to не включительно ('ГГГГ-ММ-ДД'). Строки читаются
+    с курсора по мере перебора, подключение занято до его конца —
+    перебирать в одном потоке и до конца (или закрыть генератор).
+    """
+    where, params = [], []
+    if date_from is not None:
+        where.append("o.created_at >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        where.append("o.created_at < ?")
+        params.append(date_to)
+    if statuses:
+        where.append(f"o.status IN ({','.join('?' * len(statuses))})")
+        params.extend(statuses)
+    sql = f"""
+        SELECT o.created_at, o.order_id, u.full_name, o.phone, o.status
+        FROM orders o JOIN users u ON o.user_id = u.id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY o.created_at, o.id
+    """
+    with get_connection(readonly=True) as conn:
+        cur = conn.cursor()
+        # Кортежи вместо sqlite3.Row: меньше памяти и сразу годятся для csv.writer
+        cur.row_factory = None
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+
+def get_orders_changed_since(
+    since: Optional[str],
+    after: Optional[tuple[str, int]] = None,
+    limit: int = 500,
+) -> list[dict]:
+    """Заявки, изменённые не раньше since (orders.updated_at), по порядку (updated_at, id).
+
+    after — (updated_at, id) последней строки предыдущей страницы.
+    """
+    where, params = [], []
+    if since is not None:
+        where.append("o.updated_at >= ?")
+        params.append(since)
+    if after is not None:
+        where.append("(o.updated_at, o.id) > (?, ?)")
+        params.extend(after)
+    with get_connection(readonly=True) as conn:
+        cur = conn.execute(
+            f"""
+            SELECT o.id, o.order_id, o.created_at, o.updated_at, o.status, o.phone, u.full_name
+            FROM orders o JOIN users u ON o.user_id = u.id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY o.updated_at, o.id
+            LIMIT ?
+            """,
+            (*params, limit),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+
+# --- Ограничение частоты ---
+
+def load_rate_limits() -> list[tuple[str, int, list[float]]]:
+    """Сохранённые попадания ограничителя: (область, ключ, unix-время попаданий)."""
+    with get_connection(readonly=True) as conn:
+        return [(r["scope"], r["key"], json.loads(r["hits"])) for r in conn.execute("SELECT scope, key, hits FROM rate_limits")]
+
+
+def save_rate_limits(rows: list[tuple[str, int, list[float]]]) -> None:
+    """Сохранить изменившиеся ключи ограничителя одной транзакцией (пустые — удалить)."""
+    if not rows:
+        return
     with get_connection() as conn:
-        if since:
-            cur = conn.execute(
-                """
-                SELECT o.order_id, o.created_at, o.status, o.phone, u.full_name
-                FROM orders o JOIN users u ON o.user_id = u.id
-                WHERE o.created_at >= ?
-                ORDER BY o.created_at
-                """,
-                (since.isoformat(),),
+        conn.executemany(
+            "DELETE FROM rate_limits WHERE scope = ? AND key = ?",
+            [(scope, key) for scope, key, hits in rows if not hits],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO rate_limits (scope, key, hits) VALUES (?, ?, ?)",
+            [(scope, key, json.dumps(hits)) for scope, key, hits in rows if hits],
+        )
+        conn.commit()
+
+
+def get_recent_order_hits(seconds: float) -> list[tuple[str, int, list[float]]]:
+    """Заявки пользователей за последние seconds секунд в формате ограничителя (область orders)."""
+    with get_connection(readonly=True) as conn:
+        cur = conn.execute(
+            """
+            SELECT u.user_id, CAST(strftime('%s', o.created_at) AS REAL) AS ts
+            FROM orders o JOIN users u ON o.user_id = u.id
+            WHERE o.created_at >= datetime('now', ?)
+            """,
+            (f"-{int(seconds)} seconds",),
+        )
+        hits: dict[int, list[float]] = {}
+        for row in cur:
+            hits.setdefault(row["user_id"], []).append(row["ts"])
+        return [("orders", uid, ts) for uid, ts in hits.items()]
+
+
+# --- Рассылки ---
+
+def create_broadcast_job(text: str, created_by: Optional[int]) -> tuple[int, int]:
+    """Создать рассылку по всем активным пользователям. Возвращает (id, число получателей)."""
+    with get_connection() as conn:
+        cur = conn.execute(
+            "INSERT INTO broadcast_jobs (text, status, created_by) VALUES (?, 'running', ?)",
+            (text, created_by),
+        )
+        job_id = cur.lastrowid
+        total = conn.execute(
+            """
+            INSERT INTO broadcast_deliveries (job_id, user_id)
+            SELECT ?, user_id FROM users WHERE status = 'active'
+            """,
+            (job_id,),
+        ).rowcount
+        conn.execute("UPDATE broadcast_jobs SET total = ? WHERE id = ?", (total, job_id))
+        conn.commit()
+        return job_id, total
+
+
+def set_broadcast_status_message(job_id: int, chat_id: int, message_id: int) -> None:
+    """Запомнить сообщение, в котором показывается прогресс рассылки."""
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE broadcast_jobs SET status_chat_id = ?, status_message_id = ? WHERE id = ?",
+            (chat_id, message_id, job_id),
+        )
+        conn.commit()
+
+
+def get_broadcast_job(job_id: int) -> Optional[dict]:
+    """Рассылка с количеством получателей по статусам доставки."""
+    with get_connection(readonly=True) as conn:
+        row = conn.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job["counts"] = {
+            r["status"]: r["c"]
+            for r in conn.execute(
+                "SELECT status, COUNT(*) as c FROM broadcast_deliveries WHERE job_id = ? GROUP BY status",
+                (job_id,),
             )
-        else:
-            cur = conn.execute(
+        }
+        return job
+
+
+def get_broadcast_job_ids(status: str) -> list[int]:
+    """id рассылок в указанном статусе (например running — для возобновления)."""
+    with get_connection(readonly=True) as conn:
+        return [r["id"] for r in conn.execute("SELECT id FROM broadcast_jobs WHERE status = ? ORDER BY id", (status,))]
+
+
+def set_broadcast_job_status(job_id: int, status: str, from_statuses: tuple[str, ...]) -> bool:
+    """Сменить статус рассылки, если текущий входит в from_statuses."""
+    placeholders = ", ".join("?" for _ in from_statuses)
+    with get_connection() as conn:
+        cur = conn.execute(
+            f"""
+            UPDATE broadcast_jobs SET status = ?,
+                finished_at = CASE WHEN ? IN ('done', 'cancelled') THEN CURRENT_TIMESTAMP ELSE finished_at END
+            WHERE id = ? AND status IN ({placeholders})
+            """,
+            (status, status, job_id, *from_statuses),
+        )
+        conn.commit()
+        return cur.rowcount > 0
+
+
+def claim_broadcast_deliveries(job_id: int, limit: int) -> list[int]:
+    """Взять следующую пачку получателей: pending → sending.
+
+    Если процесс упадёт во время отправки, такие строки не будут отправлены
+    повторно (см. fail_interrupted_deliveries) — лучше недослать, чем задвоить.
+    """
+    with get_connection() as conn:
+        user_ids = [
+            r["user_id"]
+            for r in conn.execute(
+                "SELECT user_id FROM broadcast_deliveries WHERE job_id = ? AND status = 'pending' LIMIT ?",
+                (job_id, limit),
+            )
+        ]
+        conn.executemany(
+            "UPDATE broadcast_deliveries SET status = 'sending', updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND user_id = ?",
+            [(job_id, uid) for uid in user_ids],
+        )
+        conn.commit()
+        return user_ids
+
+
+def release_broadcast_deliveries(job_id: int) -> None:
+    """Вернуть невзятые в работу строки sending → pending (пауза или отмена)."""
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE broadcast_deliveries SET status = 'pending' WHERE job_id = ? AND status = 'sending'",
+            (job_id,),
+        )
+        conn.commit()
+
+
+def fail_interrupted_deliveries(job_id: int) -> int:
+    """Отправки, прерванные падением процесса (sending), пометить failed."""
+    with get_connection() as conn:
+        cur = conn.execute(
+            """
+            UPDATE broadcast_deliveries SET status = 'failed', error = 'interrupted', updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND status = 'sending'
+            """,
+            (job_id,),
+        )
+        conn.commit()
+        return cur.rowcount
+
+
+def record_broadcast_deliveries(job_id: int, results: list[tuple[int, str, str]]) -> None:
+    """Записать результаты отправки пачкой; заблокировавших бота — в users.status = 'blocked'."""
+    if not results:
+        return
+    with get_connection() as conn:
+        conn.executemany(
+            """
+            UPDATE broadcast_deliveries SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND user_id = ?
+            """,
+            [(status, error or None, job_id, uid) for uid, status, error in results],
+        )
+        conn.executemany(
+            "UPDATE users SET status = 'blocked' WHERE user_id = ? AND status = 'active'",
+            [(uid,) for uid, status, _ in results if status == "blocked"],
+        )
+        conn.commit()
+
+
+# --- Outbox уведомлений ---
+
+def claim_due_notifications(limit: int) -> list[dict]:
+    """Взять уведомления, срок отправки которых наступил: pending → sending."""
+    with get_connection() as conn:
+        rows = [
+            dict(r)
+            for r in conn.execute(
                 """
-                SELECT o.order_id, o.created_at, o.status, o.phone, u.full_name
-                FROM orders o JOIN users u ON o.user_id = u.id
-                WHERE date(o.created_at) = date('now')
-                ORDER BY o.created_at
+                SELECT id, order_id, chat_id, text, attempts FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY id LIMIT ?
                 """,
+                (limit,),
+            )
+        ]
+        conn.executemany(
+            "UPDATE notification_outbox SET status = 'sending' WHERE id = ?",
+            [(r["id"],) for r in rows],
+        )
+        conn.commit()
+        return rows
+
+
+def mark_notification_sent(notification_id: int) -> None:
+    """Уведомление доставлено."""
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE notification_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, attempts = attempts + 1 WHERE id = ?",
+            (notification_id,),
+        )
+        conn.commit()
+
+
+def reschedule_notification(notification_id: int, delay_seconds: float, error: str, count_attempt: bool = True) -> None:
+    """Вернуть уведомление в очередь с задержкой (повтор после ошибки)."""
+    with get_connection() as conn:
+        conn.execute(
+            """
+            UPDATE notification_outbox SET status = 'pending', last_error = ?,
+                attempts = attempts + ?, next_attempt_at = datetime('now', ?)
+            WHERE id = ?
+            """,
+            (error, 1 if count_attempt else 0, f"+{int(delay_seconds)} seconds", notification_id),
+        )
+        conn.commit()
+
+
+def dead_letter_notification(notification_id: int, error: str) -> None:
+    """Перенести уведомление в «мёртвые» — повторов больше не будет."""
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE notification_outbox SET status = 'dead', last_error = ?, attempts = attempts + 1 WHERE id = ?",
+            (error, notification_id),
+        )
+        conn.commit()
+
+
+def requeue_notifications(statuses: tuple[str, ...] = ("dead",)) -> int:
+    """Вернуть уведомления в очередь (мёртвые — по команде админа, sending — после сбоя)."""
+    placeholders = ", ".join("?" for _ in statuses)
+    with get_connection() as conn:
+        cur = conn.execute(
+            f"""
+            UPDATE notification_outbox SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP
+            WHERE status IN ({placeholders})
+            """,
+            statuses,
+        )
+        conn.commit()
+        return cur.rowcount
+
+
+def get_outbox_stats() -> dict[str, int]:
+    """Количество уведомлений в outbox по статусам (кроме доставленных)."""
+    with get_connection(readonly=True) as conn:
+        return {
+            r["status"]: r["c"]
+            for r in conn.execute(
+                "SELECT status, COUNT(*) as c FROM notification_outbox WHERE status IN ('pending', 'sending', 'dead') GROUP BY status"
+            )
+        }
+
+
+# --- Кэш медиа ---
+
+def get_media_file_ids(paths: list[str]) -> dict[str, tuple[int, int, str]]:
+    """Сохранённые file_id для путей: {путь: (размер, mtime_ns, file_id)}."""
+    if not paths:
+        return {}
+    with get_connection(readonly=True) as conn:
+        placeholders = ",".join("?" * len(paths))
+        return {
+            r["path"]: (r["size"], r["mtime_ns"], r["file_id"])
+            for r in conn.execute(
+                f"SELECT path, size, mtime_ns, file_id FROM media_cache WHERE path IN ({placeholders})",
+                list(paths),
             )
+        }
+
+
+def save_media_file_ids(rows: list[tuple[str, int, int, str]]) -> None:
+    """Запомнить file_id загруженных файлов: (путь, размер, mtime_ns, file_id)."""
+    if not rows:
+        return
+    with get_connection() as conn:
+        conn.executemany(
+            """
+            INSERT INTO media_cache (path, size, mtime_ns, file_id) VALUES (?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                file_id = excluded.file_id,
+                created_at = CURRENT_TIMESTAMP
+            """,
+            rows,
+        )
+        conn.commit()
+
+
+def forget_media_file_ids(paths: list[str]) -> None:
+    """Удалить file_id (Telegram их больше не принимает)."""
+    with get_connection() as conn:
+        conn.executemany("DELETE FROM media_cache WHERE path = ?", [(p,) for p in paths])
+        conn.commit()
+
+
+# --- Состояние бота (persistence) ---
+
+def load_persisted_user_data(user_id: int) -> Optional[str]:
+    """Сохранённый user_data пользователя (JSON) или None."""
+    with get_connection(readonly=True) as conn:
+        row = conn.execute("SELECT data FROM persistence_user_data WHERE user_id = ?", (user_id,)).fetchone()
+        return row["data"] if row else None
+
+
+def load_persisted_conversations(name: str) -> list[tuple[str, str]]:
+    """Состояния разговоров ConversationHandler: (ключ JSON, состояние JSON)."""
+    with get_connection(readonly=True) as conn:
+        return [
+            (r["key"], r["state"])
+            for r in conn.execute("SELECT key, state FROM persistence_conversations WHERE name = ?", (name,))
+        ]
+
+
+def save_persistence(
+    user_rows: list[tuple[int, Optional[str]]],
+    conversation_rows: list[tuple[str, str, Optional[str]]],
+) -> None:
+    """Записать изменённые ключи одной транзакцией; None — удалить запись."""
+    if not user_rows and not conversation_rows:
+        return
+    with get_connection() as conn:
+        conn.executemany(
+            "DELETE FROM persistence_user_data WHERE user_id = ?",
+            [(user_id,) for user_id, data in user_rows if data is None],
+        )
+        conn.executemany(
+            """
+            INSERT INTO persistence_user_data (user_id, data) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+            """,
+            [(user_id, data) for user_id, data in user_rows if data is not None],
+        )
+        conn.executemany(
+            "DELETE FROM persistence_conversations WHERE name = ? AND key = ?",
+            [(name, key) for name, key, state in conversation_rows if state is None],
+        )
+        conn.executemany(
+            """
+            INSERT INTO persistence_conversations (name, key, state) VALUES (?, ?, ?)
+            ON CONFLICT(name, key) DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+            """,
+            [row for row in conversation_rows if row[2] is not None],
+        )
+        conn.commit()
+
+
+# --- Синхронизация с внешними системами ---
+
+def get_sync_state(name: str) -> Optional[str]:
+    """Сохранённая отметка синхронизации (например high-water mark) или None."""
+    with get_connection(readonly=True) as conn:
+        row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row["value"] if row else None
+
+
+def _set_sync_state(conn, name: str, value: str) -> None:
+    conn.execute(
+        """
+        INSERT INTO sync_state (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+        """,
+        (name, value),
+    )
+
+
+def set_sync_state(name: str, value: str) -> None:
+    """Сохранить отметку синхронизации."""
+    with get_connection() as conn:
+        _set_sync_state(conn, name, value)
+        conn.commit()
+
+
+def get_sheet_rows(sheet_id: str, order_ids: list[str]) -> dict[str, tuple[int, str]]:
+    """Строки листа для заявок: order_id → (номер строки, хеш выгруженных значений)."""
+    if not order_ids:
+        return {}
+    with get_connection(readonly=True) as conn:
+        placeholders = ",".join("?" * len(order_ids))
+        cur = conn.execute(
+            f"SELECT order_id, row_number, row_hash FROM sheets_rows WHERE sheet_id = ? AND order_id IN ({placeholders})",
+            (sheet_id, *order_ids),
+        )
+        return {r["order_id"]: (r["row_number"], r["row_hash"]) for r in cur.fetchall()}
+
+
+def get_sheet_last_row(sheet_id: str) -> Optional[int]:
+    """Номер последней занятой заявками строки листа (None — лист ещё не выгружался)."""
+    with get_connection(readonly=True) as conn:
+        row = conn.execute("SELECT MAX(row_number) AS last FROM sheets_rows WHERE sheet_id = ?", (sheet_id,)).fetchone()
+        return row["last"]
+
+
+def save_sheet_rows(
+    sheet_id: str,
+    rows: list[tuple[str, int, str]],
+    state: Optional[tuple[str, str]] = None,
+) -> None:
+    """Записать строки листа (order_id, номер, хеш) и, если задана, отметку (имя, значение) одной транзакцией."""
+    with get_connection() as conn:
+        conn.executemany(
+            """
+            INSERT INTO sheets_rows (sheet_id, order_id, row_number, row_hash) VALUES (?, ?, ?, ?)
+            ON CONFLICT(sheet_id, order_id) DO UPDATE SET
+                row_number = excluded.row_number, row_hash = excluded.row_hash, synced_at = CURRENT_TIMESTAMP
+            """,
+            [(sheet_id, *row) for row in rows],
+        )
+        if state is not None:
+            _set_sync_state(conn, *state)
+        conn.commit()
+
+
+def get_order_events(after_id: int, limit: int = 500) -> list[dict]:
+    """События заявок после курсора after_id с текущими данными заявки (по возрастанию id)."""
+    with get_connection(readonly=True) as conn:
+        cur = conn.execute(
+            """
+            SELECT e.id, e.event, e.created_at AS event_at, e.order_id,
+                   o.status, o.created_at, o.updated_at, o.business_type, o.goal, o.budget,
+                   o.timeline, o.materials, o.contact_preference, o.phone, o.manager_id, o.notes,
+                   u.user_id, u.username, u.full_name
+            FROM order_events e
+            LEFT JOIN orders o ON o.order_id = e.order_id
+            LEFT JOIN users u ON u.id = o.user_id
+            WHERE e.id > ?
+            ORDER BY e.id
+            LIMIT ?
+            """,
+            (after_id, limit),
+        )
         return [dict(r) for r in cur.fetchall()]
 
 
+def get_order_events_head() -> int:
+    """id последнего события заявок (0 — журнал пуст)."""
+    with get_connection(readonly=True) as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM order_events").fetchone()[0]
+
+
+def get_export_backlog(name: Optional[str] = None) -> list[dict]:
+    """Отставание приёмников выгрузки (всех или одного): курсор, непрочитанных событий, возраст самого старого (с)."""
+    pattern = f"export:{name}" if name else "export:%"
+    with get_connection(readonly=True) as conn:
+        result = []
+        for row in conn.execute("SELECT name, value FROM sync_state WHERE name LIKE ? ORDER BY name", (pattern,)).fetchall():
+            cursor = int(row["value"])
+            pending, lag = conn.execute(
+                "SELECT COUNT(*), COALESCE((julianday('now') - julianday(MIN(created_at))) * 86400, 0) "
+                "FROM order_events WHERE id > ?",
+                (cursor,),
+            ).fetchone()
+            result.append({"name": row["name"][len("export:"):], "cursor": cursor, "pending": pending, "lag": max(0.0, lag)})
+        return result
+
+
+def get_order_events_floor(max_events: int, max_age_days: float) -> int:
+    """id, до которого события удаляются независимо от курсоров: дальше max_events от
+    последнего или старше max_age_days дней (0 — предел не действует)."""
+    with get_connection(readonly=True) as conn:
+        floor = 0
+        if max_events > 0:
+            head = conn.execute("SELECT COALESCE(MAX(id), 0) FROM order_events").fetchone()[0]
+            floor = max(0, head - max_events)
+        if max_age_days > 0:
+            row = conn.execute(
+                "SELECT id FROM order_events WHERE created_at < datetime('now', ?) ORDER BY id DESC LIMIT 1",
+                (f"-{max_age_days} days",),
+            ).fetchone()
+            if row:
+                floor = max(floor, row["id"])
+        return floor
+
+
+def delete_export_cursors(keep: list[str]) -> list[str]:
+    """Удалить курсоры приёмников выгрузки, кроме keep (имена без export:). Возвращает удалённые имена."""
+    with get_connection() as conn:
+        names = [
+            row["name"][len("export:"):]
+            for row in conn.execute("SELECT name FROM sync_state WHERE name LIKE 'export:%'").fetchall()
+        ]
+        stale = [name for name in names if name not in keep]
+        conn.executemany("DELETE FROM sync_state WHERE name = ?", [(f"export:{name}",) for name in stale])
+        conn.commit()
+        return stale
+
+
+def prune_order_events(up_to_id: int) -> int:
+    """Удалить события с id <= up_to_id (прочитанные всеми приёмниками). Возвращает число удалённых."""
+    with get_connection() as conn:
+        deleted = conn.execute("DELETE FROM order_events WHERE id <= ?", (up_to_id,)).rowcount
+        conn.commit()
+        return deleted
+
 # --- Аналитика ---
 
 def log_event(event_type: str, user_id: Optional[int] = None, order_id: Optional[str] = None, payload: Optional[str] = None) -> None:
-    """Записать событие для аналитики."""
+    """Записать событие для аналитики.
+
+    Если запущен фоновый буфер (start_analytics_sink), событие только ставится
+    в очередь; иначе (скрипты) пишется сразу.
+    """
+    if _analytics_sink is not None and _analytics_sink.running:
+        _analytics_sink.put(event_type, user_id=user_id, order_id=order_id, payload=payload)
+        return
     with get_connection() as conn:
         conn.execute(
             "INSERT INTO analytics (event_type, user_id, order_id, payload) VALUES (?, ?, ?, ?)",
@@ -233,18 +1022,95 @@ def log_event(event_type: str, user_id: Optional[int] = None, order_id: Optional
         conn.commit()
 
 
+def _write_events(rows: list[EventRow]) -> None:
+    """Записать пачку событий одной транзакцией."""
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO analytics (event_type, user_id, order_id, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+
+
+def start_analytics_sink() -> None:
+    """Запустить фоновую пакетную запись аналитики."""
+    global _analytics_sink
+    if _analytics_sink is None:
+        _analytics_sink = AnalyticsSink(
+            _write_events,
+            flush_interval=ANALYTICS_FLUSH_INTERVAL_MS / 1000,
+            batch_size=ANALYTICS_BATCH_SIZE,
+            max_queue=ANALYTICS_QUEUE_SIZE,
+            enqueue_timeout=ANALYTICS_ENQUEUE_TIMEOUT_MS / 1000,
+        )
+    _analytics_sink.start()
+
+
+def stop_analytics_sink() -> None:
+    """Остановить буфер аналитики, дописав накопленные события."""
+    if _analytics_sink is not None:
+        _analytics_sink.stop()
+        stats = _analytics_sink.stats()
+        logger.info(f"Аналитика: записано {stats['flushed']}, отброшено {stats['dropped']}")
+
+
+def get_analytics_sink_stats() -> dict[str, Any]:
+    """Счётчики буфера аналитики (пусто, если буфер не запускался)."""
+    return _analytics_sink.stats() if _analytics_sink is not None else {}
+
+
 # --- Админ / статистика ---
 
 def get_stats() -> dict[str, Any]:
-    """Базовая статистика для админки."""
-    with get_connection() as conn:
-        users = conn.execute("SELECT COUNT(*) as c FROM users").fetchone()["c"]
-        orders = conn.execute("SELECT COUNT(*) as c FROM orders").fetchone()["c"]
-        new_orders = conn.execute("SELECT COUNT(*) as c FROM orders WHERE status = 'new'").fetchone()["c"]
-        today_start = conn.execute("SELECT COUNT(*) as c FROM analytics WHERE event_type = 'start' AND date(created_at) = date('now')").fetchone()["c"]
+    """Базовая статистика для админки (из счётчиков, без сканирования таблиц)."""
+    with get_connection(readonly=True) as conn:
+        values = {
+            row["name"]: row["value"]
+            for row in conn.execute(
+                "SELECT name, value FROM stats_counters WHERE name IN ('users_total', 'orders_total', 'orders_status:new')"
+            )
+        }
+        row = conn.execute(
+            "SELECT count FROM stats_daily_events WHERE day = date('now') AND event_type = 'start'"
+        ).fetchone()
         return {
-            "users_total": users,
-            "orders_total": orders,
-            "orders_new": new_orders,
-            "starts_today": today_start,
+            "users_total": values.get("users_total", 0),
+            "orders_total": values.get("orders_total", 0),
+            "orders_new": values.get("orders_status:new", 0),
+            "starts_today": row["count"] if row else 0,
         }
+
+
+def reconcile_stats_counters(fix: bool = False) -> dict[str, tuple[int, int]]:
+    """Пересчитать счётчики по сырым таблицам и вернуть расхождения.
+
+    Результат: {имя: (в счётчике, фактически)}; для событий имя вида
+    "events:2024-03-15:start". При fix=True счётчики перезаписываются
+    фактическими значениями в той же транзакции.
+    """
+    with get_connection(readonly=not fix) as conn:
+        # Одна транзакция — согласованный снимок счётчиков и сырых данных
+        conn.execute("BEGIN IMMEDIATE" if fix else "BEGIN")
+        actual = counters.compute_counters(conn)
+        stored = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM stats_counters")}
+        daily = counters.compute_daily_events(conn)
+        first_day = min((day for day, _ in daily), default=None)
+        stored_daily = {
+            (row["day"], row["event_type"]): row["count"]
+            for row in conn.execute("SELECT day, event_type, count FROM stats_daily_events WHERE day >= ?", (first_day,))
+        } if first_day else {}
+
+        drift: dict[str, tuple[int, int]] = {}
+        for name in set(actual) | set(stored):
+            if stored.get(name, 0) != actual.get(name, 0):
+                drift[name] = (stored.get(name, 0), actual.get(name, 0))
+        for key in set(daily) | set(stored_daily):
+            if stored_daily.get(key, 0) != daily.get(key, 0):
+                drift[f"events:{key[0]}:{key[1]}"] = (stored_daily.get(key, 0), daily.get(key, 0))
+
+        if fix and drift:
+            counters.write_counters(conn, actual, daily)
+        conn.commit()
+    if drift:
+        logger.warning(f"Расхождение счётчиков статистики: {drift}")
+    return drift
@@ -0,0 +1,184 @@
+"""Версионные миграции схемы БД.
+
+Базовые таблицы создаются из database.models (CREATE TABLE IF NOT EXISTS),
+всё, что меняется позже, — упорядоченными шагами ниже. Номер применённой
+версии хранится в таблице schema_version, каждый шаг идёт в своей транзакции
+и написан идемпотентно (IF NOT EXISTS), чтобы повторный запуск был безопасен.
+"""
+import logging
+import sqlite3
+from typing import Callable, Union
+
+from database import counters
+from database.models import (
+    ANALYTICS_DAILY_TABLE,
+    BROADCAST_DELIVERIES_TABLE,
+    BROADCAST_JOBS_TABLE,
+    MEDIA_CACHE_TABLE,
+    NOTIFICATION_OUTBOX_TABLE,
+    ORDER_EVENTS_TABLE,
+    ORDER_EVENTS_TRIGGERS,
+    ORDER_SEQUENCES_TABLE,
+    ORDERS_UPDATED_TRIGGERS,
+    PERSISTENCE_CONVERSATIONS_TABLE,
+    PERSISTENCE_USER_DATA_TABLE,
+    RATE_LIMITS_TABLE,
+    SHEETS_ROWS_TABLE,
+    STATS_COUNTERS_TABLE,
+    STATS_DAILY_EVENTS_TABLE,
+    STATS_TRIGGERS,
+    SYNC_STATE_TABLE,
+)
+
+logger = logging.getLogger("bot")
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def add_column(table: str, column: str, declaration: str) -> Step:
+    """Шаг миграции ALTER TABLE ADD COLUMN, пропускаемый, если колонка уже есть."""
+
+    def step(conn: sqlite3.Connection) -> None:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    return step
+
+
+# (версия, описание, шаги: SQL или функция от подключения)
+MIGRATIONS: list[tuple[int, str, list[Step]]] = [
+    (
+        1,
+        "Индексы для горячих запросов по заявкам и аналитике",
+        [
+            # count_orders_last_hour, get_last_order_by_telegram_user
+            "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at)",
+            # get_orders_new_longer_than_hours, счётчик новых заявок
+            "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at)",
+            # iter_orders_for_export
+            "CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)",
+            # запуски /start за день в get_stats
+            "CREATE INDEX IF NOT EXISTS idx_analytics_event_created ON analytics(event_type, created_at)",
+        ],
+    ),
+    (
+        2,
+        "Таблица последовательностей номеров заявок",
+        [ORDER_SEQUENCES_TABLE],
+    ),
+    (
+        3,
+        "Счётчики статистики на триггерах",
+        [STATS_COUNTERS_TABLE, STATS_DAILY_EVENTS_TABLE, *STATS_TRIGGERS, counters.backfill],
+    ),
+    (
+        4,
+        "Дневные агрегаты аналитики и индекс для архивирования",
+        [
+            ANALYTICS_DAILY_TABLE,
+            "CREATE INDEX IF NOT EXISTS idx_analytics_created ON analytics(created_at)",
+        ],
+    ),
+    (
+        5,
+        "Сохранённое состояние ограничителя частоты",
+        [RATE_LIMITS_TABLE],
+    ),
+    (
+        6,
+        "Состояние напоминаний менеджерам по заявке",
+        [
+            add_column("orders", "last_reminded_at", "TIMESTAMP"),
+            add_column("orders", "reminder_count", "INTEGER NOT NULL DEFAULT 0"),
+        ],
+    ),
+    (
+        7,
+        "Рассылки с журналом доставки",
+        [
+            BROADCAST_JOBS_TABLE,
+            BROADCAST_DELIVERIES_TABLE,
+            "CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_status ON broadcast_deliveries(job_id, status)",
+            "CREATE INDEX IF NOT EXISTS idx_users_status ON users(status)",
+        ],
+    ),
+    (
+        8,
+        "Outbox уведомлений менеджерам",
+        [
+            NOTIFICATION_OUTBOX_TABLE,
+            "CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON notification_outbox(status, next_attempt_at)",
+        ],
+    ),
+    (
+        9,
+        "Кэш file_id загруженных медиа",
+        [MEDIA_CACHE_TABLE],
+    ),
+    (
+        10,
+        "Состояние user_data и разговоров (persistence)",
+        [PERSISTENCE_USER_DATA_TABLE, PERSISTENCE_CONVERSATIONS_TABLE],
+    ),
+    (
+        11,
+        "Инкрементальная выгрузка заявок: updated_at, отметки синхронизации, строки листа",
+        [
+            add_column("orders", "updated_at", "TIMESTAMP"),
+            "UPDATE orders SET updated_at = created_at WHERE updated_at IS NULL",
+            "CREATE INDEX IF NOT EXISTS idx_orders_updated ON orders(updated_at, id)",
+            *ORDERS_UPDATED_TRIGGERS,
+            SYNC_STATE_TABLE,
+            SHEETS_ROWS_TABLE,
+        ],
+    ),
+    (
+        12,
+        "Журнал изменений заявок для потоковой выгрузки",
+        [ORDER_EVENTS_TABLE, *ORDER_EVENTS_TRIGGERS],
+    ),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы (0, если миграции не применялись)."""
+    conn.execute(SCHEMA_VERSION_TABLE)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Применить недостающие миграции по порядку. Возвращает итоговую версию."""
+    current = get_schema_version(conn)
+    conn.commit()
+    for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Ошибка миграции БД до версии {version}")
+            raise
+        logger.info(f"Миграция БД {version}: {description}")
+        current = version
+    return current
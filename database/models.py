@@ -52,4 +52,249 @@ CREATE TABLE IF NOT EXISTS analytics (
 );
 """
 
+# Счётчик номеров заявок по дням (создаётся миграцией 2)
+ORDER_SEQUENCES_TABLE = """
+CREATE TABLE IF NOT EXISTS order_sequences (
+    day TEXT PRIMARY KEY,
+    last_value INTEGER NOT NULL
+);
+"""
+
+# Счётчики для /admin_stats, поддерживаются триггерами (миграция 3)
+STATS_COUNTERS_TABLE = """
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+STATS_DAILY_EVENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS stats_daily_events (
+    day TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_type)
+);
+"""
+
+
+# Дневные агрегаты аналитики (миграция 4)
+ANALYTICS_DAILY_TABLE = """
+CREATE TABLE IF NOT EXISTS analytics_daily (
+    day TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    unique_users INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_type)
+);
+"""
+
+
+# Состояние ограничителя частоты (миграция 5): попадания в окне, JSON-список unix-времени
+RATE_LIMITS_TABLE = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    scope TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    hits TEXT NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+"""
+
+
+# Рассылки и журнал доставки по получателям (миграция 7)
+BROADCAST_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    created_by INTEGER,
+    status_chat_id INTEGER,
+    status_message_id INTEGER,
+    total INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+"""
+
+# status: pending | sending | sent | failed | blocked
+BROADCAST_DELIVERIES_TABLE = """
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    job_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    updated_at TIMESTAMP,
+    PRIMARY KEY (job_id, user_id),
+    FOREIGN KEY (job_id) REFERENCES broadcast_jobs(id)
+);
+"""
+
+
+# Исходящие уведомления, записываемые вместе с заявкой (миграция 8)
+# status: pending | sending | sent | dead
+NOTIFICATION_OUTBOX_TABLE = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    chat_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+"""
+
+# file_id, выданный Telegram при первой загрузке файла; актуален, пока не изменились размер и mtime
+MEDIA_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS media_cache (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    file_id TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Состояние бота между перезапусками (persistence PTB): user_data по пользователю
+# и состояния ConversationHandler по ключу разговора, значения — JSON
+PERSISTENCE_USER_DATA_TABLE = """
+CREATE TABLE IF NOT EXISTS persistence_user_data (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+PERSISTENCE_CONVERSATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS persistence_conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (name, key)
+);
+"""
+
+# Отметки синхронизации с внешними системами (high-water mark и т.п.) по имени
+SYNC_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Строка листа Google Sheets для каждой выгруженной заявки и хеш выгруженных значений
+SHEETS_ROWS_TABLE = """
+CREATE TABLE IF NOT EXISTS sheets_rows (
+    sheet_id TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    row_hash TEXT NOT NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sheet_id, order_id)
+);
+"""
+
+# orders.updated_at: время последнего изменения выгружаемых полей заявки
+ORDERS_UPDATED_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_orders_updated_insert AFTER INSERT ON orders
+    WHEN NEW.updated_at IS NULL BEGIN
+        UPDATE orders SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_orders_updated_fields AFTER UPDATE OF status, phone, manager_id, notes ON orders
+    WHEN OLD.status IS NOT NEW.status OR OLD.phone IS NOT NEW.phone
+        OR OLD.manager_id IS NOT NEW.manager_id OR OLD.notes IS NOT NEW.notes BEGIN
+        UPDATE orders SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+    END;
+    """,
+    # Имя клиента выгружается вместе с заявкой
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_orders_updated_user_name AFTER UPDATE OF full_name ON users
+    WHEN OLD.full_name IS NOT NEW.full_name BEGIN
+        UPDATE orders SET updated_at = CURRENT_TIMESTAMP WHERE user_id = NEW.id;
+    END;
+    """,
+]
+
+# Журнал изменений заявок для выгрузки (created | status | updated); приёмники читают его
+# по своим курсорам в sync_state (export:<имя>), прочитанное всеми удаляется
+ORDER_EVENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS order_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+ORDER_EVENTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_order_events_insert AFTER INSERT ON orders BEGIN
+        INSERT INTO order_events (order_id, event) VALUES (NEW.order_id, 'created');
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_order_events_update AFTER UPDATE OF status, phone, manager_id, notes ON orders
+    WHEN OLD.status IS NOT NEW.status OR OLD.phone IS NOT NEW.phone
+        OR OLD.manager_id IS NOT NEW.manager_id OR OLD.notes IS NOT NEW.notes BEGIN
+        INSERT INTO order_events (order_id, event)
+        VALUES (NEW.order_id, CASE WHEN OLD.status IS NOT NEW.status THEN 'status' ELSE 'updated' END);
+    END;
+    """,
+]
+
+
+def _bump(name_sql: str, delta: str) -> str:
+    return (
+        f"INSERT INTO stats_counters (name, value) VALUES ({name_sql}, {delta}) "
+        f"ON CONFLICT(name) DO UPDATE SET value = value + ({delta});"
+    )
+
+
+STATS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users BEGIN
+        {_bump("'users_total'", "1")}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users BEGIN
+        {_bump("'users_total'", "-1")}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_insert AFTER INSERT ON orders BEGIN
+        {_bump("'orders_total'", "1")}
+        {_bump("'orders_status:' || COALESCE(NEW.status, '')", "1")}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_delete AFTER DELETE ON orders BEGIN
+        {_bump("'orders_total'", "-1")}
+        {_bump("'orders_status:' || COALESCE(OLD.status, '')", "-1")}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_status AFTER UPDATE OF status ON orders
+    WHEN OLD.status IS NOT NEW.status BEGIN
+        {_bump("'orders_status:' || COALESCE(OLD.status, '')", "-1")}
+        {_bump("'orders_status:' || COALESCE(NEW.status, '')", "1")}
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_analytics_insert AFTER INSERT ON analytics BEGIN
+        INSERT INTO stats_daily_events (day, event_type, count)
+        VALUES (date(NEW.created_at), NEW.event_type, 1)
+        ON CONFLICT(day, event_type) DO UPDATE SET count = count + 1;
+    END;
+    """,
+]
+
 ALL_TABLES = [USERS_TABLE, ORDERS_TABLE, MANAGERS_TABLE, ANALYTICS_TABLE]
@@ -0,0 +1,182 @@
+"""Persistence PTB в SQLite: user_data и состояния ConversationHandler.
+
+Каждый пользователь и каждый разговор — отдельная строка (JSON), поэтому
+запись затрагивает только изменившиеся ключи, а не весь файл, как у
+PicklePersistence.
+
+- user_data загружается лениво: при запуске ничего не читается, строка
+  пользователя поднимается в refresh_user_data перед первым обработчиком
+  его апдейта.
+- Application раз в update_interval отдаёт изменённые ключи (update_*);
+  они копятся в буфере и записываются одной транзакцией. Значения, не
+  изменившиеся с прошлой записи, пропускаются.
+- Состояния разговоров читаются при запуске целиком (так устроен
+  ConversationHandler), их немного: завершённые разговоры удаляются.
+
+Ключи словарей в JSON становятся строками — в user_data используются
+только строковые ключи.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+from telegram.ext._utils.types import ConversationDict, ConversationKey
+
+from config import PERSISTENCE_UPDATE_INTERVAL
+from database import adb
+
+logger = logging.getLogger("bot")
+
+# Пустой user_data хранится отсутствием строки
+_EMPTY = "{}"
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+class SQLitePersistence(BasePersistence):
+    """user_data и разговоры в таблицах persistence_user_data / persistence_conversations."""
+
+    def __init__(self, update_interval: float = PERSISTENCE_UPDATE_INTERVAL, flush_delay: float = 0.2) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.flush_delay = flush_delay
+        # Последнее записанное (или прочитанное) значение по пользователю; есть ключ — данные загружены
+        self._stored: dict[int, str] = {}
+        self._conversations_stored: dict[tuple[str, str], str] = {}
+        self._dirty_users: dict[int, Optional[str]] = {}
+        self._dirty_conversations: dict[tuple[str, str], Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+
+    # --- Чтение ---
+
+    async def get_user_data(self) -> dict[int, dict[Any, Any]]:
+        # Ленивая загрузка: данные пользователя поднимаются в refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict[Any, Any]) -> None:
+        if user_id in self._stored:
+            return
+        raw = await adb.load_persisted_user_data(user_id)
+        if user_id in self._stored:
+            # Пока ждали БД, тот же пользователь загружен другим апдейтом
+            return
+        self._stored[user_id] = raw or _EMPTY
+        if raw:
+            for key, value in json.loads(raw).items():
+                user_data.setdefault(key, value)
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        result: ConversationDict = {}
+        for key, state in await adb.load_persisted_conversations(name):
+            self._conversations_stored[(name, key)] = state
+            result[tuple(json.loads(key))] = json.loads(state)
+        if result:
+            logger.info(f"Восстановлено разговоров «{name}»: {len(result)}")
+        return result
+
+    async def get_chat_data(self) -> dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    # --- Запись ---
+
+    async def update_user_data(self, user_id: int, data: dict[Any, Any]) -> None:
+        try:
+            value = _dumps(data) if data else _EMPTY
+        except (TypeError, ValueError) as e:
+            logger.warning(f"user_data пользователя {user_id} не сохранён: {e}")
+            return
+        if self._stored.get(user_id, _EMPTY) == value:
+            return
+        self._dirty_users[user_id] = None if value == _EMPTY else value
+        self._stored[user_id] = value
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_users[user_id] = None
+        self._stored[user_id] = _EMPTY
+        self._schedule_flush()
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        conv_key = (name, _dumps(list(key)))
+        state = None if new_state is None else _dumps(new_state)
+        if self._conversations_stored.get(conv_key) == state:
+            return
+        self._dirty_conversations[conv_key] = state
+        if state is None:
+            self._conversations_stored.pop(conv_key, None)
+        else:
+            self._conversations_stored[conv_key] = state
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    def _schedule_flush(self) -> None:
+        # Application вызывает update_* для всех ключей разом (gather): короткая
+        # задержка собирает их в одну транзакцию
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self._write()
+        except Exception:
+            logger.exception("Не удалось сохранить состояние бота, повтор при следующей записи")
+
+    async def _write(self) -> None:
+        async with self._write_lock:
+            users, self._dirty_users = self._dirty_users, {}
+            conversations, self._dirty_conversations = self._dirty_conversations, {}
+            if not users and not conversations:
+                return
+            try:
+                await adb.save_persistence(
+                    list(users.items()),
+                    [(name, key, state) for (name, key), state in conversations.items()],
+                )
+            except BaseException:
+                # Ошибка или отмена (flush при остановке отменяет отложенную запись) —
+                # вернуть в буфер, не затирая более свежие изменения
+                self._dirty_users = {**users, **self._dirty_users}
+                self._dirty_conversations = {**conversations, **self._dirty_conversations}
+                raise
+            logger.debug(f"Состояние сохранено: пользователей {len(users)}, разговоров {len(conversations)}")
+
+    async def flush(self) -> None:
+        """Записать всё накопленное (Application.stop, после последнего update_persistence)."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self._write()
@@ -0,0 +1,230 @@
+"""Пул долгоживущих подключений к SQLite: WAL, читатели и один писатель."""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("bot")
+
+
+class PoolClosedError(RuntimeError):
+    """Пул уже закрыт (обращение к БД после остановки бота)."""
+
+
+class QueryCounter:
+    """Число SQL-выражений, выполненных в потоке внутри count_queries()."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.statements: list[str] = []
+
+    @property
+    def executed(self) -> int:
+        """Число выполненных выражений без повторов от триггеров.
+
+        Trace callback вызывается и для каждого сработавшего триггера, но с
+        текстом внешнего выражения, поэтому подряд идущие повторы не считаются.
+        """
+        return sum(1 for i, statement in enumerate(self.statements) if i == 0 or statement != self.statements[i - 1])
+
+
+_local = threading.local()
+_statement_hooks: list[Callable[[str], None]] = []
+
+
+def add_statement_hook(hook: Callable[[str], None]) -> None:
+    """Вызывать hook(выражение) для каждого SQL на подключениях пула (трассировка).
+
+    Вызывается в потоке запроса, поэтому должен быть быстрым и не бросать исключений.
+    """
+    if hook not in _statement_hooks:
+        _statement_hooks.append(hook)
+
+
+def _trace(statement: str) -> None:
+    for hook in _statement_hooks:
+        hook(statement)
+    for counter in getattr(_local, "counters", ()):
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Посчитать запросы к БД в текущем потоке (для тестов и отладки).
+
+    Учитываются все выражения на подключениях пула, включая неявные BEGIN/COMMIT;
+    count — вместе с вызовами триггеров, executed — без них.
+    """
+    counter = QueryCounter()
+    counters = getattr(_local, "counters", None)
+    if counters is None:
+        counters = _local.counters = []
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+class ConnectionPool:
+    """Пул подключений к одному файлу SQLite.
+
+    Читающие запросы получают подключение из очереди (не больше ``size`` штук),
+    все записи идут через единственное подключение-писатель под блокировкой:
+    в WAL-режиме читатели не мешают писателю, а писатели не конкурируют за lock файла.
+    """
+
+    def __init__(
+        self,
+        path,
+        size: int = 4,
+        busy_timeout_ms: int = 5000,
+        cache_size_kb: int = 16384,
+        mmap_size: int = 134217728,
+        synchronous: str = "NORMAL",
+        checkout_timeout: float = 30.0,
+    ) -> None:
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Недопустимое значение PRAGMA synchronous: {synchronous}")
+        self._path = str(path)
+        self._size = max(1, size)
+        self._busy_timeout_ms = busy_timeout_ms
+        self._cache_size_kb = cache_size_kb
+        self._mmap_size = mmap_size
+        self._synchronous = synchronous.upper()
+        self._checkout_timeout = checkout_timeout
+
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all_readers: list[sqlite3.Connection] = []
+        self._create_lock = threading.Lock()
+
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._writer_depth = 0
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "read_checkouts": 0,
+            "write_checkouts": 0,
+            "read_wait_total": 0.0,
+            "write_wait_total": 0.0,
+            "read_wait_max": 0.0,
+            "write_wait_max": 0.0,
+            "readers_in_use": 0,
+        }
+        self._closed = False
+
+    # --- Подключения ---
+
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, timeout=self._busy_timeout_ms / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.set_trace_callback(_trace)
+        conn.execute(f"PRAGMA busy_timeout = {int(self._busy_timeout_ms)}")
+        conn.execute(f"PRAGMA synchronous = {self._synchronous}")
+        conn.execute(f"PRAGMA cache_size = -{int(self._cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self._mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            conn = self._connect(readonly=False)
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if str(mode).lower() != "wal":
+                logger.warning(f"SQLite не перешёл в WAL-режим (journal_mode={mode})")
+            self._writer = conn
+        return self._writer
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        if self._writer is None:
+            # Писатель создаётся первым: он переводит файл в WAL
+            with self._writer_lock:
+                self._get_writer()
+        with self._create_lock:
+            if len(self._all_readers) < self._size:
+                conn = self._connect(readonly=True)
+                self._all_readers.append(conn)
+                return conn
+        try:
+            return self._readers.get(timeout=self._checkout_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Нет свободного подключения к БД за {self._checkout_timeout} с") from None
+
+    def _record(self, kind: str, waited: float) -> None:
+        with self._stats_lock:
+            self._stats[f"{kind}_checkouts"] += 1
+            self._stats[f"{kind}_wait_total"] += waited
+            if waited > self._stats[f"{kind}_wait_max"]:
+                self._stats[f"{kind}_wait_max"] = waited
+
+    @contextmanager
+    def connection(self, readonly: bool = False):
+        """Выдать подключение: читателя из пула или сериализованного писателя."""
+        if self._closed:
+            raise PoolClosedError("Пул подключений к БД закрыт")
+        started = time.perf_counter()
+        if readonly:
+            conn = self._acquire_reader()
+            self._record("read", time.perf_counter() - started)
+            with self._stats_lock:
+                self._stats["readers_in_use"] += 1
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                with self._stats_lock:
+                    self._stats["readers_in_use"] -= 1
+                self._readers.put(conn)
+            return
+
+        with self._writer_lock:
+            self._record("write", time.perf_counter() - started)
+            conn = self._get_writer()
+            self._writer_depth += 1
+            try:
+                yield conn
+            finally:
+                self._writer_depth -= 1
+                # Незакоммиченное на внешнем уровне откатываем, как делал бы close()
+                if self._writer_depth == 0 and conn.in_transaction:
+                    conn.rollback()
+
+    # --- Статистика и закрытие ---
+
+    def stats(self) -> dict[str, Any]:
+        """Снимок статистики пула: число выдач, суммарное/максимальное ожидание."""
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["size"] = self._size
+        s["readers_open"] = len(self._all_readers)
+        s["read_wait_avg"] = s["read_wait_total"] / s["read_checkouts"] if s["read_checkouts"] else 0.0
+        s["write_wait_avg"] = s["write_wait_total"] / s["write_checkouts"] if s["write_checkouts"] else 0.0
+        return s
+
+    def close(self) -> None:
+        """Закрыть все подключения (вызывается при остановке бота)."""
+        self._closed = True
+        with self._create_lock:
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+        with self._writer_lock:
+            if self._writer is not None:
+                try:
+                    self._writer.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,197 @@
+"""Дневные агрегаты аналитики, хранение и архивирование сырых событий.
+
+Задача в job_queue раз в сутки сворачивает завершённые дни из analytics в
+analytics_daily, затем сырые строки старше ANALYTICS_RETENTION_DAYS
+выгружает в сжатые NDJSON-файлы по дням и удаляет из живой таблицы
+небольшими пачками, чтобы не держать блокировку писателя.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from config import ANALYTICS_ARCHIVE_BATCH, ANALYTICS_ARCHIVE_DIR, ANALYTICS_RETENTION_DAYS
+from database.db import get_connection
+
+logger = logging.getLogger("bot")
+
+
+def _today() -> date:
+    # created_at в analytics — CURRENT_TIMESTAMP, т.е. UTC
+    return datetime.now(timezone.utc).date()
+
+
+def rollup_analytics() -> int:
+    """Свернуть завершённые дни в analytics_daily. Возвращает число строк агрегата.
+
+    Последний уже свёрнутый день пересчитывается повторно: буфер аналитики
+    может дописать события с меткой времени предыдущего дня.
+    """
+    with get_connection() as conn:
+        row = conn.execute("SELECT MAX(day) FROM analytics_daily").fetchone()
+        since = row[0] or "0000-00-00"
+        cur = conn.execute(
+            """
+            INSERT INTO analytics_daily (day, event_type, count, unique_users)
+            SELECT date(created_at), event_type, COUNT(*), COUNT(DISTINCT user_id)
+            FROM analytics
+            WHERE created_at >= ? AND created_at < date('now')
+            GROUP BY 1, 2
+            ON CONFLICT(day, event_type) DO UPDATE SET
+                count = excluded.count,
+                unique_users = excluded.unique_users
+            """,
+            (since,),
+        )
+        conn.commit()
+        return cur.rowcount
+
+
+def _archive_path(archive_dir: Path, day: str, first_id: int, last_id: int) -> Path:
+    y, m, _ = day.split("-")
+    return archive_dir / "analytics" / y / m / f"{day}.{first_id}-{last_id}.ndjson.gz"
+
+
+def _archive_day(day: str, archive_dir: Path, batch_size: int) -> int:
+    """Выгрузить сырые события дня в файл и удалить их из таблицы.
+
+    Имя файла содержит диапазон id, поэтому повторный запуск после сбоя
+    не перезапишет уже выгруженное (возможные дубли различимы по id).
+    """
+    next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+    with get_connection(readonly=True) as conn:
+        first_id, last_id = conn.execute(
+            "SELECT MIN(id), MAX(id) FROM analytics WHERE created_at >= ? AND created_at < ?",
+            (day, next_day),
+        ).fetchone()
+        if first_id is None:
+            return 0
+        path = _archive_path(archive_dir, day, first_id, last_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        written = 0
+        cur = conn.execute(
+            """
+            SELECT id, event_type, user_id, order_id, payload, created_at FROM analytics
+            WHERE created_at >= ? AND created_at < ? AND id <= ?
+            ORDER BY id
+            """,
+            (day, next_day, last_id),
+        )
+        with gzip.open(tmp, "wt", encoding="utf-8") as fp:
+            for row in cur:
+                fp.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+                written += 1
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+
+    deleted = 0
+    while True:
+        with get_connection() as conn:
+            cur = conn.execute(
+                """
+                DELETE FROM analytics WHERE id IN (
+                    SELECT id FROM analytics
+                    WHERE created_at >= ? AND created_at < ? AND id <= ?
+                    LIMIT ?
+                )
+                """,
+                (day, next_day, last_id, batch_size),
+            )
+            conn.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            break
+    logger.info(f"Аналитика за {day}: выгружено {written}, удалено {deleted} → {path.name}")
+    return deleted
+
+
+def archive_analytics(
+    retention_days: int = ANALYTICS_RETENTION_DAYS,
+    archive_dir: Path = ANALYTICS_ARCHIVE_DIR,
+    batch_size: int = ANALYTICS_ARCHIVE_BATCH,
+) -> int:
+    """Архивировать сырые события старше retention_days. Возвращает число удалённых строк.
+
+    Архивируются только дни, уже свёрнутые в analytics_daily.
+    """
+    cutoff = (_today() - timedelta(days=retention_days)).isoformat()
+    with get_connection(readonly=True) as conn:
+        oldest = conn.execute("SELECT MIN(created_at) FROM analytics").fetchone()[0]
+        rolled = conn.execute("SELECT MAX(day) FROM analytics_daily").fetchone()[0]
+    if not oldest or not rolled:
+        return 0
+    day = date.fromisoformat(oldest[:10])
+    last = min(date.fromisoformat(cutoff) - timedelta(days=1), date.fromisoformat(rolled))
+    total = 0
+    while day <= last:
+        total += _archive_day(day.isoformat(), Path(archive_dir), batch_size)
+        day += timedelta(days=1)
+    return total
+
+
+def run_analytics_maintenance() -> dict[str, int]:
+    """Суточное обслуживание: агрегаты, затем архив. Для задачи job_queue."""
+    rolled = rollup_analytics()
+    archived = archive_analytics()
+    return {"rolled_up": rolled, "archived": archived}
+
+
+def get_event_counts(days: int = 7) -> dict[str, dict[str, int]]:
+    """События за последние days дней (включая сегодня): {event_type: {count, unique_users}}.
+
+    Прошедшие дни берутся из analytics_daily, сырые события читаются только
+    за сегодня и за дни, ещё не свёрнутые задачей. unique_users — сумма
+    уникальных пользователей по дням.
+    """
+    today = _today()
+    start = (today - timedelta(days=days - 1)).isoformat()
+    result: dict[str, dict[str, int]] = {}
+
+    def add(event_type: str, count: int, unique_users: int) -> None:
+        item = result.setdefault(event_type, {"count": 0, "unique_users": 0})
+        item["count"] += count
+        item["unique_users"] += unique_users
+
+    with get_connection(readonly=True) as conn:
+        conn.execute("BEGIN")
+        rolled: Optional[str] = conn.execute(
+            "SELECT MAX(day) FROM analytics_daily WHERE day < ?", (today.isoformat(),)
+        ).fetchone()[0]
+        for row in conn.execute(
+            """
+            SELECT event_type, SUM(count), SUM(unique_users) FROM analytics_daily
+            WHERE day >= ? AND day < ? GROUP BY event_type
+            """,
+            (start, today.isoformat()),
+        ):
+            add(row[0], row[1], row[2])
+        raw_from = max(start, (date.fromisoformat(rolled) + timedelta(days=1)).isoformat()) if rolled else start
+        for row in conn.execute(
+            """
+            SELECT date(created_at), event_type, COUNT(*), COUNT(DISTINCT user_id) FROM analytics
+            WHERE created_at >= ? GROUP BY 1, 2
+            """,
+            (raw_from,),
+        ):
+            add(row[1], row[2], row[3])
+        conn.commit()
+    return result
+
+
+def get_funnel(days: int = 7) -> dict[str, Any]:
+    """Воронка /start → заявка за последние days дней."""
+    counts = get_event_counts(days)
+    starts = counts.get("start", {}).get("count", 0)
+    orders = counts.get("order_created", {}).get("count", 0)
+    return {
+        "days": days,
+        "starts": starts,
+        "start_users": counts.get("start", {}).get("unique_users", 0),
+        "orders": orders,
+        "conversion": orders / starts if starts else 0.0,
+    }
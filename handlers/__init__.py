@@ -1,10 +1,12 @@
 """Обработчики команд и сообщений."""
+from handlers.guard import register_guard_handlers
 from handlers.start import register_start_handlers
 from handlers.quiz import get_quiz_conversation_handler
 from handlers.order import register_order_handlers
 from handlers.admin import register_admin_handlers
 
 __all__ = [
+    "register_guard_handlers",
     "register_start_handlers",
     "get_quiz_conversation_handler",
     "register_order_handlers",
@@ -4,7 +4,10 @@ from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 
 from config import ADMIN_IDS
-from database import db
+from database import adb
+from utils.broadcast import broadcast_jobs
+from utils.export import TELEGRAM_DOCUMENT_LIMIT, USAGE as EXPORT_USAGE, export_orders, parse_export_args
+from utils.outbox import outbox
 
 logger = logging.getLogger("bot")
 
@@ -18,17 +21,76 @@ async def cmd_admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not update.effective_user or not _is_admin(update.effective_user.id):
         await update.message.reply_text("Доступ запрещён.")
         return
-    stats = db.get_stats()
+    stats = await adb.get_stats()
+    pool = await adb.get_pool_stats()
+    sink = await adb.get_analytics_sink_stats()
+    funnel = await adb.get_funnel(7)
+    outbox_stats = await adb.get_outbox_stats()
+    backlog = await adb.get_export_backlog()
+    processor = context.application.update_processor
+    updates_line = ""
+    if hasattr(processor, "stats"):
+        ups = processor.stats()
+        updates_line = (
+            f"\n⚙️ Апдейты: выполняется {ups['running']}/{ups['concurrency']}, в очереди {ups['queued']} "
+            f"(макс. в шарде {max(s['queued'] for s in ups['shards'])}, "
+            f"пик {max(s['peak'] for s in ups['shards'])}), "
+            f"обработано {ups['processed']}"
+        )
+    export_line = ""
+    if backlog:
+        export_line = "\n📤 Выгрузка: " + ", ".join(
+            f"{b['name']} — в очереди {b['pending']}, отставание {b['lag']:.0f} с" for b in backlog
+        )
     text = (
         "📊 *Статистика бота*\n\n"
         f"👥 Пользователей: {stats['users_total']}\n"
         f"📋 Всего заявок: {stats['orders_total']}\n"
         f"🆕 Новых заявок: {stats['orders_new']}\n"
-        f"🚀 Запусков /start сегодня: {stats['starts_today']}"
+        f"🚀 Запусков /start сегодня: {stats['starts_today']}\n"
+        f"📉 За {funnel['days']} дн.: /start {funnel['starts']} → заявок {funnel['orders']} "
+        f"(конверсия {funnel['conversion'] * 100:.1f}%)\n\n"
+        f"🗄 Пул БД: {pool['readers_open']}/{pool['size']} читателей, "
+        f"выдач {pool['read_checkouts']} + {pool['write_checkouts']} (запись), "
+        f"ожидание записи ср. {pool['write_wait_avg'] * 1000:.1f} мс / макс. {pool['write_wait_max'] * 1000:.1f} мс\n"
+        f"📈 Аналитика: записано {sink.get('flushed', 0)}, в очереди {sink.get('queued', 0)}, "
+        f"отброшено {sink.get('dropped', 0)}\n"
+        f"📨 Уведомления: в очереди {outbox_stats.get('pending', 0) + outbox_stats.get('sending', 0)}, "
+        f"не доставлено {outbox_stats.get('dead', 0)} (/admin\\_outbox\\_retry)"
+        f"{export_line}"
+        f"{updates_line}"
     )
     await update.message.reply_text(text, parse_mode="Markdown")
 
 
+async def cmd_admin_reconcile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /admin_reconcile [fix] — сверить счётчики статистики с таблицами."""
+    if not update.effective_user or not _is_admin(update.effective_user.id):
+        await update.message.reply_text("Доступ запрещён.")
+        return
+    fix = bool(context.args) and context.args[0].lower() == "fix"
+    drift = await adb.reconcile_stats_counters(fix=fix)
+    if not drift:
+        await update.message.reply_text("Счётчики совпадают с данными.")
+        return
+    lines = [f"{name}: {stored} → {actual}" for name, (stored, actual) in sorted(drift.items())[:50]]
+    tail = "Счётчики исправлены." if fix else "Исправить: /admin_reconcile fix"
+    await update.message.reply_text(
+        f"Расхождений: {len(drift)}\n" + "\n".join(lines) + f"\n\n{tail}",
+        parse_mode=None,
+    )
+
+
+async def cmd_admin_outbox_retry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /admin_outbox_retry — повторить недоставленные уведомления менеджерам."""
+    if not update.effective_user or not _is_admin(update.effective_user.id):
+        await update.message.reply_text("Доступ запрещён.")
+        return
+    count = await adb.requeue_notifications(("dead",))
+    outbox.wake()
+    await update.message.reply_text(f"Возвращено в очередь уведомлений: {count}")
+
+
 async def cmd_admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /admin_broadcast <текст> — рассылка всем пользователям."""
     if not update.effective_user or not _is_admin(update.effective_user.id):
@@ -39,43 +101,103 @@ async def cmd_admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("Использование: /admin_broadcast Текст рассылки")
         return
     msg = " ".join(text)
-    user_ids = db.get_all_active_user_ids()
-    sent = 0
-    for uid in user_ids:
-        try:
-            await context.bot.send_message(chat_id=uid, text=msg)
-            sent += 1
-        except Exception:
-            pass
-    await update.message.reply_text(f"Рассылка отправлена: {sent} из {len(user_ids)}")
+    job_id, total = await adb.create_broadcast_job(msg, update.effective_user.id)
+    status = await update.message.reply_text(
+        f"📣 Рассылка #{job_id} запущена: 0 из {total}\n"
+        f"Пауза: /admin_broadcast_pause {job_id}, отмена: /admin_broadcast_cancel {job_id}",
+        parse_mode=None,
+    )
+    await adb.set_broadcast_status_message(job_id, status.chat_id, status.message_id)
+    # Рассылка идёт в фоне, обработчик администратора не ждёт её окончания
+    broadcast_jobs.start(context.application, job_id)
+
+
+async def _broadcast_job_command(update: Update, context: ContextTypes.DEFAULT_TYPE, usage: str):
+    """Проверка прав и разбор номера рассылки для команд управления."""
+    if not update.effective_user or not _is_admin(update.effective_user.id):
+        await update.message.reply_text("Доступ запрещён.")
+        return None
+    try:
+        job_id = int((context.args or [""])[0].lstrip("#"))
+    except ValueError:
+        await update.message.reply_text(f"Использование: {usage} <номер рассылки>")
+        return None
+    job = await adb.get_broadcast_job(job_id)
+    if not job:
+        await update.message.reply_text("Рассылка не найдена.")
+        return None
+    return job
+
+
+async def cmd_admin_broadcast_pause(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /admin_broadcast_pause <id> — приостановить рассылку."""
+    job = await _broadcast_job_command(update, context, "/admin_broadcast_pause")
+    if not job:
+        return
+    if not await adb.set_broadcast_job_status(job["id"], "paused", ("running",)):
+        await update.message.reply_text(f"Рассылка #{job['id']} не выполняется (статус: {job['status']}).", parse_mode=None)
+        return
+    broadcast_jobs.stop(job["id"])
+    await update.message.reply_text(f"Рассылка #{job['id']} на паузе. Продолжить: /admin_broadcast_resume {job['id']}", parse_mode=None)
+
+
+async def cmd_admin_broadcast_resume(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /admin_broadcast_resume <id> — продолжить рассылку."""
+    job = await _broadcast_job_command(update, context, "/admin_broadcast_resume")
+    if not job:
+        return
+    if not await adb.set_broadcast_job_status(job["id"], "running", ("paused",)):
+        await update.message.reply_text(f"Рассылка #{job['id']} не на паузе (статус: {job['status']}).", parse_mode=None)
+        return
+    broadcast_jobs.start(context.application, job["id"])
+    await update.message.reply_text(f"Рассылка #{job['id']} продолжена.", parse_mode=None)
+
+
+async def cmd_admin_broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /admin_broadcast_cancel <id> — отменить рассылку."""
+    job = await _broadcast_job_command(update, context, "/admin_broadcast_cancel")
+    if not job:
+        return
+    if not await adb.set_broadcast_job_status(job["id"], "cancelled", ("running", "paused")):
+        await update.message.reply_text(f"Рассылка #{job['id']} уже завершена (статус: {job['status']}).", parse_mode=None)
+        return
+    broadcast_jobs.stop(job["id"])
+    await update.message.reply_text(f"Рассылка #{job['id']} отменена.", parse_mode=None)
 
 
 async def cmd_admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Команда /admin_export — экспорт заявок (отправка файла)."""
+    """Команда /admin_export [период] [статусы] [gz] — экспорт заявок (отправка файла)."""
     if not update.effective_user or not _is_admin(update.effective_user.id):
         await update.message.reply_text("Доступ запрещён.")
         return
-    rows = db.get_orders_for_export()
-    if not rows:
-        await update.message.reply_text("Нет заявок за сегодня для экспорта.")
-        return
-    import csv
-    import io
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["Дата", "ID заявки", "Имя", "Телефон", "Статус"])
-    for r in rows:
-        w.writerow([
-            str(r.get("created_at", "")),
-            str(r.get("order_id", "")),
-            str(r.get("full_name", "")),
-            str(r.get("phone", "")),
-            str(r.get("status", "")),
-        ])
-    buf.seek(0)
-    from telegram import InputFile
-    doc = InputFile(io.BytesIO(buf.getvalue().encode("utf-8-sig")), filename="orders_export.csv")
-    await update.message.reply_document(document=doc)
+    try:
+        query = parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"{e}\n\n{EXPORT_USAGE}", parse_mode=None)
+        return
+    path, count = await export_orders(query)
+    try:
+        if not count:
+            await update.message.reply_text(f"Нет заявок за {query.label} для экспорта.", parse_mode=None)
+            return
+        size = path.stat().st_size
+        if size > TELEGRAM_DOCUMENT_LIMIT:
+            await update.message.reply_text(
+                f"Файл ({size / 1024 / 1024:.0f} МБ) больше лимита Telegram в "
+                f"{TELEGRAM_DOCUMENT_LIMIT // 1024 // 1024} МБ: сузьте период"
+                + ("." if query.compress else " или добавьте gz."),
+                parse_mode=None,
+            )
+            return
+        with path.open("rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename=query.filename,
+                caption=f"Заявок: {count} за {query.label}",
+                parse_mode=None,
+            )
+    finally:
+        path.unlink(missing_ok=True)
 
 
 async def cmd_admin_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -91,7 +213,7 @@ async def cmd_admin_user(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     except ValueError:
         await update.message.reply_text("Укажите числовой user_id.")
         return
-    u = db.get_user_by_telegram_id(uid)
+    u = await adb.get_user_by_telegram_id(uid)
     if not u:
         await update.message.reply_text("Пользователь не найден.")
         return
@@ -121,18 +243,23 @@ async def cmd_admin_order(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if status not in ("new", "in_progress", "done", "cancelled"):
         await update.message.reply_text("Статус: new, in_progress, done или cancelled.")
         return
-    o = db.get_order_by_id(order_id)
+    o = await adb.get_order_by_id(order_id)
     if not o:
         await update.message.reply_text("Заявка не найдена.")
         return
-    db.update_order_status(order_id, status)
+    await adb.update_order_status(order_id, status)
     await update.message.reply_text(f"Статус заявки {order_id} изменён на: {status}")
 
 
 def register_admin_handlers(application) -> None:
     """Регистрация админ-обработчиков."""
     application.add_handler(CommandHandler("admin_stats", cmd_admin_stats))
+    application.add_handler(CommandHandler("admin_reconcile", cmd_admin_reconcile))
+    application.add_handler(CommandHandler("admin_outbox_retry", cmd_admin_outbox_retry))
     application.add_handler(CommandHandler("admin_broadcast", cmd_admin_broadcast))
+    application.add_handler(CommandHandler("admin_broadcast_pause", cmd_admin_broadcast_pause))
+    application.add_handler(CommandHandler("admin_broadcast_resume", cmd_admin_broadcast_resume))
+    application.add_handler(CommandHandler("admin_broadcast_cancel", cmd_admin_broadcast_cancel))
     application.add_handler(CommandHandler("admin_export", cmd_admin_export))
     application.add_handler(CommandHandler("admin_user", cmd_admin_user))
     application.add_handler(CommandHandler("admin_order", cmd_admin_order))
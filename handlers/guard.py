@@ -0,0 +1,44 @@
+"""Защита от флуда: отбрасывание апдейтов сверх лимита до основных обработчиков."""
+import logging
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+
+from config import ADMIN_IDS
+from database import adb
+from utils.ratelimit import limiter
+
+logger = logging.getLogger("bot")
+
+# Группа раньше всех остальных обработчиков (по умолчанию — 0)
+GUARD_GROUP = -10
+
+
+async def rate_limit_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Считать апдейты пользователя; при превышении лимита — остановить обработку."""
+    user = update.effective_user
+    if not user or user.id in (ADMIN_IDS or []):
+        return
+    allowed = limiter.hit("updates", user.id)
+    message = update.effective_message
+    if allowed and message and message.text and message.text.startswith("/start"):
+        allowed = limiter.hit("start", user.id)
+    if not allowed:
+        logger.debug(f"Апдейт {update.update_id} от {user.id} отброшен ограничителем")
+        raise ApplicationHandlerStop
+
+
+async def load_rate_limits() -> None:
+    """Поднять состояние ограничителя: сохранённые окна и заявки за последний час из БД."""
+    limiter.load(await adb.load_rate_limits())
+    limiter.load(await adb.get_recent_order_hits(limiter.limits["orders"][1]))
+
+
+async def persist_rate_limits(context: ContextTypes.DEFAULT_TYPE = None) -> None:
+    """Сохранить изменившиеся окна в БД (задача job_queue и остановка бота)."""
+    limiter.prune()
+    await adb.save_rate_limits(limiter.take_dirty())
+
+
+def register_guard_handlers(application) -> None:
+    """Регистрация ограничителя в приоритетной группе."""
+    application.add_handler(TypeHandler(Update, rate_limit_guard), group=GUARD_GROUP)
@@ -3,8 +3,9 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 
-from database import db
+from database import adb
 from keyboards import get_main_keyboard
+from utils import responses
 
 logger = logging.getLogger("bot")
 
@@ -14,12 +15,9 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     user = update.effective_user
     if not user:
         return
-    row = db.get_last_order_by_telegram_user(user.id)
+    row = await adb.get_last_order_by_telegram_user(user.id)
     if not row:
-        await update.message.reply_text(
-            "У вас пока нет заявок. Оформить заявку: /order",
-            reply_markup=get_main_keyboard(),
-        )
+        await responses.NO_ORDERS.reply(update.message)
         return
     status_text = {"new": "🆕 Новая", "in_progress": "🔄 В работе", "done": "✅ Выполнена", "cancelled": "❌ Отменена"}.get(
         row["status"], row["status"]
@@ -15,25 +15,15 @@ from config import (
     QUIZ_BUSINESS,
     QUIZ_GOAL,
     QUIZ_CONTACT,
-    MAX_ORDERS_PER_HOUR,
-)
-from database import db
-from keyboards import (
-    get_main_keyboard,
-    get_main_inline_keyboard,
-    get_contact_keyboard,
-    get_quiz_keyboard_business,
-    get_quiz_keyboard_goal,
 )
+from database import adb
+from keyboards import get_main_inline_keyboard
 from keyboards.inline import QUIZ_LABELS
-from utils.messages import (
-    QUIZ_INTRO,
-    QUIZ_Q1,
-    QUIZ_Q2,
-    QUIZ_CONTACT as MSG_QUIZ_CONTACT,
-    ORDER_CONFIRM_TEMPLATE,
-)
-from utils.integrations import notify_managers_about_order
+from utils import responses
+from utils.messages import QUIZ_Q1, QUIZ_Q2, ORDER_CONFIRM_TEMPLATE
+from utils.integrations import build_order_notifications
+from utils.outbox import outbox
+from utils.ratelimit import limiter
 
 logger = logging.getLogger("bot")
 
@@ -52,25 +42,19 @@ async def cmd_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if not user:
         return ConversationHandler.END
-    if db.count_orders_last_hour(user.id) >= MAX_ORDERS_PER_HOUR:
-        msg = "Вы уже отправили несколько заявок за последний час. Пожалуйста, подождите."
+    if not limiter.check("orders", user.id):
         if update.message:
-            await update.message.reply_text(msg, reply_markup=get_main_keyboard())
+            await responses.ORDER_LIMIT.reply(update.message)
         elif update.callback_query:
-            await update.callback_query.edit_message_text(msg)
+            await update.callback_query.edit_message_text(responses.ORDER_LIMIT.text)
         return ConversationHandler.END
     context.user_data["quiz_data"] = {}
     if update.message:
-        await update.message.reply_text(QUIZ_INTRO, parse_mode="Markdown")
-        await update.message.reply_text(QUIZ_Q1, parse_mode="Markdown", reply_markup=get_quiz_keyboard_business())
+        await responses.QUIZ_INTRO.reply(update.message)
+        await responses.QUIZ_BUSINESS.reply(update.message)
     elif update.callback_query:
-        await update.callback_query.edit_message_text(QUIZ_INTRO, parse_mode="Markdown")
-        await context.bot.send_message(
-            chat_id=update.callback_query.message.chat_id,
-            text=QUIZ_Q1,
-            parse_mode="Markdown",
-            reply_markup=get_quiz_keyboard_business(),
-        )
+        await responses.QUIZ_INTRO.edit(update.callback_query)
+        await responses.QUIZ_BUSINESS.send(context.bot, update.callback_query.message.chat_id)
     return QUIZ_BUSINESS
 
 
@@ -81,12 +65,7 @@ async def quiz_answer_business(update: Update, context: ContextTypes.DEFAULT_TYP
     data = _get_quiz_data(context)
     data["business_type"] = QUIZ_LABELS.get(q.data, q.data)
     await q.edit_message_text(text=f"{QUIZ_Q1}\n✔ {data['business_type']}")
-    await context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=QUIZ_Q2,
-        parse_mode="Markdown",
-        reply_markup=get_quiz_keyboard_goal(),
-    )
+    await responses.QUIZ_GOAL.send(context.bot, update.effective_chat.id)
     return QUIZ_GOAL
 
 
@@ -96,12 +75,7 @@ async def quiz_answer_goal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = _get_quiz_data(context)
     data["goal"] = QUIZ_LABELS.get(q.data, q.data)
     await q.edit_message_text(text=f"{QUIZ_Q2}\n✔ {data['goal']}")
-    await context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=MSG_QUIZ_CONTACT,
-        parse_mode="Markdown",
-        reply_markup=get_contact_keyboard(),
-    )
+    await responses.QUIZ_CONTACT.send(context.bot, update.effective_chat.id)
     return QUIZ_CONTACT
 
 
@@ -113,15 +87,12 @@ async def quiz_contact_received(update: Update, context: ContextTypes.DEFAULT_TY
     elif update.message.text:
         text = update.message.text.strip()
         if text == "❌ Отмена":
-            await update.message.reply_text("Заявка отменена.", reply_markup=get_main_keyboard())
+            await responses.ORDER_CANCELLED.reply(update.message)
             return ConversationHandler.END
         if PHONE_REGEX.match(text):
             phone = text
     if not phone or len(phone) < 10:
-        await update.message.reply_text(
-            "Введите корректный номер телефона (например +7 999 123-45-67) или нажмите «Отправить контакт».",
-            reply_markup=get_contact_keyboard(),
-        )
+        await responses.PHONE_INVALID.reply(update.message)
         return QUIZ_CONTACT
     
     # Сразу создаём заявку после получения контакта
@@ -130,19 +101,26 @@ async def quiz_contact_received(update: Update, context: ContextTypes.DEFAULT_TY
     data["phone"] = phone
     data["contact_preference"] = "phone"
     
-    order_id = db.create_order(
+    order_id = await adb.submit_order(
         telegram_user_id=user.id,
+        username=user.username,
+        full_name=user.full_name,
+        phone=phone,
         business_type=data.get("business_type", ""),
         goal=data.get("goal", ""),
         budget="5000",
-        timeline="",
-        materials="",
         contact_preference=data.get("contact_preference", "phone"),
-        phone=phone,
+        notifications=build_order_notifications(
+            full_name=user.full_name or "",
+            username=user.username or "",
+            phone=phone,
+            business_type=data.get("business_type", ""),
+            goal=data.get("goal", ""),
+        ),
     )
-    db.get_or_create_user(user.id, user.username, user.full_name)
-    db.update_user_phone(user.id, phone)
-    db.log_event("order_created", user_id=user.id, order_id=order_id)
+    limiter.hit("orders", user.id)
+    # Уведомления менеджерам уже в outbox, доставит фоновый диспетчер
+    outbox.wake()
     
     await update.message.reply_text(
         ORDER_CONFIRM_TEMPLATE.format(order_id=order_id),
@@ -150,23 +128,13 @@ async def quiz_contact_received(update: Update, context: ContextTypes.DEFAULT_TY
         reply_markup=get_main_inline_keyboard(),
     )
     
-    await notify_managers_about_order(
-        context.bot,
-        order_id=order_id,
-        full_name=user.full_name or "",
-        username=user.username or "",
-        phone=phone,
-        business_type=data.get("business_type", ""),
-        goal=data.get("goal", ""),
-    )
-    
     context.user_data.pop("quiz_data", None)
     return ConversationHandler.END
 
 
 async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /cancel — выход из любого состояния."""
-    await update.message.reply_text("Действие отменено.", reply_markup=get_main_keyboard())
+    await responses.ACTION_CANCELLED.reply(update.message)
     context.user_data.pop("quiz_data", None)
     return ConversationHandler.END
 
@@ -188,4 +156,7 @@ def get_quiz_conversation_handler() -> ConversationHandler:
             ],
         },
         fallbacks=[CommandHandler("cancel", cmd_cancel)],
+        # Шаг квиза сохраняется в SQLite (database/persistence.py) и восстанавливается после перезапуска
+        name="quiz",
+        persistent=True,
     )
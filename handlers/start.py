@@ -4,9 +4,9 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from database import db
-from keyboards import get_main_keyboard, get_main_inline_keyboard
-from utils.messages import WELCOME_MESSAGE, PRICE_LIST, HELP_MESSAGE, FAQ_MESSAGE
+from database import adb
+from utils import responses
+from utils.media import send_portfolio
 
 logger = logging.getLogger("bot")
 
@@ -16,65 +16,47 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     if not user:
         return
-    db.get_or_create_user(user.id, user.username, user.full_name)
-    db.log_event("start", user_id=user.id)
-    await update.message.reply_text(
-        WELCOME_MESSAGE,
-        parse_mode="Markdown",
-        reply_markup=get_main_inline_keyboard(),
-    )
+    await adb.get_or_create_user(user.id, user.username, user.full_name)
+    await adb.log_event("start", user_id=user.id)
+    await responses.START.reply(update.message)
 
 
 async def cmd_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /menu: показать главное меню."""
-    await update.message.reply_text(
-        "Главное меню:",
-        reply_markup=get_main_inline_keyboard(),
-    )
+    await responses.MENU.reply(update.message)
 
 
 async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /help: контакты и инструкция."""
-    await update.message.reply_text(HELP_MESSAGE, parse_mode="Markdown")
+    await responses.HELP.reply(update.message)
 
 
 async def cmd_portfolio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /portfolio: примеры работ."""
-    from config import PORTFOLIO_DIR
-    msg = "📁 *Наше портфолио*\n\nПримеры лендингов. Добавьте изображения в папку `assets/portfolio/` для отображения здесь."
-    await update.message.reply_text(msg, parse_mode="Markdown")
-    if PORTFOLIO_DIR.exists():
-        for f in sorted(PORTFOLIO_DIR.iterdir())[:10]:
-            if f.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"):
-                try:
-                    with open(f, "rb") as fp:
-                        await update.message.reply_photo(photo=fp)
-                except Exception:
-                    pass
+    await responses.PORTFOLIO.reply(update.message)
+    try:
+        await send_portfolio(context.bot, update.effective_chat.id)
+    except Exception as e:
+        logger.warning(f"Не удалось отправить портфолио: {e}")
 
 
 async def cmd_price(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /price: цены и услуги."""
-    await update.message.reply_text(PRICE_LIST, parse_mode="Markdown")
+    await responses.PRICE.reply(update.message)
+
+
+# Ответы на кнопки Reply-меню
+_MENU_BUTTONS = {
+    "💰 Цены и услуги": responses.PRICE_MENU,
+    "❓ FAQ": responses.FAQ_MENU,
+    "👤 Мой кабинет": responses.CABINET,
+}
 
 
 async def handle_main_menu_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка кнопок главного меню (Reply)."""
     text = (update.message and update.message.text) or ""
-    if text == "💰 Цены и услуги":
-        await update.message.reply_text(PRICE_LIST, parse_mode="Markdown", reply_markup=get_main_inline_keyboard())
-    elif text == "❓ FAQ":
-        await update.message.reply_text(FAQ_MESSAGE, parse_mode="Markdown", reply_markup=get_main_inline_keyboard())
-    elif text == "👤 Мой кабинет":
-        await update.message.reply_text(
-            "Проверить статус заявки: /status\nВаши заявки отображаются здесь.",
-            reply_markup=get_main_inline_keyboard(),
-        )
-    else:
-        await update.message.reply_text(
-            "Используйте кнопки меню или команды: /menu, /order, /price",
-            reply_markup=get_main_inline_keyboard(),
-        )
+    await _MENU_BUTTONS.get(text, responses.MENU_HINT).reply(update.message)
 
 
 async def handle_main_menu_inline(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -89,17 +71,13 @@ async def handle_main_menu_inline(update: Update, context: ContextTypes.DEFAULT_
         # cmd_order теперь обрабатывает и callback_query
         return
     elif q.data == "menu_price":
-        await q.edit_message_text(PRICE_LIST, parse_mode="Markdown", reply_markup=get_main_inline_keyboard())
+        await responses.PRICE_MENU.edit(q)
     elif q.data == "menu_faq":
-        await q.edit_message_text(FAQ_MESSAGE, parse_mode="Markdown", reply_markup=get_main_inline_keyboard())
+        await responses.FAQ_MENU.edit(q)
     elif q.data == "menu_status":
         from handlers.order import cmd_status
         # Для статуса нужно отправить новое сообщение, т.к. cmd_status ожидает message
-        await context.bot.send_message(
-            chat_id=q.message.chat_id,
-            text="Проверить статус заявки: /status\nВаши заявки отображаются здесь.",
-            reply_markup=get_main_inline_keyboard(),
-        )
+        await responses.CABINET.send(context.bot, q.message.chat_id)
 
 
 def register_start_handlers(application) -> None:
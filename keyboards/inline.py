@@ -45,27 +45,35 @@ def _make_inline(rows: list[tuple[str, str]], cols: int = 2) -> InlineKeyboardMa
     return InlineKeyboardMarkup(buttons)
 
 
+# Клавиатуры собираются один раз: разметка неизменяемая и одинакова для всех
+QUIZ_BUSINESS_KEYBOARD = _make_inline(BUSINESS_OPTIONS)
+QUIZ_GOAL_KEYBOARD = _make_inline(GOAL_OPTIONS)
+QUIZ_TIMELINE_KEYBOARD = _make_inline(TIMELINE_OPTIONS)
+QUIZ_MATERIALS_KEYBOARD = _make_inline(MATERIALS_OPTIONS)
+CONFIRM_ORDER_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Отправить заявку", callback_data="order_confirm_submit")],
+    [InlineKeyboardButton("❌ Отмена", callback_data="order_confirm_cancel")],
+])
+
+
 def get_quiz_keyboard_business() -> InlineKeyboardMarkup:
-    return _make_inline(BUSINESS_OPTIONS)
+    return QUIZ_BUSINESS_KEYBOARD
 
 
 def get_quiz_keyboard_goal() -> InlineKeyboardMarkup:
-    return _make_inline(GOAL_OPTIONS)
+    return QUIZ_GOAL_KEYBOARD
 
 
 def get_quiz_keyboard_timeline() -> InlineKeyboardMarkup:
-    return _make_inline(TIMELINE_OPTIONS)
+    return QUIZ_TIMELINE_KEYBOARD
 
 
 def get_quiz_keyboard_materials() -> InlineKeyboardMarkup:
-    return _make_inline(MATERIALS_OPTIONS)
+    return QUIZ_MATERIALS_KEYBOARD
 
 
 def get_confirm_order_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("✅ Отправить заявку", callback_data="order_confirm_submit")],
-        [InlineKeyboardButton("❌ Отмена", callback_data="order_confirm_cancel")],
-    ])
+    return CONFIRM_ORDER_KEYBOARD
 
 
 # Маппинг callback_data -> человекочитаемый текст для заявки
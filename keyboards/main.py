@@ -1,27 +1,27 @@
-"""Основные Reply-клавиатуры."""
-from telegram import KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+"""Основные Reply-клавиатуры.
 
+Разметка в python-telegram-bot неизменяемая, поэтому клавиатуры собираются
+один раз при импорте и переиспользуются во всех ответах.
+"""
+from telegram import KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 
-def get_main_keyboard() -> ReplyKeyboardMarkup:
-    """Главное меню (Reply-клавиатура)."""
-    keyboard = [
+# Главное меню (Reply-клавиатура)
+MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    [
         [KeyboardButton("🎯 ЗАКАЗАТЬ САЙТ")],
         [
             KeyboardButton("💰 Цены и услуги"),
             KeyboardButton("❓ FAQ"),
         ],
         [KeyboardButton("👤 Мой кабинет")],
-    ]
-    return ReplyKeyboardMarkup(
-        keyboard,
-        resize_keyboard=True,
-        input_field_placeholder="Выберите действие или введите команду",
-    )
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Выберите действие или введите команду",
+)
 
-
-def get_main_inline_keyboard() -> InlineKeyboardMarkup:
-    """Главное меню (Inline-кнопки для лучшей видимости в темной теме)."""
-    keyboard = [
+# Главное меню (Inline-кнопки для лучшей видимости в темной теме)
+MAIN_INLINE_KEYBOARD = InlineKeyboardMarkup(
+    [
         [InlineKeyboardButton("🎯 ЗАКАЗАТЬ САЙТ", callback_data="menu_order")],
         [
             InlineKeyboardButton("💰 Цены и услуги", callback_data="menu_price"),
@@ -29,17 +29,29 @@ def get_main_inline_keyboard() -> InlineKeyboardMarkup:
         ],
         [InlineKeyboardButton("👤 Мой кабинет", callback_data="menu_status")],
     ]
-    return InlineKeyboardMarkup(keyboard)
+)
+
+# Клавиатура с кнопкой «Отправить контакт»
+CONTACT_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📱 Отправить контакт", request_contact=True)],
+        [KeyboardButton("❌ Отмена")],
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+
+
+def get_main_keyboard() -> ReplyKeyboardMarkup:
+    """Главное меню (Reply-клавиатура)."""
+    return MAIN_KEYBOARD
+
+
+def get_main_inline_keyboard() -> InlineKeyboardMarkup:
+    """Главное меню (Inline-кнопки)."""
+    return MAIN_INLINE_KEYBOARD
 
 
 def get_contact_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура с кнопкой «Отправить контакт»."""
-    keyboard = [
-        [KeyboardButton("📱 Отправить контакт", request_contact=True)],
-        [KeyboardButton("❌ Отмена")],
-    ]
-    return ReplyKeyboardMarkup(
-        keyboard,
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
+    return CONTACT_KEYBOARD
@@ -0,0 +1,16 @@
+"""Общие фикстуры: временная БД со всеми миграциями."""
+import pytest
+
+from database import db
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """Путь к свежей БД (init_db) во временном каталоге; после теста — прежняя БД."""
+    path = tmp_path / "bot.db"
+    previous = db.set_db_path(path)
+    try:
+        db.init_db()
+        yield path
+    finally:
+        db.set_db_path(previous)
@@ -0,0 +1,38 @@
+"""Подготовка копий портфолио: сбой одного оригинала не трогает его готовые копии."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image
+
+from utils.images import ImagePipeline
+
+
+def _copies(pipeline: ImagePipeline) -> list[str]:
+    return sorted(p.name.split(".", 1)[0] for p in pipeline.photo_dir.iterdir())
+
+
+def test_failed_source_keeps_copies_and_is_retried(tmp_path):
+    source_dir = tmp_path / "portfolio"
+    source_dir.mkdir()
+    for name, color in (("a", "red"), ("b", "blue")):
+        Image.new("RGB", (2000, 1000), color).save(source_dir / f"{name}.png")
+    pipeline = ImagePipeline(source_dir, tmp_path / "cache", workers=1)
+
+    async def scenario():
+        first = await pipeline.refresh()
+        (source_dir / "b.png").write_bytes(b"not an image")
+        broken = await pipeline.refresh(force=True)
+        copies = _copies(pipeline)
+        # Папка не менялась, но прошлый проход был неполным — повтор не пропускается
+        retried = await pipeline.refresh()
+        return first, broken, copies, retried
+
+    try:
+        assert asyncio.run(scenario()) == (2, 1, ["a", "b"], 1)
+    finally:
+        pipeline.shutdown()
+    with Image.open(next(pipeline.photo_dir.glob("a.*"))) as img:
+        assert max(img.size) == pipeline.params.max_side
@@ -0,0 +1,49 @@
+"""Миграции: горячие запросы идут по индексам, а не полным просмотром таблиц."""
+import re
+import sqlite3
+
+import pytest
+
+from database import db
+from database.migrations import MIGRATIONS
+from database.pool import count_queries
+
+HOT_QUERIES = [
+    (lambda: db.count_orders_last_hour(100), "idx_orders_user_created"),
+    (lambda: db.get_last_order_by_telegram_user(100), "idx_orders_user_created"),
+    (lambda: db.get_orders_new_longer_than_hours(2), "idx_orders_status_created"),
+    (lambda: list(db.iter_orders_for_export("2024-01-01", "2024-02-01")), "idx_orders_created"),
+    (lambda: db.get_recent_order_hits(60), "idx_orders_created"),
+    (lambda: db.get_orders_changed_since("2024-01-01 00:00:00"), "idx_orders_updated"),
+    (lambda: db.claim_due_notifications(10), "idx_outbox_status_next"),
+]
+
+
+def _query_plan(path, call) -> str:
+    with count_queries() as queries:
+        call()
+    selects = [s for s in queries.statements if s.lstrip().upper().startswith("SELECT")]
+    assert selects, "функция не выполнила SELECT"
+    with sqlite3.connect(path) as conn:
+        return "\n".join(
+            row[3] for sql in selects for row in conn.execute("EXPLAIN QUERY PLAN " + sql)
+        )
+
+
+@pytest.mark.parametrize("call, index", HOT_QUERIES)
+def test_hot_query_uses_index(temp_db, call, index):
+    plan = _query_plan(temp_db, call)
+    assert re.search(rf"SEARCH \w+ USING (COVERING )?INDEX {index}\b", plan), plan
+
+
+def test_schema_version_is_latest(temp_db):
+    with sqlite3.connect(temp_db) as conn:
+        version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    assert version == MIGRATIONS[-1][0]
+
+
+def test_init_db_is_idempotent(temp_db):
+    db.init_db()
+    with sqlite3.connect(temp_db) as conn:
+        versions = [r[0] for r in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [m[0] for m in MIGRATIONS]
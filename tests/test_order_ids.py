@@ -0,0 +1,106 @@
+"""Номера заявок: уникальны при параллельной записи из процессов и потоков, день — по UTC."""
+import multiprocessing
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database import db
+
+PROCESSES = 3
+THREADS = 4
+ORDERS_PER_THREAD = 15
+ORDER_ID = re.compile(r"#(\d{4})-(\d{2})(\d{2})-(\d{3,})")
+
+
+def _create_orders(path: str, block_size: int, threads: int, count: int) -> list[str]:
+    """Заявки из нескольких потоков одного процесса (цель дочернего процесса)."""
+    db.ORDER_SEQ_BLOCK_SIZE = block_size
+    db.set_db_path(path)
+    try:
+        with ThreadPoolExecutor(threads) as pool:
+            batches = pool.map(
+                lambda t: [
+                    db.create_order(1000 + t, "бизнес", "цель", "бюджет", "срок", "нет", "звонок", "+79000000000")
+                    for _ in range(count)
+                ],
+                range(threads),
+            )
+            return [order_id for batch in batches for order_id in batch]
+    finally:
+        db.close_pool()
+
+
+def _rows(path) -> list[tuple[str, str]]:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT order_id, created_at FROM orders").fetchall()
+
+
+@pytest.fixture
+def block_size(request, monkeypatch):
+    monkeypatch.setattr(db, "ORDER_SEQ_BLOCK_SIZE", request.param)
+    monkeypatch.setattr(db, "_order_blocks", db._OrderNumberBlocks())
+    return request.param
+
+
+@pytest.mark.parametrize("block_size", [1, 7], indirect=True)
+def test_order_ids_unique_across_processes_and_threads(temp_db, block_size):
+    db.close_pool()
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(PROCESSES) as pool:
+        results = pool.starmap(
+            _create_orders, [(str(temp_db), block_size, THREADS, ORDERS_PER_THREAD)] * PROCESSES
+        )
+    ids = [order_id for result in results for order_id in result]
+    total = PROCESSES * THREADS * ORDERS_PER_THREAD
+    assert len(ids) == total
+    assert len(set(ids)) == total
+    assert sorted(order_id for order_id, _ in _rows(temp_db)) == sorted(ids)
+
+    numbers = sorted(int(ORDER_ID.fullmatch(order_id).group(4)) for order_id in ids)
+    if block_size == 1:
+        # Без блоков номера идут подряд, без пропусков
+        assert numbers == list(range(1, total + 1))
+    else:
+        # Блоки выдаются целиком: пропуски только в хвостах блоков процессов
+        assert numbers[-1] <= total + PROCESSES * block_size
+
+
+class _LateEveningUTC(datetime):
+    """23:30 UTC, когда в UTC+3 уже следующий день."""
+
+    @classmethod
+    def now(cls, tz=None):
+        instant = datetime(2024, 3, 15, 23, 30, tzinfo=timezone.utc)
+        if tz is None:
+            return instant.astimezone(timezone(timedelta(hours=3))).replace(tzinfo=None)
+        return instant.astimezone(tz)
+
+
+@pytest.mark.parametrize("block_size", [1, 7], indirect=True)
+def test_order_id_day_is_utc(temp_db, block_size, monkeypatch):
+    monkeypatch.setattr(db, "datetime", _LateEveningUTC)
+    order_id = db.create_order(1, "бизнес", "цель", "бюджет", "срок", "нет", "звонок", "+79000000000")
+    assert order_id == "#2024-0315-001"
+    with sqlite3.connect(temp_db) as conn:
+        assert conn.execute("SELECT day FROM order_sequences").fetchall() == [("2024-03-15",)]
+
+
+def test_order_id_day_matches_created_at(temp_db):
+    for _ in range(3):
+        db.create_order(1, "бизнес", "цель", "бюджет", "срок", "нет", "звонок", "+79000000000")
+    for order_id, created_at in _rows(temp_db):
+        year, month, day, _ = ORDER_ID.fullmatch(order_id).groups()
+        assert f"{year}-{month}-{day}" == created_at[:10]
+
+
+def test_number_block_is_scoped_to_day():
+    blocks = db._OrderNumberBlocks()
+    blocks.put("2024-03-15", 5, 10)
+    assert blocks.take("2024-03-16") is None
+    assert blocks.take("2024-03-15") == 5
+    blocks.put("2024-03-16", 1, 3)
+    # Блок прошлого дня отброшен
+    assert blocks.take("2024-03-15") is None
@@ -0,0 +1,84 @@
+"""Outbox: ошибки БД при доставке и падение цикла не останавливают рассылку."""
+import asyncio
+import sqlite3
+
+from database import adb, db
+from utils.outbox import OutboxDispatcher
+from utils.ratelimit import ChatRateLimiter, TokenBucket
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.sent: list[tuple[int, str]] = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def _dispatcher() -> OutboxDispatcher:
+    return OutboxDispatcher(
+        bucket=TokenBucket(1000), chat_limiter=ChatRateLimiter(0, 0), poll_interval=0.05, batch_size=10
+    )
+
+
+def _statuses(path) -> list[str]:
+    with sqlite3.connect(path) as conn:
+        return [r[0] for r in conn.execute("SELECT status FROM notification_outbox ORDER BY id")]
+
+
+async def _run_until_sent(dispatcher: OutboxDispatcher, bot: FakeBot, path, timeout: float = 5.0) -> None:
+    async def all_sent() -> None:
+        while _statuses(path) != ["sent", "sent"]:
+            await asyncio.sleep(0.02)
+
+    await dispatcher.start(bot)
+    try:
+        await asyncio.wait_for(all_sent(), timeout)
+    finally:
+        await dispatcher.stop()
+
+
+def _submit_with_notifications() -> str:
+    return db.submit_order(
+        1, "client", "Клиент", "+79000000000", "Кафе", "Заявки", "до 50 000",
+        notifications=lambda order_id: [(10, f"Заявка {order_id}"), (20, f"Заявка {order_id}")],
+    )
+
+
+def test_db_error_is_rescheduled(temp_db, monkeypatch, caplog):
+    _submit_with_notifications()
+    mark_sent = adb.mark_notification_sent
+    failures = []
+
+    async def flaky_mark_sent(notification_id):
+        if not failures:
+            failures.append(notification_id)
+            raise sqlite3.OperationalError("database is locked")
+        await mark_sent(notification_id)
+
+    monkeypatch.setattr(adb, "mark_notification_sent", flaky_mark_sent)
+    bot = FakeBot()
+    asyncio.run(_run_until_sent(_dispatcher(), bot, temp_db))
+    # Уведомление с ошибкой отметки отправлено повторно (доставка «хотя бы раз»)
+    assert sorted(chat for chat, _ in bot.sent) in ([10, 10, 20], [10, 20, 20])
+    assert "ошибка доставки уведомления" in caplog.text
+
+
+def test_crashed_loop_restarts(temp_db, caplog):
+    _submit_with_notifications()
+    dispatcher = _dispatcher()
+    loop = dispatcher._loop
+    calls = []
+
+    async def crashing_loop(delay=0.0):
+        calls.append(delay)
+        if len(calls) == 1:
+            raise RuntimeError("сбой цикла")
+        await loop(delay)
+
+    dispatcher._loop = crashing_loop
+    bot = FakeBot()
+    asyncio.run(_run_until_sent(dispatcher, bot, temp_db))
+    assert calls == [0.0, dispatcher.poll_interval]
+    assert sorted(chat for chat, _ in bot.sent) == [10, 20]
+    assert "перезапуск" in caplog.text
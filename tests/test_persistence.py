@@ -0,0 +1,67 @@
+"""SQLitePersistence: отменённая или неудачная запись не теряет накопленные изменения."""
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import adb
+from database.persistence import SQLitePersistence
+
+
+def _saved_users(path) -> dict[int, str]:
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT user_id, data FROM persistence_user_data"))
+
+
+@pytest.fixture
+def slow_save(monkeypatch):
+    """save_persistence, который ждёт release перед настоящей записью."""
+    save = adb.save_persistence
+    release = asyncio.Event()
+
+    async def slow(users, conversations):
+        await release.wait()
+        await save(users, conversations)
+
+    monkeypatch.setattr(adb, "save_persistence", slow)
+    return release
+
+
+def test_cancelled_write_keeps_changes_for_flush(temp_db, slow_save):
+    async def scenario():
+        persistence = SQLitePersistence(flush_delay=0)
+        await persistence.update_user_data(1, {"step": "goal"})
+        await persistence.update_conversation("quiz", (1, 1), 2)
+        await asyncio.sleep(0.01)
+        # Отложенная запись ждёт БД; остановка бота отменяет её в flush
+        assert persistence._flush_task is not None and not persistence._flush_task.done()
+        slow_save.set()
+        persistence._flush_task.cancel()
+        await asyncio.sleep(0)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert _saved_users(temp_db) == {1: '{"step":"goal"}'}
+    with sqlite3.connect(temp_db) as conn:
+        assert conn.execute("SELECT name, key, state FROM persistence_conversations").fetchall() == [("quiz", "[1,1]", "2")]
+
+
+def test_failed_write_keeps_newer_changes(temp_db, monkeypatch):
+    save = adb.save_persistence
+
+    async def failing(users, conversations):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def scenario():
+        persistence = SQLitePersistence(flush_delay=3600)
+        await persistence.update_user_data(1, {"step": "goal"})
+        monkeypatch.setattr(adb, "save_persistence", failing)
+        with pytest.raises(sqlite3.OperationalError):
+            await persistence._write()
+        # Более свежее значение не затирается возвращённым из неудачной записи
+        await persistence.update_user_data(1, {"step": "contact"})
+        monkeypatch.setattr(adb, "save_persistence", save)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert _saved_users(temp_db) == {1: '{"step":"contact"}'}
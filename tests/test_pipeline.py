@@ -0,0 +1,181 @@
+"""Потоковая выгрузка: курсоры приёмников, очистка журнала и предел отставания."""
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import adb, db
+from utils.pipeline import ExportPipeline, ExportSink
+
+WINDOW = 3600  # циклы приёмников не просыпаются сами: шаги вызываются тестом
+
+
+class RecordingSink(ExportSink):
+    def __init__(self, name: str = "recording", window: float = WINDOW) -> None:
+        super().__init__(name, window)
+        self.batches: list[list[dict]] = []
+
+    async def write(self, records: list[dict]) -> None:
+        self.batches.append(records)
+
+
+class FailingSink(ExportSink):
+    def __init__(self, name: str = "failing") -> None:
+        super().__init__(name, WINDOW)
+
+    async def write(self, records: list[dict]) -> None:
+        raise ConnectionError("приёмник недоступен")
+
+
+def _add_orders(*numbers: int) -> None:
+    with db.get_connection() as conn:
+        for number in numbers:
+            conn.execute("INSERT OR IGNORE INTO users (user_id, full_name) VALUES (?, ?)", (number, f"Клиент {number}"))
+            user_pk = conn.execute("SELECT id FROM users WHERE user_id = ?", (number,)).fetchone()["id"]
+            conn.execute("INSERT INTO orders (order_id, user_id, phone) VALUES (?, ?, ?)", (f"#A-{number:03d}", user_pk, "+7"))
+        conn.commit()
+
+
+def _event_ids(path) -> list[int]:
+    with sqlite3.connect(path) as conn:
+        return [r[0] for r in conn.execute("SELECT id FROM order_events ORDER BY id")]
+
+
+def _cursors(path) -> dict[str, str]:
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT name, value FROM sync_state WHERE name LIKE 'export:%'"))
+
+
+def test_sink_must_implement_write():
+    class Incomplete(ExportSink):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", 1)
+
+
+def test_batch_is_coalesced_and_journal_pruned(temp_db):
+    async def scenario():
+        sink = RecordingSink()
+        pipeline = ExportPipeline([sink])
+        await pipeline.start()
+        _add_orders(1, 2)
+        db.update_order_status("#A-001", "in_progress")
+        await pipeline.runners[0].step()
+        pruned = await pipeline.prune()
+        await pipeline.stop()
+        return sink.batches, pruned
+
+    batches, pruned = asyncio.run(scenario())
+    assert [[(r["order_id"], r["event"], r["status"]) for r in batch] for batch in batches] == [
+        [("#A-002", "created", "new"), ("#A-001", "created", "in_progress")]
+    ]
+    assert pruned == 3
+    assert _event_ids(temp_db) == []
+
+
+def test_failing_sink_holds_journal_within_limit(temp_db):
+    async def scenario():
+        pipeline = ExportPipeline([RecordingSink(), FailingSink()], max_lag_events=10, max_lag_days=0)
+        await pipeline.start()
+        _add_orders(1, 2, 3)
+        for runner in pipeline.runners:
+            await runner.step()
+        pruned = await pipeline.prune()
+        await pipeline.stop()
+        return pruned
+
+    assert asyncio.run(scenario()) == 0
+    assert len(_event_ids(temp_db)) == 3
+    assert _cursors(temp_db) == {"export:recording": "3", "export:failing": "0"}
+
+
+def test_db_error_does_not_stop_runner(temp_db, monkeypatch, caplog):
+    get_events = adb.get_order_events
+    calls = []
+
+    async def flaky_get_events(after_id, limit):
+        calls.append(after_id)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return await get_events(after_id, limit)
+
+    monkeypatch.setattr(adb, "get_order_events", flaky_get_events)
+
+    async def scenario():
+        sink = RecordingSink(window=0.05)
+        pipeline = ExportPipeline([sink])
+        await pipeline.start()
+        _add_orders(1, 2)
+        for _ in range(100):
+            if sink.batches:
+                break
+            await asyncio.sleep(0.02)
+        stats = pipeline.stats()[0]
+        await pipeline.stop()
+        return sink.batches, stats
+
+    batches, stats = asyncio.run(scenario())
+    # Цикл пережил ошибку чтения журнала и отправил пакет при следующей попытке
+    assert [r["order_id"] for r in batches[0]] == ["#A-001", "#A-002"]
+    assert stats["failures"] == 1 and "database is locked" in stats["last_error"]
+    assert "Выгрузка остановилась с ошибкой" not in caplog.text
+    assert _cursors(temp_db) == {"export:recording": "2"}
+
+
+def test_sink_past_event_limit_is_skipped(temp_db, caplog):
+    async def scenario():
+        pipeline = ExportPipeline([RecordingSink(), FailingSink()], max_lag_events=2, max_lag_days=0)
+        await pipeline.start()
+        _add_orders(1, 2, 3, 4, 5)
+        for runner in pipeline.runners:
+            await runner.step()
+        first = await pipeline.prune()
+        second = await pipeline.prune()
+        stats = {s["name"]: s for s in pipeline.stats()}
+        await pipeline.stop()
+        return first, second, stats
+
+    first, second, stats = asyncio.run(scenario())
+    # Отставший приёмник не держит журнал: удалено всё, кроме последних max_lag_events событий
+    assert (first, second) == (3, 0)
+    assert _event_ids(temp_db) == [4, 5]
+    assert _cursors(temp_db)["export:failing"] == "3"
+    assert stats["failing"]["skipped"] == 3 and stats["recording"]["skipped"] == 0
+    assert "Выгрузка failing: отставание больше предела, пропущено событий: 3" in caplog.text
+
+
+def test_sink_past_age_limit_is_skipped(temp_db):
+    async def scenario():
+        pipeline = ExportPipeline([FailingSink()], max_lag_events=0, max_lag_days=7)
+        await pipeline.start()
+        _add_orders(1, 2, 3)
+        with sqlite3.connect(temp_db) as conn:
+            conn.execute("UPDATE order_events SET created_at = datetime('now', '-8 days') WHERE id <= 2")
+        pruned = await pipeline.prune()
+        await pipeline.stop()
+        return pruned
+
+    assert asyncio.run(scenario()) == 2
+    assert _event_ids(temp_db) == [3]
+
+
+def test_cursors_of_removed_sinks_are_deleted(temp_db, caplog):
+    db.set_sync_state("export:webhook", "0")
+    db.set_sync_state("sheets:sheet", "2024-01-01 00:00:00")
+
+    async def scenario():
+        pipeline = ExportPipeline([RecordingSink()])
+        await pipeline.start()
+        _add_orders(1)
+        await pipeline.runners[0].step()
+        # Курсор удалённого приёмника больше не держит журнал
+        pruned = await pipeline.prune()
+        await pipeline.stop()
+        return pruned
+
+    assert asyncio.run(scenario()) == 1
+    assert _cursors(temp_db) == {"export:recording": "1"}
+    assert [row["name"] for row in db.get_export_backlog()] == ["recording"]
+    assert db.get_sync_state("sheets:sheet") is not None
+    assert "удалены курсоры выключенных приёмников: webhook" in caplog.text
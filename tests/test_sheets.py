@@ -0,0 +1,172 @@
+"""SheetsSync против поддельного клиента gspread: строки на месте, повторы, старый лист."""
+import asyncio
+import re
+
+import pytest
+
+from database import db
+from utils.sheets import HEADER, SheetsSync
+
+
+class _Response:
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+
+
+class APIError(Exception):
+    """Как gspread.exceptions.APIError: код ответа в error.response.status_code."""
+
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"APIError {status_code}")
+        self.response = _Response(status_code)
+
+
+class FakeWorksheet:
+    """Лист: ячейки по строкам, сетка фиксированного размера, как в Google Sheets."""
+
+    def __init__(self, rows=None, row_count: int = 1000) -> None:
+        self.rows = {number: list(row) for number, row in enumerate(rows or [], 1)}
+        self.row_count = row_count
+        self.calls: list = []
+        self.failures: list[Exception] = []
+
+    def values(self) -> list[list[str]]:
+        return [self.rows.get(number, []) for number in range(1, max(self.rows, default=0) + 1)]
+
+    def _write(self, range_name: str, values: list[list[str]]) -> None:
+        first, last = map(int, re.fullmatch(r"A(\d+):E(\d+)", range_name).groups())
+        assert first == last and last <= self.row_count, f"{range_name} за пределами сетки ({self.row_count})"
+        self.rows[first] = values[0]
+
+    def get_all_values(self):
+        self.calls.append("get_all_values")
+        return self.values()
+
+    def update(self, range_name, values):
+        self.calls.append("update")
+        self._write(range_name, values)
+
+    def batch_update(self, data, value_input_option=None):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.calls.append(("batch_update", len(data)))
+        for item in data:
+            self._write(item["range"], item["values"])
+
+    def add_rows(self, rows):
+        self.calls.append(("add_rows", rows))
+        self.row_count += rows
+
+
+class FakeClient:
+    def __init__(self, worksheet: FakeWorksheet) -> None:
+        self.worksheet = worksheet
+        self.opened = 0
+
+    def open_by_key(self, key):
+        self.opened += 1
+        return type("Spreadsheet", (), {"sheet1": self.worksheet})()
+
+
+def _add_order(number: int, status: str = "new") -> str:
+    order_id = f"#A-{number:03d}"
+    with db.get_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO users (user_id, full_name) VALUES (?, ?)", (number, f"Клиент {number}"))
+        user_pk = conn.execute("SELECT id FROM users WHERE user_id = ?", (number,)).fetchone()["id"]
+        conn.execute(
+            "INSERT INTO orders (order_id, user_id, phone, status) VALUES (?, ?, ?, ?)",
+            (order_id, user_pk, f"+7900000{number:04d}", status),
+        )
+        conn.commit()
+    return order_id
+
+
+def _sync(worksheet: FakeWorksheet, **kwargs) -> SheetsSync:
+    kwargs.setdefault("batch_size", 2)
+    return SheetsSync(sheet_id="sheet", client_factory=lambda: FakeClient(worksheet), sleep=lambda delay: None, **kwargs)
+
+
+def _order_ids(worksheet: FakeWorksheet) -> list[str]:
+    return [row[1] for row in worksheet.values()]
+
+
+def test_header_and_grid_growth(temp_db):
+    for number in (1, 2, 3):
+        _add_order(number)
+    worksheet = FakeWorksheet(row_count=2)
+    result = _sync(worksheet).sync()
+    assert (result.appended, result.updated, result.unchanged) == (3, 0, 0)
+    assert worksheet.rows[1] == HEADER
+    assert _order_ids(worksheet) == [HEADER[1], "#A-001", "#A-002", "#A-003"]
+    # Лист расширяется перед записью за пределы сетки (batch_update этого не делает)
+    assert any(call[0] == "add_rows" for call in worksheet.calls if isinstance(call, tuple))
+    assert worksheet.row_count >= 4
+
+
+def test_rerun_is_noop_and_status_updates_in_place(temp_db):
+    for number in (1, 2, 3):
+        _add_order(number)
+    worksheet = FakeWorksheet()
+    sync = _sync(worksheet)
+    sync.sync()
+    worksheet.calls.clear()
+
+    result = sync.sync()
+    assert (result.appended, result.updated) == (0, 0)
+    assert worksheet.calls == []
+
+    db.update_order_status("#A-002", "in_progress")
+    result = sync.sync()
+    assert (result.appended, result.updated) == (0, 1)
+    assert worksheet.calls == [("batch_update", 1)]
+    assert worksheet.rows[3][1:] == ["#A-002", "Клиент 2", "+79000000002", "in_progress"]
+    assert _order_ids(worksheet) == [HEADER[1], "#A-001", "#A-002", "#A-003"]
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_transient_errors_are_retried(temp_db, status):
+    _add_order(1)
+    worksheet = FakeWorksheet()
+    delays = []
+    worksheet.failures = [APIError(status), APIError(status)]
+    sync = SheetsSync(sheet_id="sheet", client_factory=lambda: FakeClient(worksheet), sleep=delays.append, retries=3, backoff=1)
+    assert sync.sync().appended == 1
+    # Экспоненциальная задержка со случайной долей: backoff * 2^попытка * [0.5, 1]
+    assert len(delays) == 2 and 0.5 <= delays[0] <= 1 <= delays[1] <= 2
+    assert worksheet.rows[2][1] == "#A-001"
+
+
+def test_client_error_fails_and_next_run_resumes(temp_db, caplog):
+    _add_order(1)
+    worksheet = FakeWorksheet()
+    sync = _sync(worksheet)
+    sync.sync()
+    _add_order(2)
+    worksheet.failures = [APIError(400), APIError(400)]
+    with pytest.raises(APIError):
+        sync.sync()
+    # Без повторов: вторая ошибка осталась в очереди
+    assert len(worksheet.failures) == 1
+    assert asyncio.run(sync.run()) is None
+    assert "Ошибка синхронизации с Google Sheets" in caplog.text
+    # Отметка не сдвинулась: следующий запуск выгружает пропущенное
+    assert asyncio.run(sync.run()).appended == 1
+    assert _order_ids(worksheet) == [HEADER[1], "#A-001", "#A-002"]
+
+
+def test_legacy_sheet_is_adopted(temp_db):
+    for number in (1, 2, 3):
+        _add_order(number)
+    # Старый экспорт: заголовок, дописанные в конец строки, дубль строки заявки
+    worksheet = FakeWorksheet([
+        HEADER,
+        ["2024-01-01", "#A-001", "Клиент 1", "+79000000001", "new"],
+        ["2024-01-01", "#A-002", "Клиент 2", "+79000000002", "new"],
+        ["2024-01-01", "#A-002", "Клиент 2", "+79000000002", "new"],
+    ])
+    result = _sync(worksheet).sync()
+    # Известные заявки переписываются на своих строках, новая — после последней занятой
+    assert (result.appended, result.updated) == (1, 2)
+    assert _order_ids(worksheet) == [HEADER[1], "#A-001", "#A-002", "#A-002", "#A-003"]
+    assert worksheet.rows[1] == HEADER
+    assert "update" not in worksheet.calls
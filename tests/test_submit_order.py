@@ -0,0 +1,72 @@
+"""submit_order: одна транзакция, известное число выражений, откат целиком."""
+import sqlite3
+
+import pytest
+
+from database import db
+from database.pool import count_queries
+
+TABLES = ("users", "orders", "analytics", "notification_outbox", "order_events", "order_sequences")
+
+
+def _submit(user_id: int = 42, notifications=None) -> str:
+    return db.submit_order(
+        user_id, "client", "Клиент", "+79001234567", "Кафе", "Заявки", "до 50 000",
+        notifications=notifications,
+    )
+
+
+def _counts(path) -> dict[str, int]:
+    with sqlite3.connect(path) as conn:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TABLES}
+
+
+@pytest.fixture(autouse=True)
+def single_number_blocks(monkeypatch):
+    monkeypatch.setattr(db, "ORDER_SEQ_BLOCK_SIZE", 1)
+
+
+@pytest.mark.parametrize("recipients", [0, 2])
+def test_submit_order_statements(temp_db, recipients):
+    _submit()
+    with count_queries() as queries:
+        order_id = _submit(notifications=lambda oid: [(100 + i, f"Заявка {oid}") for i in range(recipients)])
+    assert queries.executed == 8 + recipients
+    # Одна транзакция на подключении-писателе
+    statements = [s.strip() for s in queries.statements]
+    assert statements.count("BEGIN") == 1
+    assert statements.count("COMMIT") == 1
+    assert statements[0] == "BEGIN" and statements[-1] == "COMMIT"
+
+    with sqlite3.connect(temp_db) as conn:
+        user = conn.execute("SELECT id, phone FROM users WHERE user_id = 42").fetchone()
+        assert user[1] == "+79001234567"
+        assert conn.execute("SELECT user_id, status FROM orders WHERE order_id = ?", (order_id,)).fetchone() == (user[0], "new")
+        assert conn.execute(
+            "SELECT COUNT(*) FROM analytics WHERE event_type = 'order_created' AND order_id = ?", (order_id,)
+        ).fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM notification_outbox WHERE order_id = ?", (order_id,)).fetchone()[0] == recipients
+
+
+def _raise(order_id):
+    raise RuntimeError("не удалось подготовить уведомления")
+
+
+def _without_text(order_id):
+    # NOT NULL у text — ошибка SQLite на последнем шаге перед COMMIT
+    return [(1, "текст"), (2, None)]
+
+
+@pytest.mark.parametrize("notifications, error", [(_raise, RuntimeError), (_without_text, sqlite3.IntegrityError)])
+def test_failed_step_rolls_back_everything(temp_db, notifications, error):
+    _submit(user_id=7)
+    before = _counts(temp_db)
+    with pytest.raises(error):
+        _submit(user_id=8, notifications=notifications)
+    # Ни пользователя, ни заявки, ни события, ни уведомлений, ни номера
+    assert _counts(temp_db) == before
+    with sqlite3.connect(temp_db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users WHERE user_id = 8").fetchone()[0] == 0
+        assert conn.execute("SELECT last_value FROM order_sequences").fetchall() == [(1,)]
+    # Писатель пула не остался в транзакции: следующая заявка проходит и получает следующий номер
+    assert _submit(user_id=8).endswith("-002")
@@ -0,0 +1,192 @@
+"""Режим вебхука: встроенный сервер на порту 0, Application без сети (getMe подменён)."""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from telegram import User
+from telegram.ext import Application, ExtBot, MessageHandler, filters
+
+from utils import webhook
+from utils.httpserver import HTTPServer
+
+SECRET = "s3cret"
+
+
+@pytest.fixture(autouse=True)
+def offline_bot(monkeypatch):
+    async def initialize(self):
+        self._bot_user = User(1, "bot", True, username="bot")
+        self._initialized = True
+
+    async def shutdown(self):
+        pass
+
+    monkeypatch.setattr(ExtBot, "initialize", initialize)
+    monkeypatch.setattr(ExtBot, "shutdown", shutdown)
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET_TOKEN", SECRET)
+    monkeypatch.setattr(webhook, "WEBHOOK_URL", "")
+    monkeypatch.setattr(webhook, "WEBHOOK_DRAIN_TIMEOUT", 3)
+
+
+def _update(update_id: int, text: str) -> bytes:
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 5, "type": "private"},
+            "from": {"id": 5, "is_bot": False, "first_name": "Клиент"},
+            "text": text,
+        },
+    }).encode()
+
+
+def _post(body: bytes, secret: str = SECRET, close: bool = True) -> bytes:
+    head = f"POST /telegram HTTP/1.1\r\nHost: bot\r\nContent-Length: {len(body)}\r\nX-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+    return (head + ("Connection: close\r\n" if close else "") + "\r\n").encode() + body
+
+
+def _get(path: str) -> bytes:
+    return f"GET {path} HTTP/1.1\r\nHost: bot\r\nConnection: close\r\n\r\n".encode()
+
+
+async def _request(port: int, data: bytes) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+@asynccontextmanager
+async def _webhook(max_connections: int = 10, handler_delay: float = 0.0):
+    """Запущенный serve_webhook; на выходе — остановка, как по SIGTERM. Отдаёт (порт, полученные тексты, stop)."""
+    received: list[str] = []
+
+    async def on_message(update, context):
+        await asyncio.sleep(handler_delay)
+        received.append(update.message.text)
+
+    application = Application.builder().token("1:abc").build()
+    application.add_handler(MessageHandler(filters.TEXT, on_message))
+    server = HTTPServer("127.0.0.1", 0, max_connections=max_connections)
+    stop = asyncio.Event()
+    task = asyncio.create_task(webhook.serve_webhook(application, stop_event=stop, server=server))
+    while server._server is None:
+        await asyncio.sleep(0.01)
+    try:
+        yield server.bound_port, received, stop
+    finally:
+        stop.set()
+        await asyncio.wait_for(task, 10)
+
+
+def test_update_is_accepted_and_processed():
+    async def scenario():
+        async with _webhook() as (port, received, _):
+            assert await _request(port, _post(_update(1, "привет"))) == 200
+        # Полученные апдейты обработаны до остановки
+        return received
+
+    assert asyncio.run(scenario()) == ["привет"]
+
+
+def test_health_and_readiness():
+    async def scenario():
+        async with _webhook() as (port, _, _):
+            return await _request(port, _get("/healthz")), await _request(port, _get("/readyz"))
+
+    assert asyncio.run(scenario()) == (200, 200)
+
+
+@pytest.mark.parametrize(
+    "data, status",
+    [
+        (_post(_update(1, "a"), secret="wrong"), 403),
+        (_post(_update(1, "a"), secret=""), 403),
+        (_post(b"{oops"), 400),
+        (_post(b"[]"), 400),
+        (_get("/nope"), 404),
+        (_get("/telegram"), 405),
+        (b"garbage\r\n\r\n", 400),
+    ],
+)
+def test_rejected_requests(data, status):
+    async def scenario():
+        async with _webhook() as (port, received, _):
+            return await _request(port, data), received
+
+    assert asyncio.run(scenario()) == (status, [])
+
+
+@pytest.mark.parametrize(
+    "data, status",
+    [
+        (f"GET /{'a' * 70000} HTTP/1.1\r\n\r\n".encode(), 400),
+        (f"GET /healthz HTTP/1.1\r\nX-Big: {'a' * 70000}\r\n\r\n".encode(), 431),
+    ],
+    ids=["request-line", "header"],
+)
+def test_oversized_line_is_rejected(data, status):
+    async def scenario():
+        async with _webhook() as (port, _, _):
+            # Строка длиннее лимита StreamReader: ответ об ошибке, сервер продолжает работать
+            return await _request(port, data), await _request(port, _get("/healthz"))
+
+    assert asyncio.run(scenario()) == (status, 200)
+
+
+def test_keep_alive_serves_several_requests_on_one_connection():
+    async def scenario():
+        async with _webhook() as (port, received, _):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            statuses = []
+            for i in (1, 2, 3):
+                writer.write(_post(_update(i, f"сообщение {i}"), close=False))
+                await writer.drain()
+                statuses.append(int((await reader.readuntil(b"\r\n")).split(b" ", 2)[1]))
+                await reader.readuntil(b"\r\n\r\nOK")
+            writer.close()
+            return statuses, received
+
+    statuses, received = asyncio.run(scenario())
+    assert statuses == [200, 200, 200]
+    assert received == ["сообщение 1", "сообщение 2", "сообщение 3"]
+
+
+def test_connection_limit_returns_503():
+    async def scenario():
+        async with _webhook(max_connections=2) as (port, _, _):
+            held = [await asyncio.open_connection("127.0.0.1", port) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            over_limit = await _request(port, _get("/healthz"))
+            for _, writer in held:
+                writer.close()
+            await asyncio.sleep(0.05)
+            return over_limit, await _request(port, _get("/healthz"))
+
+    assert asyncio.run(scenario()) == (503, 200)
+
+
+def test_drain_finishes_request_in_flight():
+    async def scenario():
+        async with _webhook(handler_delay=0.2) as (port, received, stop):
+            data = _post(_update(9, "в пути"))
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            # Запрос начат, тело ещё не дошло — тут приходит SIGTERM
+            writer.write(data[:-10])
+            await writer.drain()
+            await asyncio.sleep(0.05)
+            stop.set()
+            await asyncio.sleep(0.1)
+            writer.write(data[-10:])
+            await writer.drain()
+            status = int((await reader.read()).split(b" ", 2)[1])
+            writer.close()
+            with pytest.raises(OSError):
+                await asyncio.open_connection("127.0.0.1", port)
+        return status, received
+
+    assert asyncio.run(scenario()) == (200, ["в пути"])
@@ -0,0 +1,290 @@
+"""Рассылка сообщений пользователям с учётом лимитов Telegram.
+
+BroadcastJobs хранит рассылки в БД (broadcast_jobs / broadcast_deliveries),
+поэтому после перезапуска они продолжаются без повторной отправки.
+
+Несколько воркеров отправляют параллельно, каждый берёт токен из общего
+ведра бота (telegram_bucket) и слот чата. RetryAfter приостанавливает всё
+ведро, сетевые ошибки повторяются с экспоненциальной задержкой,
+Forbidden означает, что пользователь заблокировал бота.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+from config import (
+    BROADCAST_CHUNK_SIZE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_PROGRESS_INTERVAL,
+)
+from database import adb
+from utils.ratelimit import ChatRateLimiter, TokenBucket, telegram_bucket
+
+logger = logging.getLogger("bot")
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+
+@dataclass
+class BroadcastResult:
+    """Итог рассылки."""
+
+    total: int = 0
+    delivered: int = 0
+    blocked: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.delivered + self.blocked + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def format(self, title: str = "Рассылка") -> str:
+        return (
+            f"📣 {title}: {self.done} из {self.total}\n"
+            f"✅ Доставлено: {self.delivered}\n"
+            f"🚫 Заблокировали бота: {self.blocked}\n"
+            f"⚠️ Ошибки: {self.failed}\n"
+            f"⏱ {self.elapsed:.0f} с"
+        )
+
+
+class BroadcastEngine:
+    """Отправка одного текста списку чатов с ограничением скорости и повторами."""
+
+    def __init__(
+        self,
+        bot,
+        bucket: TokenBucket = telegram_bucket,
+        chat_limiter: Optional[ChatRateLimiter] = None,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+    ) -> None:
+        self.bot = bot
+        self.bucket = bucket
+        self.chat_limiter = chat_limiter or ChatRateLimiter()
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> tuple[str, str]:
+        """Отправить одно сообщение. Возвращает (статус, текст ошибки)."""
+        attempt = 0
+        while True:
+            await self.chat_limiter.acquire(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return SENT, ""
+            except RetryAfter as e:
+                # Лимит превышен для всего бота: останавливаем все отправки
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                logger.warning(f"RetryAfter {delay} с при рассылке")
+                self.bucket.pause(delay)
+            except Forbidden as e:
+                return BLOCKED, str(e)
+            except (BadRequest, ChatMigrated) as e:
+                return FAILED, str(e)
+            except NetworkError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    return FAILED, str(e)
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt))
+            except Exception as e:
+                logger.exception(f"Ошибка отправки в {chat_id}")
+                return FAILED, str(e)
+
+    async def run(
+        self,
+        chat_ids: Iterable[int],
+        text: str,
+        on_result: Optional[Callable[[int, str, str], Awaitable[None]]] = None,
+        on_progress: Optional[Callable[[BroadcastResult], Awaitable[None]]] = None,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+        result: Optional[BroadcastResult] = None,
+        stop_event: Optional[asyncio.Event] = None,
+        **send_kwargs,
+    ) -> BroadcastResult:
+        """Разослать text по chat_ids.
+
+        on_result(chat_id, статус, ошибка) вызывается после каждой отправки,
+        on_progress(result) — не чаще раза в progress_interval секунд.
+        Переданный result продолжает накапливать итоги (total не меняется);
+        stop_event останавливает рассылку, не начатые отправки пропускаются.
+        """
+        chat_ids = list(chat_ids)
+        if result is None:
+            result = BroadcastResult(total=len(chat_ids))
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            queue.put_nowait(chat_id)
+
+        async def worker() -> None:
+            while stop_event is None or not stop_event.is_set():
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                status, error = await self.send(chat_id, text, **send_kwargs)
+                if status == SENT:
+                    result.delivered += 1
+                elif status == BLOCKED:
+                    result.blocked += 1
+                else:
+                    result.failed += 1
+                if on_result is not None:
+                    await on_result(chat_id, status, error)
+
+        async def progress() -> None:
+            while True:
+                await asyncio.sleep(progress_interval)
+                try:
+                    await on_progress(result)
+                except Exception as e:
+                    logger.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(chat_ids)) or 1)]
+        reporter = asyncio.create_task(progress()) if on_progress is not None else None
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if reporter is not None:
+                reporter.cancel()
+        return result
+
+
+class BroadcastJobs:
+    """Рассылки, выполняемые в этом процессе: запуск, пауза, возобновление, отмена."""
+
+    def __init__(self) -> None:
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._stops: dict[int, asyncio.Event] = {}
+
+    def is_running(self, job_id: int) -> bool:
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def start(self, application, job_id: int) -> bool:
+        """Запустить выполнение рассылки в фоне (если ещё не идёт)."""
+        if self.is_running(job_id):
+            return False
+        stop = self._stops[job_id] = asyncio.Event()
+        # Не application.create_task: Application.stop() ждал бы такие задачи до конца рассылки
+        task = asyncio.create_task(self._run(application.bot, job_id, stop))
+        task.add_done_callback(self._log_failure)
+        self._tasks[job_id] = task
+        return True
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Рассылка завершилась с ошибкой", exc_info=task.exception())
+
+    def stop(self, job_id: int) -> None:
+        """Остановить выполнение (статус в БД меняет вызывающий)."""
+        if job_id in self._stops:
+            self._stops[job_id].set()
+
+    async def resume_all(self, application) -> None:
+        """Продолжить рассылки, прерванные остановкой бота (при запуске)."""
+        for job_id in await adb.get_broadcast_job_ids("running"):
+            logger.info(f"Возобновление рассылки #{job_id}")
+            self.start(application, job_id)
+
+    async def shutdown(self) -> None:
+        """Остановить все рассылки процесса, сохранив прогресс (при остановке бота)."""
+        for stop in self._stops.values():
+            stop.set()
+        tasks = [t for t in self._tasks.values() if not t.done()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, bot, job_id: int, stop: asyncio.Event) -> None:
+        job = await adb.get_broadcast_job(job_id)
+        if not job or job["status"] != "running":
+            return
+        lost = await adb.fail_interrupted_deliveries(job_id)
+        if lost:
+            logger.warning(f"Рассылка #{job_id}: {lost} отправок прерваны сбоем, повторно не отправляются")
+            job = await adb.get_broadcast_job(job_id)
+        counts = job["counts"]
+        result = BroadcastResult(
+            total=job["total"],
+            delivered=counts.get(SENT, 0),
+            blocked=counts.get(BLOCKED, 0),
+            failed=counts.get(FAILED, 0),
+        )
+        title = f"Рассылка #{job_id}"
+        pending: list[tuple[int, str, str]] = []
+        last_text = ""
+
+        async def flush() -> None:
+            batch = pending[:]
+            del pending[:]
+            await adb.record_broadcast_deliveries(job_id, batch)
+
+        async def on_result(chat_id: int, status: str, error: str) -> None:
+            pending.append((chat_id, status, error))
+            if len(pending) >= 50:
+                await flush()
+
+        async def show(res: BroadcastResult, suffix: str = "идёт") -> None:
+            nonlocal last_text
+            text = res.format(f"{title} {suffix}")
+            if not job["status_message_id"] or text == last_text:
+                return
+            last_text = text
+            await bot.edit_message_text(
+                chat_id=job["status_chat_id"],
+                message_id=job["status_message_id"],
+                text=text,
+                parse_mode=None,
+            )
+
+        engine = BroadcastEngine(bot)
+        finished = False
+        try:
+            while not stop.is_set():
+                chunk = await adb.claim_broadcast_deliveries(job_id, BROADCAST_CHUNK_SIZE)
+                if not chunk:
+                    finished = True
+                    break
+                await engine.run(chunk, job["text"], on_result=on_result, on_progress=show, result=result, stop_event=stop)
+                await flush()
+                # Статус могли изменить командой в другом процессе
+                current = await adb.get_broadcast_job(job_id)
+                if current["status"] != "running":
+                    break
+        finally:
+            await flush()
+            await adb.release_broadcast_deliveries(job_id)
+
+        if finished and await adb.set_broadcast_job_status(job_id, "done", ("running",)):
+            suffix = "завершена"
+        else:
+            suffix = {"paused": "на паузе", "cancelled": "отменена"}.get(
+                (await adb.get_broadcast_job(job_id))["status"], "остановлена"
+            )
+        logger.info(
+            f"{title} {suffix}: {result.delivered}/{result.total}, "
+            f"заблокировали {result.blocked}, ошибок {result.failed}"
+        )
+        try:
+            await show(result, suffix)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сообщение рассылки #{job_id}: {e}")
+
+
+broadcast_jobs = BroadcastJobs()
@@ -0,0 +1,265 @@
+"""Экспорт заявок в CSV для /admin_export.
+
+Строки читаются из БД пачками (EXPORT_CHUNK_SIZE) и сразу пишутся
+csv.writer во временный файл, по желанию сжатый gzip: в памяти только
+текущая пачка, сколько бы заявок ни попало в период. Запись идёт в
+отдельном потоке, цикл событий не блокируется.
+
+Аргументы команды: период, статусы через запятую, gz — в любом порядке.
+Период: today (по умолчанию), yesterday, week (7 дней), month, year, all,
+ГГГГ, ГГГГ-ММ, ГГГГ-ММ-ДД или диапазон из них через «..» (концы
+включительно). Даты — по времени БД (UTC), как created_at.
+
+Замер памяти: python -m utils.export [заявок] [--legacy]
+"""
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import sys
+import tempfile
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from config import EXPORT_CHUNK_SIZE
+from database import db
+from utils.sheets import HEADER
+
+logger = logging.getLogger("bot")
+
+ORDER_STATUSES = ("new", "in_progress", "done", "cancelled")
+# Предел размера документа, который бот может отправить
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+USAGE = (
+    "Использование: /admin_export [период] [статусы] [gz]\n"
+    "Период: today, yesterday, week, month, year, all, 2024, 2024-05, 2024-05-01 "
+    "или диапазон 2024-01..2024-03.\n"
+    "Статусы через запятую: " + ", ".join(ORDER_STATUSES) + ".\n"
+    "gz — сжать файл."
+)
+
+
+@dataclass
+class ExportQuery:
+    """Что выгружать: [date_from, date_to) по created_at (None — без границы), статусы, сжатие."""
+
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    statuses: list[str] = field(default_factory=list)
+    compress: bool = False
+
+    @property
+    def label(self) -> str:
+        if self.date_from is None and self.date_to is None:
+            period = "всё время"
+        elif self.date_from is not None and self.date_to == self.date_from + timedelta(days=1):
+            period = self.date_from.isoformat()
+        else:
+            first = self.date_from.isoformat() if self.date_from else "…"
+            last = (self.date_to - timedelta(days=1)).isoformat() if self.date_to else "…"
+            period = f"{first} — {last}"
+        return period + (f" ({', '.join(self.statuses)})" if self.statuses else "")
+
+    @property
+    def filename(self) -> str:
+        first = self.date_from.isoformat() if self.date_from else "start"
+        last = (self.date_to - timedelta(days=1)).isoformat() if self.date_to else "now"
+        name = "orders_" + (first if first == last else f"{first}_{last}")
+        return name + ".csv" + (".gz" if self.compress else "")
+
+
+def _month_end(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _period(token: str, today: date) -> tuple[Optional[date], Optional[date]]:
+    """Границы периода [начало, конец) для одного значения."""
+    named = {
+        "today": (today, today + timedelta(days=1)),
+        "yesterday": (today - timedelta(days=1), today),
+        "week": (today - timedelta(days=6), today + timedelta(days=1)),
+        "month": (today.replace(day=1), today + timedelta(days=1)),
+        "year": (today.replace(month=1, day=1), today + timedelta(days=1)),
+        "all": (None, None),
+    }
+    if token in named:
+        return named[token]
+    parts = token.split("-")
+    try:
+        if len(parts) == 1:
+            start = date(int(parts[0]), 1, 1)
+            return start, start.replace(year=start.year + 1)
+        if len(parts) == 2:
+            start = date(int(parts[0]), int(parts[1]), 1)
+            return start, _month_end(start)
+        start = date.fromisoformat(token)
+        return start, start + timedelta(days=1)
+    except ValueError:
+        raise ValueError(f"Не удалось разобрать период «{token}».") from None
+
+
+def parse_export_args(args: list[str], today: Optional[date] = None) -> ExportQuery:
+    """Разобрать аргументы /admin_export. ValueError — с текстом для администратора."""
+    today = today or datetime.now(timezone.utc).date()
+    query = ExportQuery()
+    period = None
+    for arg in (a.strip().lower() for a in args):
+        if not arg:
+            continue
+        if arg in ("gz", "gzip"):
+            query.compress = True
+        elif all(s in ORDER_STATUSES for s in arg.split(",")):
+            query.statuses = list(dict.fromkeys(query.statuses + arg.split(",")))
+        elif period is None:
+            period = arg
+        else:
+            raise ValueError(f"Лишний аргумент «{arg}».")
+    period = period or "today"
+    if ".." in period:
+        first, _, last = period.partition("..")
+        query.date_from = _period(first, today)[0] if first else None
+        query.date_to = _period(last, today)[1] if last else None
+        if query.date_from and query.date_to and query.date_from >= query.date_to:
+            raise ValueError("Начало периода позже конца.")
+    else:
+        query.date_from, query.date_to = _period(period, today)
+    return query
+
+
+def _open(path: Path, compress: bool):
+    # utf-8-sig: Excel распознаёт кодировку по BOM
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8-sig", newline="", compresslevel=6)
+    return open(path, "w", encoding="utf-8-sig", newline="")
+
+
+def write_orders_csv(path: Path, query: ExportQuery, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Записать заявки запроса в CSV (синхронно). Возвращает число строк."""
+    written = 0
+    chunks = db.iter_orders_for_export(
+        query.date_from.isoformat() if query.date_from else None,
+        query.date_to.isoformat() if query.date_to else None,
+        query.statuses or None,
+        chunk_size,
+    )
+    with closing(chunks), _open(path, query.compress) as fp:
+        writer = csv.writer(fp)
+        writer.writerow(HEADER)
+        for rows in chunks:
+            writer.writerows(rows)
+            written += len(rows)
+    return written
+
+
+async def export_orders(query: ExportQuery) -> tuple[Path, int]:
+    """Выгрузить заявки во временный файл в отдельном потоке. Файл удаляет вызывающий."""
+    fd, name = tempfile.mkstemp(prefix="orders_", suffix=".csv.gz" if query.compress else ".csv")
+    os.close(fd)
+    path = Path(name)
+    started = time.monotonic()
+    try:
+        count = await asyncio.to_thread(write_orders_csv, path, query)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    logger.info(
+        f"Экспорт заявок за {query.label}: {count} строк, "
+        f"{path.stat().st_size / 1024:.0f} КБ за {time.monotonic() - started:.1f} с"
+    )
+    return path, count
+
+
+# --- Замер памяти ---
+
+BENCH_ORDERS = 1_000_000
+BENCH_USERS = 10_000
+
+
+def _fill_bench_db(count: int) -> None:
+    start = datetime(2024, 1, 1)
+    # Заявки равномерно за год
+    step = 365 * 86400 / count
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, full_name) VALUES (?, ?)",
+            ((100000 + i, f"Пользователь {i}") for i in range(BENCH_USERS)),
+        )
+        for offset in range(0, count, 50_000):
+            conn.executemany(
+                "INSERT INTO orders (order_id, user_id, phone, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        f"#B-{i:07d}",
+                        i % BENCH_USERS + 1,
+                        f"+7900{i:07d}",
+                        ORDER_STATUSES[i % len(ORDER_STATUSES)],
+                        (start + timedelta(seconds=i * step)).strftime("%Y-%m-%d %H:%M:%S"),
+                    )
+                    for i in range(offset, min(count, offset + 50_000))
+                ),
+            )
+            conn.commit()
+
+
+def _legacy_export(query: ExportQuery) -> bytes:
+    """Прежний /admin_export: список словарей, CSV в StringIO, копия в байтах."""
+    import io
+
+    rows = [
+        dict(zip(("created_at", "order_id", "full_name", "phone", "status"), r))
+        for chunk in db.iter_orders_for_export(str(query.date_from), str(query.date_to), chunk_size=10**9)
+        for r in chunk
+    ]
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(HEADER)
+    for r in rows:
+        w.writerow([str(r.get(k, "")) for k in ("created_at", "order_id", "full_name", "phone", "status")])
+    return io.BytesIO(buf.getvalue().encode("utf-8-sig")).getvalue()
+
+
+def _measure(func, *args) -> tuple[object, float, float]:
+    import tracemalloc
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def bench(count: int = BENCH_ORDERS, legacy: bool = False) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Своя временная БД; прежний путь и пул бота восстанавливаются после замера
+        previous = db.set_db_path(Path(tmp) / "bench.db")
+        try:
+            db.init_db()
+            started = time.perf_counter()
+            _fill_bench_db(count)
+            print(f"Заявок: {count}, база заполнена за {time.perf_counter() - started:.1f} с")
+            query = parse_export_args(["2024"])
+            for compress in (False, True):
+                query.compress = compress
+                path = Path(tmp) / query.filename
+                written, elapsed, peak = _measure(write_orders_csv, path, query)
+                print(
+                    f"потоково{' + gzip' if compress else ''}: {written} строк, {elapsed:.1f} с, "
+                    f"файл {path.stat().st_size / 1024 / 1024:.1f} МБ, пик памяти Python {peak:.1f} МБ"
+                )
+            if legacy:
+                data, elapsed, peak = _measure(_legacy_export, query)
+                print(f"прежний способ: {elapsed:.1f} с, файл {len(data) / 1024 / 1024:.1f} МБ, пик памяти Python {peak:.1f} МБ")
+        finally:
+            db.set_db_path(previous)
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    bench(int(args[0]) if args else BENCH_ORDERS, legacy="--legacy" in sys.argv)
@@ -0,0 +1,231 @@
+"""Минимальный асинхронный HTTP/1.1-сервер на asyncio.
+
+Нужен для вебхука Telegram и служебных адресов (/healthz, /readyz), поэтому
+умеет только необходимое: тело по Content-Length, keep-alive, ограничение
+числа соединений и размера тела, плавную остановку (drain) — новые
+соединения не принимаются, начатые запросы дорабатывают.
+"""
+import asyncio
+import logging
+from contextlib import suppress
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("bot")
+
+MAX_HEADERS = 100
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: str
+    headers: dict[str, str]
+    body: bytes = b""
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def text(cls, text: str, status: int = 200) -> "Response":
+        return cls(status=status, body=text.encode("utf-8"))
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPError(Exception):
+    """Ошибка разбора запроса: ответить статусом и закрыть соединение."""
+
+    def __init__(self, status: int) -> None:
+        super().__init__(HTTPStatus(status).phrase)
+        self.status = status
+
+
+class HTTPServer:
+    """HTTP-сервер с таблицей маршрутов (метод, путь) → обработчик."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_connections: int = 100,
+        max_body_size: int = 1024 * 1024,
+        read_timeout: float = 10.0,
+        keepalive_timeout: float = 75.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.max_connections = max(1, max_connections)
+        self.max_body_size = max_body_size
+        self.read_timeout = read_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.draining = False
+        self._routes: dict[tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set[asyncio.StreamWriter] = set()
+        self._active = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self._routes[(method.upper(), path)] = handler
+
+    @property
+    def bound_port(self) -> int:
+        """Фактический порт (при port=0 выбирается системой)."""
+        return self._server.sockets[0].getsockname()[1] if self._server else self.port
+
+    @property
+    def active_requests(self) -> int:
+        return self._active
+
+    @property
+    def open_connections(self) -> int:
+        return len(self._connections)
+
+    async def start(self) -> None:
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"HTTP-сервер слушает {self.host}:{self.bound_port}")
+
+    async def drain(self, timeout: float) -> None:
+        """Перестать принимать соединения, дождаться начатых запросов (не дольше timeout) и закрыть всё."""
+        self.draining = True
+        if self._server is None:
+            return
+        self._server.close()
+        if self._active:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"HTTP-сервер: {self._active} запросов не завершились за {timeout} с")
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        logger.info("HTTP-сервер остановлен")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self.draining or len(self._connections) >= self.max_connections:
+            # Дочитать запрос перед отказом: закрытие с непрочитанными данными сбросит соединение (RST)
+            # и клиент не увидит ответ 503
+            with suppress(asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                with suppress(HTTPError):
+                    line = await self._readline(reader, self.read_timeout, 400)
+                    await self._read_request(line, reader)
+                await self._respond(writer, Response.text("Service Unavailable", 503), keep_alive=False)
+            await self._close(writer)
+            return
+        self._connections.add(writer)
+        try:
+            timeout = self.read_timeout
+            while not self.draining:
+                try:
+                    line = await self._readline(reader, timeout, 400)
+                except HTTPError as e:
+                    await self._respond(writer, Response.text(str(e), e.status), keep_alive=False)
+                    break
+                if not line.strip():
+                    break
+                timeout = self.keepalive_timeout
+                # Запрос считается начатым с первой строки: drain дождётся его целиком
+                self._active += 1
+                self._idle.clear()
+                try:
+                    try:
+                        request = await self._read_request(line, reader)
+                    except HTTPError as e:
+                        await self._respond(writer, Response.text(str(e), e.status), keep_alive=False)
+                        break
+                    response = await self._dispatch(request)
+                    keep_alive = request.headers.get("connection", "").lower() != "close" and not self.draining
+                    await self._respond(writer, response, keep_alive)
+                finally:
+                    self._active -= 1
+                    if not self._active:
+                        self._idle.set()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            await self._close(writer)
+
+    async def _read_request(self, line: bytes, reader: asyncio.StreamReader) -> Request:
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise HTTPError(400)
+        method, target, _ = parts
+        headers: dict[str, str] = {}
+        while True:
+            raw = await self._readline(reader, self.read_timeout, 431)
+            if raw in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise HTTPError(431)
+            name, sep, value = raw.decode("latin-1").partition(":")
+            if not sep:
+                raise HTTPError(400)
+            headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(411)
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400)
+        if length < 0:
+            raise HTTPError(400)
+        if length > self.max_body_size:
+            raise HTTPError(413)
+        body = await asyncio.wait_for(reader.readexactly(length), self.read_timeout) if length else b""
+        path, _, query = target.partition("?")
+        return Request(method=method.upper(), path=path, query=query, headers=headers, body=body)
+
+    @staticmethod
+    async def _readline(reader: asyncio.StreamReader, timeout: float, status: int) -> bytes:
+        """Прочитать строку запроса; слишком длинная строка — HTTPError(status)."""
+        try:
+            return await asyncio.wait_for(reader.readline(), timeout)
+        except ValueError:
+            # readline превращает LimitOverrunError (строка длиннее лимита StreamReader, 64 КиБ) в ValueError;
+            # остаток строки в буфере уже не разобрать, поэтому соединение после ответа закрывается
+            raise HTTPError(status) from None
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            status = 405 if any(path == request.path for _, path in self._routes) else 404
+            return Response.text(HTTPStatus(status).phrase, status)
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception(f"Ошибка обработки HTTP-запроса {request.method} {request.path}")
+            return Response.text(HTTPStatus.INTERNAL_SERVER_ERROR.phrase, 500)
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(response.body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+        await writer.drain()
+
+    @staticmethod
+    async def _close(writer: asyncio.StreamWriter) -> None:
+        writer.close()
+        with suppress(Exception):
+            await writer.wait_closed()
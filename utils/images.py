@@ -0,0 +1,230 @@
+"""Подготовка изображений портфолио для Telegram.
+
+Из оригиналов в PORTFOLIO_DIR делаются копии с ограниченной стороной
+(IMAGE_MAX_SIDE), пересжатые в IMAGE_FORMAT. В имени копии —
+хэш содержимого оригинала и параметры обработки, поэтому повторный запуск
+обрабатывает только новые и изменённые файлы, а копии удалённых оригиналов
+убираются. Обработка идёт в пуле процессов: в фоне при запуске бота, при
+изменении папки оригиналов и вручную — python -m utils.images.
+
+Pillow — необязательная зависимость: без неё бот отправляет оригиналы.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from config import (
+    IMAGE_FORMAT,
+    IMAGE_MAX_SIDE,
+    IMAGE_QUALITY,
+    IMAGE_WORKERS,
+    PORTFOLIO_CACHE_DIR,
+    PORTFOLIO_DIR,
+)
+
+logger = logging.getLogger("bot")
+
+SOURCE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+FORMAT_SUFFIXES = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+@dataclass(frozen=True)
+class ImageParams:
+    """Параметры обработки; входят в имя копии, их смена пересоздаёт копии."""
+
+    max_side: int = IMAGE_MAX_SIDE
+    format: str = IMAGE_FORMAT
+    quality: int = IMAGE_QUALITY
+
+    @property
+    def suffix(self) -> str:
+        return FORMAT_SUFFIXES.get(self.format, ".jpg")
+
+    def tag(self) -> str:
+        return f"{self.max_side}-q{self.quality}"
+
+
+def _flatten(img, image_format: str):
+    """Привести к режиму, который умеет сохранять формат (прозрачность — на белом фоне для JPEG)."""
+    from PIL import Image
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if not has_alpha:
+        return img.convert("RGB")
+    img = img.convert("RGBA")
+    if image_format == "WEBP":
+        return img
+    background = Image.new("RGB", img.size, (255, 255, 255))
+    background.paste(img, mask=img.getchannel("A"))
+    return background
+
+
+def _save(img, path: Path, params: ImageParams) -> None:
+    from PIL import Image
+
+    copy = img.copy()
+    copy.thumbnail((params.max_side, params.max_side), Image.LANCZOS)
+    options = {"quality": params.quality}
+    if params.format == "JPEG":
+        options.update(optimize=True, progressive=True)
+    else:
+        options.update(method=6)
+    tmp = path.with_name(path.name + ".tmp")
+    copy.save(tmp, format=params.format, **options)
+    os.replace(tmp, path)
+
+
+def process_image(source: str, cache_dir: str, params: ImageParams) -> str:
+    """Сделать копию одного оригинала. Выполняется в процессе пула.
+
+    Возвращает путь копии; уже существующая копия не пересоздаётся.
+    """
+    from PIL import Image, ImageOps
+
+    src = Path(source)
+    data = src.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    name = f"{src.stem}.{digest}.{params.tag()}{params.suffix}"
+    photo = Path(cache_dir) / "photo" / name
+    if photo.exists():
+        return str(photo)
+    photo.parent.mkdir(parents=True, exist_ok=True)
+    with Image.open(io.BytesIO(data)) as img:
+        img = _flatten(ImageOps.exif_transpose(img), params.format)
+        _save(img, photo, params)
+    return str(photo)
+
+
+def list_sources(directory: Path) -> list[Path]:
+    """Оригиналы изображений в папке (по имени)."""
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.iterdir() if p.is_file() and p.suffix.lower() in SOURCE_SUFFIXES)
+
+
+class ImagePipeline:
+    """Фоновая подготовка копий: пул процессов создаётся при первом запуске."""
+
+    def __init__(
+        self,
+        source_dir: Path = PORTFOLIO_DIR,
+        cache_dir: Path = PORTFOLIO_CACHE_DIR,
+        params: ImageParams = ImageParams(),
+        workers: int = IMAGE_WORKERS,
+    ) -> None:
+        self.source_dir = Path(source_dir)
+        self.cache_dir = Path(cache_dir)
+        self.params = params
+        self.workers = max(1, workers)
+        self.available = importlib.util.find_spec("PIL") is not None
+        # Копии готовит другой процесс (обработчики 1..N-1 при BOT_WORKERS > 1): только читать
+        self.readonly = False
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._source_mtime_ns: Optional[int] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def photo_dir(self) -> Path:
+        return self.cache_dir / "photo"
+
+    def _source_version(self) -> Optional[int]:
+        try:
+            return self.source_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    async def refresh(self, force: bool = False) -> int:
+        """Подготовить копии, если папка оригиналов изменилась. Возвращает число обработанных оригиналов."""
+        if not self.available or self.readonly:
+            return 0
+        async with self._lock:
+            version = self._source_version()
+            if not force and self._source_mtime_ns is not None and version == self._source_mtime_ns:
+                return 0
+            sources = list_sources(self.source_dir)
+            if self._executor is None and sources:
+                # spawn: в боте уже работают потоки (БД, аналитика), fork с ними небезопасен
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(self._executor, process_image, str(src), str(self.cache_dir), self.params)
+                    for src in sources
+                ),
+                return_exceptions=True,
+            )
+            keep: set[str] = set()
+            failed: set[str] = set()
+            for src, result in zip(sources, results):
+                if isinstance(result, BaseException):
+                    logger.warning(f"Не удалось обработать изображение {src.name}: {result}")
+                    failed.add(src.stem)
+                    continue
+                keep.add(Path(result).name)
+            # Прежние копии необработанных оригиналов остаются, пока обработка не удастся
+            removed = self._remove_stale(keep, failed)
+            # Неполный проход не запоминается: следующий вызов повторит обработку
+            self._source_mtime_ns = None if failed else version
+            if any(isinstance(r, BrokenProcessPool) for r in results):
+                # Процесс пула упал — следующий вызов создаст новый пул
+                self.shutdown()
+            ready = len(results) - sum(isinstance(r, BaseException) for r in results)
+            logger.info(f"Портфолио: подготовлено {ready} из {len(sources)} изображений, удалено устаревших копий: {removed}")
+            return ready
+
+    def start(self) -> None:
+        """Запустить подготовку копий в фоне (при запуске бота)."""
+        if self.available and self._task is None:
+            self._task = asyncio.create_task(self.refresh())
+            self._task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Ошибка подготовки изображений портфолио", exc_info=task.exception())
+
+    def _remove_stale(self, keep: set[str], keep_stems: set[str]) -> int:
+        """Удалить копии, кроме перечисленных в keep и копий оригиналов с именами из keep_stems."""
+        if not self.photo_dir.is_dir():
+            return 0
+        removed = 0
+        for path in self.photo_dir.iterdir():
+            # Имя копии: <имя оригинала>.<хэш>.<параметры><расширение>
+            if path.name not in keep and path.name.rsplit(".", 3)[0] not in keep_stems:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def shutdown(self) -> None:
+        """Остановить пул процессов (при остановке бота)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+portfolio_pipeline = ImagePipeline()
+
+
+if __name__ == "__main__":
+    from utils.images import portfolio_pipeline as pipeline  # функции пула — из модуля, а не из __main__
+    from utils.logger import setup_logging
+
+    setup_logging(logging.INFO)
+    if not pipeline.available:
+        raise SystemExit("Pillow не установлен: pip install Pillow")
+    try:
+        asyncio.run(pipeline.refresh(force=True))
+    finally:
+        pipeline.shutdown()
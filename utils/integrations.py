@@ -1,127 +1,105 @@
-"""Интеграции: Google Sheets, уведомления менеджерам."""
+"""Интеграции: уведомления и напоминания менеджерам (Google Sheets — utils/sheets.py)."""
 import logging
-from pathlib import Path
+from typing import Callable
 
 from config import (
-    GOOGLE_CREDENTIALS_PATH,
-    GOOGLE_SHEET_ID,
     MANAGER_CHAT_ID,
     MANAGER_TELEGRAM_IDS,
     ORDERS_CHANNEL_ID,
 )
-from database import db
+from database import adb
 from utils.messages import ORDER_NOTIFY_MANAGER
 
 logger = logging.getLogger("bot")
 
 
-async def notify_managers_about_order(
-    bot,
-    order_id: str,
-    full_name: str,
-    username: str,
-    phone: str,
-    business_type: str,
-    goal: str,
-) -> None:
-    """Отправить уведомление о новой заявке: в чат команды, в канал, лично менеджерам."""
-    text = ORDER_NOTIFY_MANAGER.format(
-        order_id=order_id,
-        full_name=full_name or "—",
-        username=username or "—",
-        phone=phone or "—",
-        business_type=business_type or "—",
-        goal=goal or "—",
-    )
-    
-    # Собираем все chat_id для отправки
+def get_manager_chat_ids() -> list[int]:
+    """Получатели уведомлений о заявках: чат команды, канал заявок, менеджеры лично."""
     chat_ids = []
-    
-    # Чат команды
     if MANAGER_CHAT_ID is not None:
         chat_ids.append(MANAGER_CHAT_ID)
-    
-    # Канал заявок
     if ORDERS_CHANNEL_ID is not None:
         chat_ids.append(ORDERS_CHANNEL_ID)
-    
-    # Личные ID менеджеров
     if MANAGER_TELEGRAM_IDS:
         chat_ids.extend(MANAGER_TELEGRAM_IDS)
-    
+    return chat_ids
+
+
+def build_order_notifications(
+    full_name: str,
+    username: str,
+    phone: str,
+    business_type: str,
+    goal: str,
+) -> Callable[[str], list[tuple[int, str]]]:
+    """Уведомления о новой заявке для outbox: функция order_id → [(chat_id, текст)].
+
+    Передаётся в db.submit_order, чтобы уведомления записались в одной
+    транзакции с заявкой; доставляет их utils.outbox.
+    """
+    chat_ids = get_manager_chat_ids()
     if not chat_ids:
         logger.warning("Не указаны получатели уведомлений (MANAGER_CHAT_ID, ORDERS_CHANNEL_ID, MANAGER_TELEGRAM_IDS)")
-        return
-    
-    # Отправляем уведомления
-    sent_count = 0
-    for chat_id in chat_ids:
-        try:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode="Markdown",
-            )
-            sent_count += 1
-            logger.info(f"Уведомление о заявке {order_id} отправлено в {chat_id}")
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления в {chat_id}: {e}")
-    
-    if sent_count == 0:
-        logger.error(f"Не удалось отправить уведомление о заявке {order_id} ни одному получателю")
-
-
-def export_orders_to_sheets() -> bool:
-    """Экспорт заявок в Google Sheets. Возвращает True при успехе."""
-    if not GOOGLE_SHEET_ID or not Path(GOOGLE_CREDENTIALS_PATH).exists():
-        return False
-    try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-
-        scope = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive.readonly",
-        ]
-        creds = Credentials.from_service_account_file(
-            str(GOOGLE_CREDENTIALS_PATH), scopes=scope
+
+    def build(order_id: str) -> list[tuple[int, str]]:
+        text = ORDER_NOTIFY_MANAGER.format(
+            order_id=order_id,
+            full_name=full_name or "—",
+            username=username or "—",
+            phone=phone or "—",
+            business_type=business_type or "—",
+            goal=goal or "—",
+        )
+        return [(chat_id, text) for chat_id in chat_ids]
+
+    return build
+
+
+def _build_reminder_digests(orders: list[dict], limit: int = 4000) -> list[str]:
+    """Сводка по заявкам одним сообщением (с разбиением по лимиту длины Telegram)."""
+    from utils.messages import REMINDER_DIGEST_HEADER, REMINDER_DIGEST_LINE
+
+    header = REMINDER_DIGEST_HEADER.format(count=len(orders))
+    messages, current = [], header
+    for o in orders:
+        count = o.get("reminder_count") or 0
+        line = REMINDER_DIGEST_LINE.format(
+            order_id=o.get("order_id", ""),
+            full_name=o.get("full_name") or "—",
+            age=int(o.get("age_hours") or 0),
+            repeat=f" (напоминание №{count + 1})" if count else "",
         )
-        gc = gspread.authorize(creds)
-        sh = gc.open_by_key(GOOGLE_SHEET_ID)
-        worksheet = sh.sheet1
-        rows = db.get_orders_for_export()
-        if not rows:
-            return True
-        data = [
-            [
-                str(r.get("created_at", "")),
-                str(r.get("order_id", "")),
-                str(r.get("full_name", "")),
-                str(r.get("phone", "")),
-                str(r.get("status", "")),
-            ]
-            for r in rows
-        ]
-        worksheet.append_rows(data, value_input_option="USER_ENTERED")
-        return True
-    except Exception:
-        return False
+        if len(current) + len(line) + 1 > limit:
+            messages.append(current)
+            current = header
+        current += "\n" + line
+    messages.append(current)
+    return messages
 
 
 async def remind_managers_new_orders(bot) -> None:
-    """Напомнить менеджерам о заявках в статусе new старше 1 часа."""
-    from config import REMINDER_AFTER_HOURS
-    from utils.messages import REMINDER_NEW_ORDER
+    """Напомнить менеджерам о новых заявках, по которым подошёл срок напоминания.
 
-    orders = db.get_orders_new_longer_than_hours(REMINDER_AFTER_HOURS)
-    if not orders or not (MANAGER_CHAT_ID or MANAGER_TELEGRAM_IDS):
+    Каждому получателю уходит одна сводка; интервалы между повторными
+    напоминаниями по заявке растут по REMINDER_ESCALATION_HOURS.
+    """
+    from config import REMINDER_AFTER_HOURS, REMINDER_ESCALATION_HOURS
+
+    chat_ids = [c for c in [MANAGER_CHAT_ID] + (MANAGER_TELEGRAM_IDS or []) if c]
+    if not chat_ids:
         return
-    for o in orders:
-        text = REMINDER_NEW_ORDER.format(order_id=o.get("order_id", ""))
-        for chat_id in [MANAGER_CHAT_ID] + (MANAGER_TELEGRAM_IDS or []):
-            if not chat_id:
-                continue
-            try:
-                await bot.send_message(chat_id=chat_id, text=text)
-            except Exception:
-                pass
+    orders = await adb.get_orders_due_for_reminder(REMINDER_AFTER_HOURS, REMINDER_ESCALATION_HOURS)
+    if not orders:
+        return
+    digests = _build_reminder_digests(orders)
+    delivered = False
+    for chat_id in chat_ids:
+        try:
+            for text in digests:
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode=None)
+            delivered = True
+        except Exception as e:
+            logger.error(f"Ошибка отправки напоминания в {chat_id}: {e}")
+    # Если не дошло никому — повторим на следующем запуске
+    if delivered:
+        await adb.mark_orders_reminded([o["order_id"] for o in orders])
@@ -0,0 +1,140 @@
+"""Отправка изображений портфолио с кэшем file_id Telegram.
+
+Отправляются подготовленные копии (utils.images), оригиналы — только если
+Pillow не установлен. Список файлов папки держится в памяти и перечитывается только при изменении
+mtime самой папки (добавление, удаление, переименование файла). Первый
+показ загружает файлы в Telegram, полученные file_id сохраняются в
+media_cache по пути вместе с размером и mtime файла; дальше альбом
+отправляется по file_id без повторной загрузки.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+from config import PORTFOLIO_DIR
+from database import adb
+from utils.images import portfolio_pipeline
+
+logger = logging.getLogger("bot")
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+# Больше 10 файлов в одном альбоме Telegram не принимает
+ALBUM_LIMIT = 10
+
+
+@dataclass(frozen=True)
+class MediaFile:
+    """Файл и его версия (размер и mtime) на момент чтения папки."""
+
+    path: Path
+    size: int
+    mtime_ns: int
+
+    @property
+    def key(self) -> str:
+        return str(self.path)
+
+
+class DirectoryIndex:
+    """Изображения папки в порядке имён; перечитывается при изменении папки.
+
+    Файл, перезаписанный на месте, mtime папки не меняет — такие замены
+    нужно делать копированием под новым именем или переименованием.
+    """
+
+    def __init__(self, directory: Path, suffixes: tuple[str, ...] = IMAGE_SUFFIXES, limit: int = ALBUM_LIMIT) -> None:
+        self.directory = Path(directory)
+        self.suffixes = suffixes
+        self.limit = limit
+        self._mtime_ns: Optional[int] = None
+        self._files: list[MediaFile] = []
+
+    def files(self) -> list[MediaFile]:
+        try:
+            mtime_ns = self.directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._mtime_ns, self._files = None, []
+            return []
+        if mtime_ns != self._mtime_ns:
+            self._files = self._scan()
+            self._mtime_ns = mtime_ns
+        return self._files
+
+    def _scan(self) -> list[MediaFile]:
+        files = []
+        with os.scandir(self.directory) as it:
+            entries = sorted((e for e in it if e.is_file()), key=lambda e: e.name)
+        for entry in entries:
+            if Path(entry.name).suffix.lower() not in self.suffixes:
+                continue
+            st = entry.stat()
+            files.append(MediaFile(Path(entry.path), st.st_size, st.st_mtime_ns))
+            if len(files) == self.limit:
+                break
+        logger.debug(f"Индекс {self.directory}: {len(files)} файлов")
+        return files
+
+
+async def _send_photos(bot, chat_id: int, media: list) -> list:
+    if len(media) == 1:
+        return [await bot.send_photo(chat_id=chat_id, photo=media[0])]
+    return list(await bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(m) for m in media]))
+
+
+async def send_photo_album(bot, chat_id: int, files: list[MediaFile]) -> int:
+    """Отправить файлы одним альбомом, используя кэш file_id. Возвращает число загруженных файлов."""
+    if not files:
+        return 0
+    cached = await adb.get_media_file_ids([f.key for f in files])
+    media: list = []
+    uploads: list[int] = []
+    for i, f in enumerate(files):
+        hit = cached.get(f.key)
+        if hit and hit[0] == f.size and hit[1] == f.mtime_ns:
+            media.append(hit[2])
+        else:
+            media.append(await asyncio.to_thread(f.path.read_bytes))
+            uploads.append(i)
+    try:
+        messages = await _send_photos(bot, chat_id, media)
+    except BadRequest as e:
+        if len(uploads) == len(files):
+            raise
+        # Сохранённые file_id не приняты (например, сменился токен бота) — загрузить заново
+        logger.warning(f"file_id портфолио отклонены ({e}), повторная загрузка")
+        await adb.forget_media_file_ids([f.key for f in files])
+        media = [await asyncio.to_thread(f.path.read_bytes) for f in files]
+        uploads = list(range(len(files)))
+        messages = await _send_photos(bot, chat_id, media)
+    if uploads:
+        await adb.save_media_file_ids([
+            (files[i].key, files[i].size, files[i].mtime_ns, messages[i].photo[-1].file_id)
+            for i in uploads
+            if messages[i].photo
+        ])
+    return len(uploads)
+
+
+portfolio_index = DirectoryIndex(portfolio_pipeline.photo_dir)
+originals_index = DirectoryIndex(PORTFOLIO_DIR)
+
+
+async def send_portfolio(bot, chat_id: int) -> int:
+    """Отправить альбом портфолио. Возвращает число изображений."""
+    if portfolio_pipeline.available:
+        # Оригиналы менялись — дождаться новых копий (обычно ничего не делает)
+        await portfolio_pipeline.refresh()
+        # Копии ещё готовит другой процесс — пока оригиналы
+        files = portfolio_index.files() or originals_index.files()
+    else:
+        files = originals_index.files()
+    uploaded = await send_photo_album(bot, chat_id, files)
+    if uploaded:
+        logger.info(f"Портфолио: загружено в Telegram {uploaded} из {len(files)} файлов")
+    return len(files)
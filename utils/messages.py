@@ -69,6 +69,17 @@ ORDER_CONFIRM_TEMPLATE = """
 Менеджер свяжется с Вами.
 """
 
+# Меню и короткие ответы
+MENU_TITLE = "Главное меню:"
+MENU_HINT = "Используйте кнопки меню или команды: /menu, /order, /price"
+CABINET_MESSAGE = "Проверить статус заявки: /status\nВаши заявки отображаются здесь."
+NO_ORDERS_MESSAGE = "У вас пока нет заявок. Оформить заявку: /order"
+ORDER_LIMIT_MESSAGE = "Вы уже отправили несколько заявок за последний час. Пожалуйста, подождите."
+ORDER_CANCELLED = "Заявка отменена."
+ACTION_CANCELLED = "Действие отменено."
+PORTFOLIO_MESSAGE = "📁 *Наше портфолио*\n\nПримеры лендингов. Добавьте изображения в папку `assets/portfolio/` для отображения здесь."
+PHONE_INVALID = "Введите корректный номер телефона (например +7 999 123-45-67) или нажмите «Отправить контакт»."
+
 # Квиз
 QUIZ_INTRO = "Ответьте на 2 коротких вопроса — мы подготовим персональное предложение."
 QUIZ_Q1 = "👔 *Сфера бизнеса?*"
@@ -88,5 +99,6 @@ ORDER_NOTIFY_MANAGER = """
 """
 
 # Напоминание
-REMINDER_NEW_ORDER = "⏰ Напоминание: заявка {order_id} в статусе «новая» более 1 часа."
+REMINDER_DIGEST_HEADER = "⏰ Напоминание: заявки в статусе «новая» ждут обработки ({count}):"
+REMINDER_DIGEST_LINE = "• {order_id} — {full_name}, {age} ч назад{repeat}"
 FOLLOWUP_CLIENT = "👋 Мы готовы обсудить ваш лендинг. Напишите, если остались вопросы: /order"
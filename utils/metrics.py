@@ -0,0 +1,460 @@
+"""Метрики в текстовом формате Prometheus, без внешних зависимостей.
+
+Что измеряется:
+- апдейт целиком и ожидание своего чата/слота (ChatOrderedUpdateProcessor);
+- каждый обработчик по имени функции (cmd_start, quiz_contact_received…),
+  включая шаги ConversationHandler; ошибки — по исключениям, кроме
+  ApplicationHandlerStop;
+- функции database/db.py, вызванные через adb: время выполнения в потоке,
+  число и ошибки по имени функции, ожидание свободного потока;
+- запросы к Bot API по методу (InstrumentedRequest), ошибки по коду ответа
+  или типу исключения;
+- периодические задачи (timed_job);
+- глубина очередей на момент запроса /metrics: апдейты, outbox, выгрузка
+  заявок, буфер аналитики, пул БД.
+
+Счётчики и гистограммы обновляются на месте и только из потока цикла
+событий (время функций БД замеряется в потоке БД, а записывается после
+await), поэтому обходятся без блокировок; очереди собираются только при
+запросе /metrics. /metrics отдаёт
+отдельный HTTP-сервер на METRICS_LISTEN:METRICS_PORT, у каждого процесса
+свой.
+
+Замер накладных расходов: python -m utils.metrics
+"""
+import asyncio
+import functools
+import itertools
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from telegram.ext import Application, ApplicationHandlerStop, ConversationHandler
+from telegram.request import HTTPXRequest
+
+from config import METRICS_LISTEN, METRICS_PORT
+from utils.httpserver import HTTPServer, Request, Response
+from utils.tracing import begin, describe, finish
+
+logger = logging.getLogger("bot")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+API_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+JOB_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Registry:
+    """Набор метрик одного процесса и сборщики, вызываемые перед выдачей."""
+
+    def __init__(self) -> None:
+        self._metrics: list["_Metric"] = []
+        self._collectors: list[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]) -> None:
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Awaitable[None]]) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    async def collect(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                await collector()
+            except Exception:
+                logger.exception("Метрики: ошибка сборщика")
+        return self.render()
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry: Registry = REGISTRY) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+        registry.register(self)
+
+    @abstractmethod
+    def _new_child(self) -> Any:
+        """Новый ряд метрики (для очередного набора значений меток)."""
+
+    def labels(self, *values: Any) -> Any:
+        """Ряд метрики для значений меток (создаётся при первом обращении)."""
+        child = self._children.get(values)
+        if child is None:
+            key = tuple(str(v) for v in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получено {key}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def clear(self) -> None:
+        self._children = {}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: tuple[str, ...], child: Any) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Значение на момент выдачи (обычно выставляется сборщиком)."""
+
+    type = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # Последняя ячейка — больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, key: tuple[str, ...], child: _HistogramValue) -> list[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, math.inf), child.counts):
+            cumulative += count
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# --- Метрики бота ---
+
+UPDATE_SECONDS = Histogram("bot_update_duration_seconds", "Обработка апдейта всеми группами обработчиков")
+UPDATE_WAIT_SECONDS = Histogram("bot_update_wait_seconds", "Ожидание апдейтом своего чата и свободного слота")
+HANDLER_SECONDS = Histogram("bot_handler_duration_seconds", "Время обработчика", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ["handler"])
+DB_SECONDS = Histogram("bot_db_query_duration_seconds", "Время функции database.db", ["function"], DB_BUCKETS)
+DB_ERRORS = Counter("bot_db_query_errors_total", "Исключения в функциях database.db", ["function"])
+DB_WAIT_SECONDS = Histogram("bot_db_executor_wait_seconds", "Ожидание свободного потока БД", buckets=DB_BUCKETS)
+API_SECONDS = Histogram("bot_api_request_duration_seconds", "Запросы к Bot API", ["method"], API_BUCKETS)
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки Bot API: код ответа или тип исключения", ["method", "reason"])
+JOB_SECONDS = Histogram("bot_job_duration_seconds", "Периодические задачи", ["job"], JOB_BUCKETS)
+JOB_ERRORS = Counter("bot_job_errors_total", "Исключения в периодических задачах", ["job"])
+
+UPDATES_RUNNING = Gauge("bot_updates_running", "Апдейтов в обработке")
+UPDATES_QUEUED = Gauge("bot_updates_queued", "Апдейтов, ждущих свой чат или слот")
+UPDATE_QUEUE_SIZE = Gauge("bot_update_queue_size", "Апдейтов в update_queue, ещё не взятых в работу")
+ACTIVE_CHATS = Gauge("bot_active_chats", "Чатов с апдейтами в работе")
+OUTBOX_MESSAGES = Gauge("bot_outbox_messages", "Уведомления менеджерам в outbox", ["status"])
+EXPORT_PENDING = Gauge("bot_export_pending_events", "Непрочитанные приёмником события заявок", ["sink"])
+EXPORT_LAG = Gauge("bot_export_lag_seconds", "Возраст самого старого непрочитанного события", ["sink"])
+ANALYTICS_QUEUED = Gauge("bot_analytics_queue_size", "События аналитики в буфере записи")
+DB_READERS_IN_USE = Gauge("bot_db_pool_readers_in_use", "Занятые подключения-читатели пула БД")
+
+
+def timed(callback: Callable, histogram: Histogram, errors: Counter, kind: str = "handler") -> Callable:
+    """Обернуть корутину-обработчик: время и исключения с меткой по имени функции, спан kind."""
+    name = getattr(callback, "__name__", repr(callback))
+    seconds = histogram.labels(name)
+    failures = errors.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        span = begin(kind, name)
+        error = ""
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except ApplicationHandlerStop:
+            raise
+        except Exception as e:
+            failures.inc()
+            error = describe(e)
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - started)
+            if span is not None:
+                finish(span, error)
+
+    wrapper.metrics_timed = True
+    return wrapper
+
+
+def timed_job(callback: Callable) -> Callable:
+    """Обёртка задачи job_queue (имя задачи остаётся именем функции)."""
+    return timed(callback, JOB_SECONDS, JOB_ERRORS, kind="job")
+
+
+def _instrument(handler: Any) -> int:
+    if isinstance(handler, ConversationHandler):
+        nested = itertools.chain(handler.entry_points, *handler.states.values(), handler.fallbacks)
+        return sum(_instrument(h) for h in nested)
+    callback = getattr(handler, "callback", None)
+    if callback is None or getattr(callback, "metrics_timed", False) or not asyncio.iscoroutinefunction(callback):
+        return 0
+    handler.callback = timed(callback, HANDLER_SECONDS, HANDLER_ERRORS)
+    return 1
+
+
+def instrument_handlers(application: Application) -> int:
+    """Замерять все зарегистрированные обработчики. Возвращает их число."""
+    return sum(_instrument(h) for handlers in application.handlers.values() for h in handlers)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest с замером запросов к Bot API по методу."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        span = begin("api", api_method)
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.labels(api_method, type(e).__name__).inc()
+            if span is not None:
+                finish(span, describe(e))
+            raise
+        finally:
+            API_SECONDS.labels(api_method).observe(time.perf_counter() - started)
+        if code >= 400:
+            API_ERRORS.labels(api_method, str(code)).inc()
+        if span is not None:
+            span.attributes["status"] = code
+            finish(span, f"HTTP {code}" if code >= 400 else "")
+        return code, payload
+
+
+class MetricsServer:
+    """HTTP-сервер с /metrics и сборщики очередей для Application процесса."""
+
+    def __init__(self, registry: Registry = REGISTRY, host: str = METRICS_LISTEN, port: int = METRICS_PORT) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[HTTPServer] = None
+        self._collectors: list[Callable[[], Awaitable[None]]] = []
+
+    async def start(self, application: Application, shared: bool = True) -> None:
+        """Запустить сервер (post_init). shared — ещё и общие для бота очереди (outbox, выгрузка)."""
+        if not self.port:
+            return
+        self._collectors = [functools.partial(self._collect_process, application)]
+        if shared:
+            self._collectors.append(self._collect_shared)
+        for collector in self._collectors:
+            self.registry.add_collector(collector)
+        self._server = HTTPServer(self.host, self.port, max_connections=10)
+        self._server.route("GET", "/metrics", self.handle_metrics)
+        await self._server.start()
+        logger.info(f"Метрики: http://{self.host}:{self._server.bound_port}/metrics")
+
+    async def handle_metrics(self, request: Request) -> Response:
+        body = await self.registry.collect()
+        return Response(body=body.encode("utf-8"), content_type=CONTENT_TYPE)
+
+    @staticmethod
+    async def _collect_process(application: Application) -> None:
+        from database import adb
+
+        processor = application.update_processor
+        if hasattr(processor, "stats"):
+            stats = processor.stats()
+            UPDATES_RUNNING.set(stats["running"])
+            UPDATES_QUEUED.set(stats["queued"])
+            ACTIVE_CHATS.set(stats["active_chats"])
+        UPDATE_QUEUE_SIZE.set(application.update_queue.qsize())
+        ANALYTICS_QUEUED.set((await adb.get_analytics_sink_stats()).get("queued", 0))
+        DB_READERS_IN_USE.set((await adb.get_pool_stats())["readers_in_use"])
+
+    @staticmethod
+    async def _collect_shared() -> None:
+        from database import adb
+
+        outbox = await adb.get_outbox_stats()
+        for status in ("pending", "sending", "dead"):
+            OUTBOX_MESSAGES.labels(status).set(outbox.get(status, 0))
+        EXPORT_PENDING.clear()
+        EXPORT_LAG.clear()
+        for row in await adb.get_export_backlog():
+            EXPORT_PENDING.labels(row["name"]).set(row["pending"])
+            EXPORT_LAG.labels(row["name"]).set(row["lag"])
+
+    async def stop(self) -> None:
+        for collector in self._collectors:
+            self.registry.remove_collector(collector)
+        self._collectors = []
+        if self._server is not None:
+            await self._server.drain(1.0)
+            self._server = None
+
+
+metrics_server = MetricsServer()
+
+
+# --- Замер накладных расходов ---
+
+BENCH_ITERATIONS = 200_000
+
+
+def _per_call(func: Callable[[], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations
+
+
+def _noop() -> None:
+    pass
+
+
+async def _per_executor_call(iterations: int) -> float:
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await loop.run_in_executor(None, _noop)
+    return (time.perf_counter() - started) / iterations
+
+
+async def _per_await(callback: Callable, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await callback(None, None)
+    return (time.perf_counter() - started) / iterations
+
+
+def bench(iterations: int = BENCH_ITERATIONS) -> dict[str, float]:
+    """Накладные расходы (мкс) на одно измерение каждого вида и на типичный апдейт."""
+    registry = Registry()
+    histogram = Histogram("bench_seconds", "", ["name"], registry=registry)
+    errors = Counter("bench_errors_total", "", ["name"], registry=registry)
+
+    async def handler(update, context):
+        return None
+
+    wrapped = timed(handler, histogram, errors)
+    raw_await = asyncio.run(_per_await(handler, iterations))
+    wrapped_await = asyncio.run(_per_await(wrapped, iterations))
+    child = histogram.labels("x")
+
+    def timed_block() -> None:
+        started = time.perf_counter()
+        child.observe(time.perf_counter() - started)
+
+    def labelled_observe() -> None:
+        started = time.perf_counter()
+        histogram.labels("x").observe(time.perf_counter() - started)
+
+    call = _per_call(_noop, iterations)
+    result = {
+        "handler": (wrapped_await - raw_await) * 1e6,
+        "observe": (_per_call(timed_block, iterations) - call) * 1e6,
+        "observe_labels": (_per_call(labelled_observe, iterations) - call) * 1e6,
+    }
+    # Апдейт: ожидание и обработка в процессоре, ограничитель и обработчик,
+    # три функции БД (ожидание потока и время по имени), два запроса к Bot API
+    result["update"] = 5 * result["observe"] + 2 * result["handler"] + 5 * result["observe_labels"]
+    # Для сравнения: один вызов функции БД через пул потоков без замеров
+    result["executor"] = asyncio.run(_per_executor_call(iterations // 10)) * 1e6
+    return result
+
+
+if __name__ == "__main__":
+    costs = bench()
+    print(f"Итераций: {BENCH_ITERATIONS}")
+    print(f"обёртка обработчика:        {costs['handler']:.2f} мкс")
+    print(f"замер (готовый ряд):        {costs['observe']:.2f} мкс")
+    print(f"замер (поиск ряда по метке): {costs['observe_labels']:.2f} мкс")
+    print(f"на апдейт (2 обработчика, 3 функции БД, 2 запроса к API): {costs['update']:.2f} мкс")
+    print(f"для сравнения, вызов через пул потоков БД: {costs['executor']:.2f} мкс")
@@ -0,0 +1,144 @@
+"""Фоновая доставка уведомлений из outbox (notification_outbox).
+
+Уведомления о заявке записываются в БД в одной транзакции с самой заявкой
+(db.submit_order), а диспетчер рассылает их всем получателям параллельно:
+с ограничением частоты по чату, повторами с экспоненциальной задержкой и
+переносом в «мёртвые» после OUTBOX_MAX_ATTEMPTS неудачных попыток.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+
+from config import OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL
+from database import adb
+from utils.ratelimit import ChatRateLimiter, TokenBucket, telegram_bucket
+
+logger = logging.getLogger("bot")
+
+
+class OutboxDispatcher:
+    """Цикл доставки уведомлений из outbox."""
+
+    def __init__(
+        self,
+        bucket: TokenBucket = telegram_bucket,
+        chat_limiter: Optional[ChatRateLimiter] = None,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    ) -> None:
+        self.bucket = bucket
+        self.chat_limiter = chat_limiter or ChatRateLimiter()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def wake(self) -> None:
+        """Разбудить диспетчер (появились новые уведомления)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self, bot) -> None:
+        """Запустить доставку; отправки, прерванные прошлой остановкой, вернуть в очередь."""
+        if self._task is not None:
+            return
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        requeued = await adb.requeue_notifications(("sending",))
+        if requeued:
+            logger.warning(f"Outbox: {requeued} уведомлений возвращены в очередь после перезапуска")
+        self._spawn()
+
+    def _spawn(self, delay: float = 0.0) -> None:
+        self._task = asyncio.create_task(self._loop(delay))
+        self._task.add_done_callback(self._restart)
+
+    def _restart(self, task: asyncio.Task) -> None:
+        """Цикл упал с ошибкой — записать в лог и запустить заново через poll_interval."""
+        if task.cancelled() or task is not self._task:
+            return
+        error = task.exception()
+        if error is None:
+            return
+        logger.error(f"Outbox: цикл доставки остановился с ошибкой, перезапуск через {self.poll_interval:g} с", exc_info=error)
+        self._spawn(self.poll_interval)
+
+    async def stop(self) -> None:
+        """Остановить цикл (недоставленное останется в БД до следующего запуска)."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self, delay: float = 0.0) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        while True:
+            try:
+                rows = await adb.claim_due_notifications(self.batch_size)
+            except Exception:
+                logger.exception("Outbox: ошибка чтения очереди")
+                rows = []
+            if rows:
+                await asyncio.gather(*(self._deliver_guarded(row) for row in rows))
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _deliver_guarded(self, row: dict) -> None:
+        """_deliver, который не роняет цикл: ошибка (обычно БД) — в лог и повтор позже."""
+        try:
+            await self._deliver(row)
+        except Exception as e:
+            logger.exception(f"Outbox: ошибка доставки уведомления {row['id']} о заявке {row['order_id']}")
+            try:
+                await adb.reschedule_notification(row["id"], self.poll_interval, str(e))
+            except Exception:
+                # Останется в 'sending': вернётся в очередь при следующем запуске
+                logger.exception(f"Outbox: не удалось вернуть уведомление {row['id']} в очередь")
+
+    async def _deliver(self, row: dict) -> None:
+        chat_id = row["chat_id"]
+        await self.chat_limiter.acquire(chat_id)
+        await self.bucket.acquire()
+        try:
+            await self._bot.send_message(chat_id=chat_id, text=row["text"], parse_mode="Markdown")
+        except RetryAfter as e:
+            delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+            self.bucket.pause(delay)
+            await adb.reschedule_notification(row["id"], delay, str(e), count_attempt=False)
+            return
+        except (Forbidden, BadRequest, ChatMigrated) as e:
+            # Повтор не поможет: бот удалён из чата, неверный id или разметка
+            await self._dead_letter(row, str(e))
+            return
+        except Exception as e:
+            attempts = row["attempts"] + 1
+            if attempts >= self.max_attempts:
+                await self._dead_letter(row, str(e))
+                return
+            delay = min(3600, 5 * 2 ** (attempts - 1))
+            logger.warning(f"Outbox: уведомление {row['order_id']} в {chat_id} не отправлено ({e}), повтор через {delay} с")
+            await adb.reschedule_notification(row["id"], delay, str(e))
+            return
+        await adb.mark_notification_sent(row["id"])
+        logger.info(f"Уведомление о заявке {row['order_id']} отправлено в {chat_id}")
+
+    async def _dead_letter(self, row: dict, error: str) -> None:
+        logger.error(f"Outbox: уведомление о заявке {row['order_id']} в {row['chat_id']} не доставлено: {error}")
+        await adb.dead_letter_notification(row["id"], error)
+
+
+outbox = OutboxDispatcher()
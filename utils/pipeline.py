@@ -0,0 +1,402 @@
+"""Потоковая выгрузка изменений заявок микропакетами.
+
+Создание заявки и изменение её полей записываются триггерами в журнал
+order_events (в той же транзакции, из любого процесса). У каждого
+приёмника свой курсор в sync_state (export:<имя>) и своё окно: раз в окно
+он читает непрочитанные события (не больше max_batch), сворачивает их в
+одну запись на заявку с её текущим состоянием и отправляет одним пакетом.
+Курсор сдвигается только после успешной отправки (доставка «хотя бы
+один раз», в записи есть event_id для устранения повторов).
+
+Противодавление: в памяти не больше одного пакета на приёмник, остальное
+ждёт в журнале; полный пакет — следующий читается сразу, ошибка —
+следующая попытка с растущей задержкой. Отставание (событий и секунд до
+самого старого непрочитанного) видно в /admin_stats. События, прочитанные
+всеми приёмниками, удаляются. Приёмник, отставший больше чем на
+EXPORT_MAX_LAG_EVENTS событий или EXPORT_MAX_LAG_DAYS дней (например,
+долго недоступный вебхук), журнал не держит: старые события удаляются, его
+курсор переносится вперёд, пропуск пишется в лог. Курсоры приёмников,
+выключенных в конфигурации, удаляются при запуске.
+
+Приёмники: Google Sheets (utils/sheets.py), файл CSV/NDJSON, HTTP-вебхук.
+Работает в одном процессе (обработчик 0 при BOT_WORKERS > 1).
+"""
+import asyncio
+import csv
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Optional
+
+from config import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_FILE_PATH,
+    EXPORT_FILE_WINDOW,
+    EXPORT_MAX_LAG_DAYS,
+    EXPORT_MAX_LAG_EVENTS,
+    EXPORT_WEBHOOK_SECRET,
+    EXPORT_WEBHOOK_URL,
+    EXPORT_WEBHOOK_WINDOW,
+    SHEETS_SYNC_INTERVAL,
+)
+from database import adb
+from utils.sheets import SheetsSync, sheets_sync
+
+logger = logging.getLogger("bot")
+
+RECORD_FIELDS = [
+    "event_id",
+    "event",
+    "event_at",
+    "order_id",
+    "status",
+    "created_at",
+    "updated_at",
+    "user_id",
+    "username",
+    "full_name",
+    "phone",
+    "business_type",
+    "goal",
+    "budget",
+    "timeline",
+    "materials",
+    "contact_preference",
+    "manager_id",
+    "notes",
+]
+MAX_RETRY_DELAY = 300.0
+PRUNE_INTERVAL = 600.0
+# Сколько ждать последней отправки при остановке бота (неотправленное останется в журнале)
+STOP_FLUSH_TIMEOUT = 5.0
+
+
+def coalesce(events: list[dict]) -> list[dict]:
+    """Одна запись на заявку в порядке последнего события; created — если заявка создана в этом пакете."""
+    latest: dict[str, dict] = {}
+    created: set[str] = set()
+    for event in events:
+        if event["event"] == "created":
+            created.add(event["order_id"])
+        latest.pop(event["order_id"], None)
+        latest[event["order_id"]] = event
+    records = []
+    for order_id, event in latest.items():
+        record = {field: event.get(field) for field in RECORD_FIELDS}
+        record["event_id"] = event["id"]
+        record["event"] = "created" if order_id in created else event["event"]
+        records.append(record)
+    return records
+
+
+class ExportSink(ABC):
+    """Приёмник: name — имя курсора, window — окно микропакета (с), max_batch — событий за пакет."""
+
+    def __init__(self, name: str, window: float, max_batch: int = EXPORT_BATCH_SIZE) -> None:
+        self.name = name
+        self.window = max(0.1, window)
+        self.max_batch = max(1, max_batch)
+
+    @abstractmethod
+    async def write(self, records: list[dict]) -> None:
+        """Отправить пакет; исключение — пакет будет отправлен повторно."""
+
+    async def close(self) -> None:
+        pass
+
+
+class SheetsSink(ExportSink):
+    """Google Sheets: пакет событий — повод синхронизировать лист (SheetsSync сам выберет изменённые заявки)."""
+
+    def __init__(self, sync: SheetsSync = sheets_sync, window: float = SHEETS_SYNC_INTERVAL, max_batch: int = EXPORT_BATCH_SIZE) -> None:
+        super().__init__("sheets", window, max_batch)
+        self.sync = sync
+
+    async def write(self, records: list[dict]) -> None:
+        if await self.sync.run() is None:
+            raise RuntimeError("синхронизация с Google Sheets не выполнена")
+
+
+class FileSink(ExportSink):
+    """Дописывание в локальный файл: .csv (с заголовком в новом файле), иначе NDJSON."""
+
+    def __init__(self, path: Path, window: float = EXPORT_FILE_WINDOW, max_batch: int = EXPORT_BATCH_SIZE) -> None:
+        super().__init__("file", window, max_batch)
+        self.path = Path(path)
+        self.format = "csv" if self.path.suffix.lower() == ".csv" else "ndjson"
+
+    async def write(self, records: list[dict]) -> None:
+        await asyncio.to_thread(self._append, records)
+
+    def _append(self, records: list[dict]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new = not self.path.exists() or self.path.stat().st_size == 0
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            if self.format == "csv":
+                writer = csv.DictWriter(f, RECORD_FIELDS)
+                if new:
+                    writer.writeheader()
+                writer.writerows(records)
+            else:
+                f.writelines(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class HTTPSink(ExportSink):
+    """POST {"records": [...]} на url. С секретом — заголовок X-Signature-256: sha256=<HMAC тела>.
+
+    X-Export-Batch (первый-последний event_id) позволяет получателю отбросить повтор.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        secret: str = "",
+        window: float = EXPORT_WEBHOOK_WINDOW,
+        max_batch: int = EXPORT_BATCH_SIZE,
+        timeout: float = 10.0,
+    ) -> None:
+        super().__init__("webhook", window, max_batch)
+        self.url = url
+        self.secret = secret.encode("utf-8")
+        self.timeout = timeout
+        self._client = None
+
+    async def write(self, records: list[dict]) -> None:
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        body = json.dumps({"records": records}, ensure_ascii=False, default=str).encode("utf-8")
+        ids = [r["event_id"] for r in records]
+        headers = {"Content-Type": "application/json", "X-Export-Batch": f"{min(ids)}-{max(ids)}"}
+        if self.secret:
+            headers["X-Signature-256"] = "sha256=" + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        response = await self._client.post(self.url, content=body, headers=headers)
+        response.raise_for_status()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class SinkRunner:
+    """Цикл одного приёмника: чтение журнала по курсору, отправка, повторы, метрики."""
+
+    def __init__(self, sink: ExportSink) -> None:
+        self.sink = sink
+        self.cursor = 0
+        self.pending = 0
+        self.lag = 0.0
+        self.batches = 0
+        self.events = 0
+        self.records = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_error = ""
+        self.last_duration = 0.0
+        self._consecutive_failures = 0
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def state_name(self) -> str:
+        return f"export:{self.sink.name}"
+
+    async def start(self) -> None:
+        saved = await adb.get_sync_state(self.state_name)
+        if saved is None:
+            # Новый приёмник получает события с момента подключения
+            self.cursor = await adb.get_order_events_head()
+            await adb.set_sync_state(self.state_name, str(self.cursor))
+        else:
+            self.cursor = int(saved)
+        self._task = asyncio.create_task(self._loop())
+        self._task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Выгрузка остановилась с ошибкой", exc_info=task.exception())
+
+    async def _loop(self) -> None:
+        delay = self.sink.window
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            if self._stop.is_set():
+                break
+            try:
+                delay = await self.step()
+            except Exception as e:
+                # Ошибка БД (чтение журнала, сохранение курсора) — повтор, как после неудачной отправки
+                delay = self._retry_delay(e)
+
+    async def step(self) -> float:
+        """Отправить один пакет. Возвращает задержку до следующего."""
+        events = await adb.get_order_events(self.cursor, self.sink.max_batch)
+        if not events:
+            self.pending, self.lag = 0, 0.0
+            return self.sink.window
+        records = coalesce(events)
+        started = time.monotonic()
+        try:
+            await self.sink.write(records)
+        except Exception as e:
+            delay = self._retry_delay(e)
+            try:
+                await self._measure_lag()
+            except Exception:
+                logger.debug(f"Выгрузка {self.sink.name}: отставание не обновлено", exc_info=True)
+            return delay
+        self.last_duration = time.monotonic() - started
+        self._consecutive_failures = 0
+        # Не назад: пока пакет отправлялся, prune мог перенести курсор (skip_to)
+        self.cursor = max(self.cursor, events[-1]["id"])
+        await adb.set_sync_state(self.state_name, str(self.cursor))
+        self.batches += 1
+        self.events += len(events)
+        self.records += len(records)
+        if len(events) < self.sink.max_batch:
+            self.pending, self.lag = 0, 0.0
+            return self.sink.window
+        # Пакет полный: в журнале есть ещё, читать сразу
+        await self._measure_lag()
+        return 0.0
+
+    def _retry_delay(self, error: Exception) -> float:
+        """Учесть ошибку и вернуть растущую задержку до следующей попытки."""
+        self.failures += 1
+        self._consecutive_failures += 1
+        self.last_error = repr(error)[:200]
+        delay = min(MAX_RETRY_DELAY, self.sink.window * 2 ** self._consecutive_failures)
+        logger.warning(f"Выгрузка {self.sink.name}: {self.last_error}, повтор через {delay:.0f} с")
+        return delay
+
+    async def skip_to(self, event_id: int) -> None:
+        """Перенести курсор вперёд: события до event_id удаляются без отправки этим приёмником."""
+        skipped, self.cursor = event_id - self.cursor, event_id
+        await adb.set_sync_state(self.state_name, str(event_id))
+        self.skipped += skipped
+        logger.error(
+            f"Выгрузка {self.sink.name}: отставание больше предела, пропущено событий: {skipped} "
+            f"(курсор перенесён на {event_id}, последняя ошибка: {self.last_error or 'нет'})"
+        )
+
+    async def _measure_lag(self) -> None:
+        for row in await adb.get_export_backlog(self.sink.name):
+            self.pending, self.lag = row["pending"], row["lag"]
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+            try:
+                await asyncio.wait_for(self.step(), STOP_FLUSH_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Выгрузка {self.sink.name}: последний пакет не отправлен ({e!r})")
+        await self.sink.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.sink.name,
+            "window": self.sink.window,
+            "cursor": self.cursor,
+            "pending": self.pending,
+            "lag": self.lag,
+            "batches": self.batches,
+            "events": self.events,
+            "records": self.records,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_error": self.last_error,
+            "last_duration": self.last_duration,
+        }
+
+
+def default_sinks() -> list[ExportSink]:
+    """Приёмники, включённые в конфигурации."""
+    sinks: list[ExportSink] = []
+    if sheets_sync.configured:
+        sinks.append(SheetsSink())
+    if EXPORT_FILE_PATH:
+        sinks.append(FileSink(Path(EXPORT_FILE_PATH)))
+    if EXPORT_WEBHOOK_URL:
+        sinks.append(HTTPSink(EXPORT_WEBHOOK_URL, EXPORT_WEBHOOK_SECRET))
+    return sinks
+
+
+class ExportPipeline:
+    """Приёмники выгрузки и очистка прочитанного журнала."""
+
+    def __init__(
+        self,
+        sinks: Optional[list[ExportSink]] = None,
+        prune_interval: float = PRUNE_INTERVAL,
+        max_lag_events: int = EXPORT_MAX_LAG_EVENTS,
+        max_lag_days: float = EXPORT_MAX_LAG_DAYS,
+    ) -> None:
+        self._sinks = sinks
+        self.prune_interval = prune_interval
+        self.max_lag_events = max_lag_events
+        self.max_lag_days = max_lag_days
+        self.runners: list[SinkRunner] = []
+        self._prune_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        sinks = default_sinks() if self._sinks is None else self._sinks
+        self.runners = [SinkRunner(sink) for sink in sinks]
+        stale = await adb.delete_export_cursors([runner.sink.name for runner in self.runners])
+        if stale:
+            logger.warning(f"Выгрузка: удалены курсоры выключенных приёмников: {', '.join(stale)}")
+        for runner in self.runners:
+            await runner.start()
+        self._prune_task = asyncio.create_task(self._prune_loop())
+        self._prune_task.add_done_callback(SinkRunner._log_failure)
+        if self.runners:
+            logger.info("Выгрузка заявок: " + ", ".join(f"{r.sink.name} (окно {r.sink.window:g} с)" for r in self.runners))
+
+    async def prune(self) -> int:
+        """Удалить события, прочитанные всеми приёмниками (без приёмников — все).
+
+        Отставшие больше предела приёмники не учитываются: их курсор переносится вперёд.
+        """
+        if not self.runners:
+            up_to = await adb.get_order_events_head()
+            return await adb.prune_order_events(up_to) if up_to else 0
+        floor = await adb.get_order_events_floor(self.max_lag_events, self.max_lag_days)
+        for runner in self.runners:
+            if runner.cursor < floor:
+                await runner.skip_to(floor)
+        up_to = min(r.cursor for r in self.runners)
+        return await adb.prune_order_events(up_to) if up_to else 0
+
+    async def _prune_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            try:
+                await self.prune()
+            except Exception:
+                logger.exception("Не удалось очистить журнал событий заявок")
+
+    async def stop(self) -> None:
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            self._prune_task = None
+        await asyncio.gather(*(runner.stop() for runner in self.runners))
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [runner.stats() for runner in self.runners]
+
+
+export_pipeline = ExportPipeline()
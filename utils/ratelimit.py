@@ -0,0 +1,145 @@
+"""Ограничение частоты: действия пользователей (скользящее окно) и исходящие отправки."""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+from config import RATE_LIMITS, TELEGRAM_SEND_RATE
+
+
+class SlidingWindowLimiter:
+    """Счётчики попаданий по (область, ключ) в скользящем окне.
+
+    limits: {область: (максимум попаданий, окно в секундах)}. Время — unix
+    timestamp, чтобы состояние можно было сохранить в БД и поднять после
+    перезапуска.
+    """
+
+    def __init__(self, limits: dict[str, tuple[int, float]]) -> None:
+        self.limits = dict(limits)
+        self._hits: dict[tuple[str, int], deque] = {}
+        self._dirty: set[tuple[str, int]] = set()
+        self._lock = threading.Lock()
+
+    def _window(self, scope: str, key: int, now: float) -> Optional[deque]:
+        hits = self._hits.get((scope, key))
+        if hits is None:
+            return None
+        border = now - self.limits[scope][1]
+        while hits and hits[0] <= border:
+            hits.popleft()
+        return hits
+
+    def check(self, scope: str, key: int, now: Optional[float] = None) -> bool:
+        """Можно ли ещё одно действие (без учёта попадания)."""
+        if scope not in self.limits:
+            return True
+        now = time.time() if now is None else now
+        with self._lock:
+            hits = self._window(scope, key, now)
+            return hits is None or len(hits) < self.limits[scope][0]
+
+    def hit(self, scope: str, key: int, now: Optional[float] = None) -> bool:
+        """Учесть действие, если лимит позволяет. False — лимит превышен."""
+        if scope not in self.limits:
+            return True
+        now = time.time() if now is None else now
+        with self._lock:
+            hits = self._window(scope, key, now)
+            if hits is None:
+                hits = self._hits[(scope, key)] = deque()
+            if len(hits) >= self.limits[scope][0]:
+                return False
+            hits.append(now)
+            self._dirty.add((scope, key))
+            return True
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """Удалить из памяти ключи без попаданий в окне."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for scope, key in list(self._hits):
+                if not self._window(scope, key, now):
+                    del self._hits[(scope, key)]
+                    self._dirty.add((scope, key))
+
+    def take_dirty(self) -> list[tuple[str, int, list[float]]]:
+        """Изменённые с прошлого сохранения ключи: (область, ключ, попадания)."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return [(scope, key, list(self._hits.get((scope, key), ()))) for scope, key in dirty]
+
+    def load(self, rows: Iterable[tuple[str, int, list[float]]], now: Optional[float] = None) -> None:
+        """Восстановить состояние (сохранённое или посчитанное по БД)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for scope, key, hits in rows:
+                if scope not in self.limits:
+                    continue
+                self._hits[(scope, key)] = deque(sorted(hits)[-self.limits[scope][0]:])
+                self._window(scope, key, now)
+
+
+limiter = SlidingWindowLimiter(RATE_LIMITS)
+
+
+class TokenBucket:
+    """Асинхронное «ведро токенов»: не больше rate отправок в секунду (с запасом burst).
+
+    pause() останавливает всех ожидающих — так обрабатывается RetryAfter
+    от Telegram: лимит общий на бота, а не на один чат.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    async def acquire(self) -> None:
+        """Дождаться токена."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatRateLimiter:
+    """Минимальный интервал между сообщениями в один чат (для групп — больше)."""
+
+    def __init__(self, interval: float = 1.0, group_interval: float = 3.0) -> None:
+        self.interval = interval
+        self.group_interval = group_interval
+        self._next: dict[int, float] = {}
+
+    async def acquire(self, chat_id: int) -> None:
+        """Дождаться, пока в чат снова можно писать, и занять слот."""
+        now = time.monotonic()
+        slot = max(now, self._next.get(chat_id, 0.0))
+        # Группы и каналы в Telegram имеют отрицательный id
+        self._next[chat_id] = slot + (self.group_interval if chat_id < 0 else self.interval)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        if len(self._next) > 10000:
+            self._next = {k: v for k, v in self._next.items() if v > now}
+
+
+# Общий лимит исходящих сообщений бота (~30 в секунду по правилам Telegram)
+telegram_bucket = TokenBucket(TELEGRAM_SEND_RATE)
@@ -0,0 +1,139 @@
+"""Готовые ответы: текст, разметка и клавиатура, собранные один раз при импорте.
+
+Статичные ответы (/start, /price, /help, FAQ, шаги квиза) одинаковы для всех
+пользователей, поэтому обработчики отправляют заранее подготовленный набор
+аргументов, а не собирают его заново на каждое сообщение.
+
+Замер (время и память на ответ, прежняя сборка и готовый ответ):
+python -m utils.responses
+"""
+import asyncio
+import time
+import tracemalloc
+from typing import Optional, Union
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+from keyboards.inline import QUIZ_BUSINESS_KEYBOARD, QUIZ_GOAL_KEYBOARD
+from keyboards.main import CONTACT_KEYBOARD, MAIN_INLINE_KEYBOARD, MAIN_KEYBOARD
+from utils import messages
+
+ReplyMarkup = Union[InlineKeyboardMarkup, ReplyKeyboardMarkup]
+
+
+class Reply:
+    """Неизменяемый ответ бота. parse_mode=None — режим по умолчанию (Defaults)."""
+
+    __slots__ = ("text", "parse_mode", "reply_markup", "_kwargs")
+
+    def __init__(self, text: str, parse_mode: Optional[str] = None, reply_markup: Optional[ReplyMarkup] = None) -> None:
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_markup = reply_markup
+        kwargs = {"text": text}
+        if parse_mode is not None:
+            kwargs["parse_mode"] = parse_mode
+        if reply_markup is not None:
+            kwargs["reply_markup"] = reply_markup
+        self._kwargs = kwargs
+
+    async def reply(self, message):
+        """Ответить на сообщение."""
+        return await message.reply_text(**self._kwargs)
+
+    async def send(self, bot, chat_id: int):
+        """Отправить в чат."""
+        return await bot.send_message(chat_id=chat_id, **self._kwargs)
+
+    async def edit(self, query):
+        """Заменить сообщение с inline-кнопками (только inline-клавиатура)."""
+        return await query.edit_message_text(**self._kwargs)
+
+
+# Меню и команды
+START = Reply(messages.WELCOME_MESSAGE, "Markdown", MAIN_INLINE_KEYBOARD)
+MENU = Reply(messages.MENU_TITLE, reply_markup=MAIN_INLINE_KEYBOARD)
+HELP = Reply(messages.HELP_MESSAGE, "Markdown")
+PORTFOLIO = Reply(messages.PORTFOLIO_MESSAGE, "Markdown")
+PRICE = Reply(messages.PRICE_LIST, "Markdown")
+PRICE_MENU = Reply(messages.PRICE_LIST, "Markdown", MAIN_INLINE_KEYBOARD)
+FAQ_MENU = Reply(messages.FAQ_MESSAGE, "Markdown", MAIN_INLINE_KEYBOARD)
+CABINET = Reply(messages.CABINET_MESSAGE, reply_markup=MAIN_INLINE_KEYBOARD)
+MENU_HINT = Reply(messages.MENU_HINT, reply_markup=MAIN_INLINE_KEYBOARD)
+NO_ORDERS = Reply(messages.NO_ORDERS_MESSAGE, reply_markup=MAIN_KEYBOARD)
+
+# Квиз
+QUIZ_INTRO = Reply(messages.QUIZ_INTRO, "Markdown")
+QUIZ_BUSINESS = Reply(messages.QUIZ_Q1, "Markdown", QUIZ_BUSINESS_KEYBOARD)
+QUIZ_GOAL = Reply(messages.QUIZ_Q2, "Markdown", QUIZ_GOAL_KEYBOARD)
+QUIZ_CONTACT = Reply(messages.QUIZ_CONTACT, "Markdown", CONTACT_KEYBOARD)
+PHONE_INVALID = Reply(messages.PHONE_INVALID, reply_markup=CONTACT_KEYBOARD)
+ORDER_LIMIT = Reply(messages.ORDER_LIMIT_MESSAGE, reply_markup=MAIN_KEYBOARD)
+ORDER_CANCELLED = Reply(messages.ORDER_CANCELLED, reply_markup=MAIN_KEYBOARD)
+ACTION_CANCELLED = Reply(messages.ACTION_CANCELLED, reply_markup=MAIN_KEYBOARD)
+
+
+# --- Замер ---
+
+BENCH_REPLIES = 50_000
+
+
+class _Message:
+    """Сообщение без сети: reply_text возвращает аргументы, как их получил бы Bot API."""
+
+    async def reply_text(self, text, **kwargs):
+        return {"text": text, **kwargs}
+
+
+def _legacy_main_inline_keyboard() -> InlineKeyboardMarkup:
+    # Как get_main_inline_keyboard() до готовых ответов: новая разметка на каждый вызов
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton("🎯 ЗАКАЗАТЬ САЙТ", callback_data="menu_order")],
+            [
+                InlineKeyboardButton("💰 Цены и услуги", callback_data="menu_price"),
+                InlineKeyboardButton("❓ FAQ", callback_data="menu_faq"),
+            ],
+            [InlineKeyboardButton("👤 Мой кабинет", callback_data="menu_status")],
+        ]
+    )
+
+
+async def _legacy_start(message):
+    return await message.reply_text(messages.WELCOME_MESSAGE, parse_mode="Markdown", reply_markup=_legacy_main_inline_keyboard())
+
+
+async def _prepared_start(message):
+    return await START.reply(message)
+
+
+async def _replies(send, count: int) -> list:
+    message = _Message()
+    return [await send(message) for _ in range(count)]
+
+
+def _measure(send, count: int) -> tuple[float, float]:
+    """Время (мкс) и память (байт), занятая одним ответом, пока он ждёт отправки."""
+    started = time.perf_counter()
+    asyncio.run(_replies(send, count))
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    replies = asyncio.run(_replies(send, count))
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del replies
+    return elapsed / count * 1e6, held / count
+
+
+def bench(count: int = BENCH_REPLIES) -> dict[str, tuple[float, float]]:
+    """Ответ на /start: прежняя сборка аргументов и клавиатуры против готового Reply."""
+    return {"legacy": _measure(_legacy_start, count), "prepared": _measure(_prepared_start, count)}
+
+
+if __name__ == "__main__":
+    results = bench()
+    print(f"Ответов: {BENCH_REPLIES}")
+    for name, title in (("legacy", "сборка на каждый ответ"), ("prepared", "готовый ответ")):
+        per_reply, held = results[name]
+        print(f"{title + ':':<24} {per_reply:.2f} мкс, {held:.0f} байт на ответ")
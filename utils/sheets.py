@@ -0,0 +1,224 @@
+"""Инкрементальная синхронизация заявок с Google Sheets.
+
+Первый лист таблицы ведёт бот: строка 1 — заголовок, дальше по строке на
+заявку. Номер строки каждой заявки хранится в sheets_rows, поэтому смена
+статуса перезаписывает ту же строку, а повторный запуск ничего не
+дублирует. Выбираются только заявки, изменённые после отметки (updated_at
+последней выгруженной, с запасом SYNC_OVERLAP), и пишутся только строки,
+значения которых изменились (хеш).
+
+Запись — batch_update по явным диапазонам, пачками по SHEETS_BATCH_SIZE;
+ответы 429/5xx и сетевые ошибки повторяются с экспоненциальной задержкой.
+Работа с gspread и БД идёт в отдельном потоке, клиент авторизуется один
+раз на процесс. При первой синхронизации непустого листа (старый экспорт
+дописывал строки в конец) номера строк берутся из колонки «ID заявки».
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from config import (
+    GOOGLE_CREDENTIALS_PATH,
+    GOOGLE_SHEET_ID,
+    SHEETS_BACKOFF,
+    SHEETS_BATCH_SIZE,
+    SHEETS_RETRIES,
+)
+from database import db
+
+logger = logging.getLogger("bot")
+
+HEADER = ["Дата", "ID заявки", "Имя", "Телефон", "Статус"]
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.readonly",
+]
+# Запас выборки по updated_at: изменение с более ранним временем могло закоммититься позже
+SYNC_OVERLAP = timedelta(seconds=60)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class SyncResult:
+    appended: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def format(self) -> str:
+        return f"добавлено {self.appended}, обновлено {self.updated}, без изменений {self.unchanged}"
+
+
+def order_row(order: dict) -> list[str]:
+    """Значения строки листа для заявки (колонки HEADER)."""
+    return [
+        str(order.get("created_at") or ""),
+        str(order.get("order_id") or ""),
+        str(order.get("full_name") or ""),
+        str(order.get("phone") or ""),
+        str(order.get("status") or ""),
+    ]
+
+
+def _row_hash(values: list[str]) -> str:
+    return hashlib.sha1("\x1f".join(values).encode("utf-8")).hexdigest()
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(error, OSError)
+
+
+class SheetsSync:
+    """Синхронизация заявок с первым листом таблицы sheet_id.
+
+    client_factory возвращает авторизованный клиент gspread (по умолчанию —
+    сервисный аккаунт из credentials_path).
+    """
+
+    def __init__(
+        self,
+        sheet_id: str = GOOGLE_SHEET_ID,
+        credentials_path: Path = GOOGLE_CREDENTIALS_PATH,
+        client_factory: Optional[Callable[[], Any]] = None,
+        batch_size: int = SHEETS_BATCH_SIZE,
+        retries: int = SHEETS_RETRIES,
+        backoff: float = SHEETS_BACKOFF,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.sheet_id = sheet_id
+        self.credentials_path = Path(credentials_path)
+        self.client_factory = client_factory
+        self.batch_size = max(1, batch_size)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self._sleep = sleep
+        self._client: Any = None
+        self._worksheet: Any = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.sheet_id) and (self.client_factory is not None or self.credentials_path.exists())
+
+    @property
+    def state_name(self) -> str:
+        return f"sheets:{self.sheet_id}"
+
+    def _authorize(self) -> Any:
+        import gspread
+
+        return gspread.service_account(filename=str(self.credentials_path), scopes=SCOPES)
+
+    def _call(self, func: Callable[[], Any]) -> Any:
+        """Запрос к API с повторами при временных ошибках."""
+        for attempt in range(self.retries + 1):
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.retries or not _is_retryable(e):
+                    raise
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+                logger.warning(f"Google Sheets: {e!r}, повтор через {delay:.1f} с")
+                self._sleep(delay)
+
+    def _get_worksheet(self) -> Any:
+        if self._worksheet is None:
+            if self._client is None:
+                self._client = (self.client_factory or self._authorize)()
+            self._worksheet = self._call(lambda: self._client.open_by_key(self.sheet_id).sheet1)
+        return self._worksheet
+
+    def _adopt(self, worksheet: Any) -> int:
+        """Первая синхронизация листа: заголовок в пустой лист или строки уже выгруженных заявок.
+
+        Возвращает номер последней занятой строки.
+        """
+        values = self._call(worksheet.get_all_values)
+        if not values:
+            self._call(lambda: worksheet.update(range_name="A1:E1", values=[HEADER]))
+            return 1
+        rows, seen = [], {HEADER[1]}
+        for number, row in enumerate(values, 1):
+            order_id = row[1] if len(row) > 1 else ""
+            if order_id and order_id not in seen:
+                seen.add(order_id)
+                rows.append((order_id, number, _row_hash((row + [""] * len(HEADER))[: len(HEADER)])))
+        db.save_sheet_rows(self.sheet_id, rows)
+        logger.info(f"Google Sheets: в листе найдено заявок {len(rows)}, строк {len(values)}")
+        return len(values)
+
+    def _ensure_rows(self, worksheet: Any, last_row: int) -> None:
+        # batch_update не расширяет лист, в отличие от append_rows
+        if last_row > worksheet.row_count:
+            self._call(lambda: worksheet.add_rows(max(last_row - worksheet.row_count, self.batch_size)))
+
+    def sync(self) -> SyncResult:
+        """Выгрузить изменения (синхронно; из бота — через run)."""
+        result = SyncResult()
+        worksheet = self._get_worksheet()
+        last_row = db.get_sheet_last_row(self.sheet_id)
+        if last_row is None:
+            last_row = self._adopt(worksheet)
+        mark = db.get_sync_state(self.state_name)
+        since = None
+        if mark is not None:
+            since = (datetime.fromisoformat(mark) - SYNC_OVERLAP).strftime("%Y-%m-%d %H:%M:%S")
+        after = None
+        while True:
+            orders = db.get_orders_changed_since(since, after, self.batch_size)
+            if not orders:
+                break
+            known = db.get_sheet_rows(self.sheet_id, [o["order_id"] for o in orders])
+            data, rows = [], []
+            for order in orders:
+                values = order_row(order)
+                row_hash = _row_hash(values)
+                number, stored_hash = known.get(order["order_id"], (None, None))
+                if row_hash == stored_hash:
+                    result.unchanged += 1
+                    continue
+                if number is None:
+                    last_row += 1
+                    number = last_row
+                    result.appended += 1
+                else:
+                    result.updated += 1
+                data.append({"range": f"A{number}:E{number}", "values": [values]})
+                rows.append((order["order_id"], number, row_hash))
+            if data:
+                self._ensure_rows(worksheet, last_row)
+                self._call(lambda: worksheet.batch_update(data, value_input_option="USER_ENTERED"))
+            last = orders[-1]
+            after = (last["updated_at"], last["id"])
+            # Отметка сдвигается вместе со строками: после сбоя следующий запуск продолжит отсюда
+            db.save_sheet_rows(self.sheet_id, rows, (self.state_name, last["updated_at"]))
+            if len(orders) < self.batch_size:
+                break
+        return result
+
+    async def run(self) -> Optional[SyncResult]:
+        """Синхронизация в отдельном потоке. None — не настроено, уже идёт или ошибка (в логе)."""
+        if not self.configured or self._lock.locked():
+            return None
+        async with self._lock:
+            try:
+                result = await asyncio.to_thread(self.sync)
+            except Exception:
+                # Лист могли переименовать или удалить: открыть заново при следующем запуске
+                self._worksheet = None
+                logger.exception("Ошибка синхронизации с Google Sheets")
+                return None
+        if result.appended or result.updated:
+            logger.info(f"Google Sheets: {result.format()}")
+        return result
+
+
+sheets_sync = SheetsSync()
@@ -0,0 +1,304 @@
+"""Трассировка апдейтов: дерево спанов на каждый апдейт.
+
+Корневой спан открывает ChatOrderedUpdateProcessor, текущий спан хранится
+в contextvars (у каждого апдейта своя задача asyncio, контексты не
+смешиваются). Дочерние спаны:
+- handler — обработчик (обёртка из utils/metrics.py);
+- db — функция database.db через adb.run (контекст копируется в поток
+  БД), с SQL-выражениями из trace callback подключений пула;
+- api — запрос к Bot API (InstrumentedRequest).
+
+Завершённый апдейт:
+- дольше TRACE_SLOW_UPDATE_MS или с функцией БД дольше TRACE_SLOW_QUERY_MS —
+  дерево спанов в лог (warning);
+- в TRACE_FILE (JSON Lines, строка на спан: trace_id, span_id,
+  parent_span_id, время в наносекундах Unix, атрибуты — как в OTLP)
+  попадает доля TRACE_SAMPLE_RATE апдейтов и все медленные. Запись — в
+  фоновом потоке, файл открывается на каждую пачку (внешняя ротация не
+  мешает), при превышении TRACE_FILE_MAX_MB переименовывается в .1.
+
+Медленная функция БД вне апдейта (задачи, outbox) пишется в лог отдельно.
+Строковые литералы в SQL заменяются на '?': в файл не попадают телефоны и
+тексты пользователей.
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from config import (
+    TRACE_FILE,
+    TRACE_FILE_MAX_MB,
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_QUERY_MS,
+    TRACE_SLOW_UPDATE_MS,
+)
+
+logger = logging.getLogger("bot")
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+MAX_SQL_LENGTH = 1000
+
+
+class Span:
+    __slots__ = ("kind", "name", "attributes", "root", "children", "statements", "start", "end", "error", "token", "start_ns", "slow")
+
+    def __init__(self, kind: str, name: str, attributes: Optional[dict[str, Any]] = None, root: Optional["Span"] = None) -> None:
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes or {}
+        self.root = root or self
+        self.children: list[Span] = []
+        # (perf_counter, выражение) — SQL, выполненные внутри спана
+        self.statements: list[tuple[float, str]] = []
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error = ""
+        self.token: Optional[contextvars.Token] = None
+        self.start_ns = 0
+        # Медленные функции БД внутри апдейта (только у корня)
+        self.slow: list[Span] = []
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def _sql(statement: str) -> str:
+    return _LITERAL.sub("?", " ".join(statement.split()))[:MAX_SQL_LENGTH]
+
+
+def describe(error: BaseException) -> str:
+    return f"{type(error).__name__}: {error}"[:200]
+
+
+# --- Спаны ---
+
+def begin(kind: str, name: str, attributes: Optional[dict[str, Any]] = None) -> Optional[Span]:
+    """Открыть дочерний спан текущего. None — трассировки нет (вне апдейта)."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    span = Span(kind, name, attributes, parent.root)
+    parent.children.append(span)
+    span.token = _current.set(span)
+    return span
+
+
+def begin_db(name: str) -> Optional[Span]:
+    """Спан функции БД; вне апдейта — отдельный, только ради порога медленного запроса."""
+    span = begin("db", name)
+    if span is None and tracer.slow_query_ms:
+        span = Span("db", name)
+        span.token = _current.set(span)
+    return span
+
+
+def finish(span: Span, error: str = "") -> None:
+    span.end = time.perf_counter()
+    span.error = error
+    _current.reset(span.token)
+    if span.kind == "db" and tracer.slow_query_ms and span.duration_ms >= tracer.slow_query_ms:
+        if span.root is span:
+            logger.warning(f"Медленный запрос к БД вне апдейта:\n{format_tree(span)}")
+        else:
+            span.root.slow.append(span)
+
+
+def record_statement(statement: str) -> None:
+    """SQL-выражение подключения пула (trace callback) — в текущий спан."""
+    span = _current.get()
+    if span is not None:
+        span.statements.append((time.perf_counter(), statement))
+
+
+def begin_update(update: object) -> Optional[Span]:
+    """Корневой спан апдейта (в задаче, которая его обрабатывает)."""
+    if not tracer.enabled:
+        return None
+    attributes: dict[str, Any] = {"update_id": getattr(update, "update_id", None)}
+    name = "update"
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        attributes["chat_id"] = chat.id
+    message = getattr(update, "message", None)
+    callback_query = getattr(update, "callback_query", None)
+    if message is not None:
+        name = "message"
+        text = message.text or ""
+        if text.startswith("/"):
+            # Только команда: текст пользователя в трассировку не попадает
+            name += " " + text.split(maxsplit=1)[0]
+        elif message.contact is not None:
+            name += " contact"
+    elif callback_query is not None:
+        name = f"callback_query {callback_query.data or ''}".rstrip()
+    span = Span("update", name, attributes)
+    span.start_ns = time.time_ns()
+    span.token = _current.set(span)
+    return span
+
+
+def finish_update(root: Span, error: str = "") -> None:
+    finish(root, error)
+    root.attributes["db_statements"] = count_statements(root)
+    duration = root.duration_ms
+    slow = bool(tracer.slow_update_ms and duration >= tracer.slow_update_ms)
+    if slow or root.slow:
+        reasons = []
+        if slow:
+            reasons.append(f"апдейт {duration:.0f} мс")
+        reasons.extend(f"{s.name} {s.duration_ms:.0f} мс" for s in root.slow)
+        logger.warning(f"Медленный апдейт {root.attributes.get('update_id')} ({', '.join(reasons)}):\n{format_tree(root)}")
+    if tracer.path and (slow or root.slow or random.random() < tracer.sample_rate):
+        tracer.export(root)
+
+
+# --- Вывод ---
+
+def count_statements(span: Span) -> int:
+    return len(span.statements) + sum(count_statements(child) for child in span.children)
+
+
+def format_tree(root: Span) -> str:
+    """Дерево спанов с длительностями и SQL (для лога)."""
+    lines: list[str] = []
+
+    def walk(span: Span, depth: int) -> None:
+        indent = "  " * depth
+        attributes = "".join(f" {k}={v}" for k, v in span.attributes.items() if v is not None)
+        error = f" ошибка: {span.error}" if span.error else ""
+        offset = (span.start - root.start) * 1000
+        lines.append(f"{indent}{span.kind} {span.name}: {span.duration_ms:.1f} мс (+{offset:.1f}){attributes}{error}")
+        for at, statement in span.statements:
+            lines.append(f"{indent}  sql (+{(at - root.start) * 1000:.1f}): {_sql(statement)}")
+        for child in span.children:
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(lines)
+
+
+def span_records(root: Span) -> list[dict[str, Any]]:
+    """Спаны апдейта в виде записей JSON Lines (поля по образцу OTLP)."""
+    trace_id = os.urandom(16).hex()
+    base_ns = root.start_ns or time.time_ns()
+    records: list[dict[str, Any]] = []
+
+    def ns(at: float) -> int:
+        return base_ns + int((at - root.start) * 1e9)
+
+    def add(kind: str, name: str, start: float, end: float, parent_id: str, attributes: dict, error: str) -> str:
+        span_id = os.urandom(8).hex()
+        records.append({
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_span_id": parent_id,
+            "name": name,
+            "kind": kind,
+            "start_time_unix_nano": ns(start),
+            "end_time_unix_nano": ns(end),
+            "duration_ms": round((end - start) * 1000, 3),
+            "status": "error" if error else "ok",
+            "error": error,
+            "attributes": {**attributes, "update_id": root.attributes.get("update_id")},
+        })
+        return span_id
+
+    def walk(span: Span, parent_id: str) -> None:
+        end = span.end or root.end or time.perf_counter()
+        span_id = add(span.kind, span.name, span.start, end, parent_id, span.attributes, span.error)
+        # Время выражения — до начала следующего (trace callback сообщает только начало)
+        starts = [at for at, _ in span.statements]
+        for i, (at, statement) in enumerate(span.statements):
+            until = starts[i + 1] if i + 1 < len(starts) else end
+            add("sql", _sql(statement), at, until, span_id, {}, "")
+        for child in span.children:
+            walk(child, span_id)
+
+    walk(root, "")
+    return records
+
+
+class Tracer:
+    """Настройки трассировки и фоновая запись в файл."""
+
+    def __init__(
+        self,
+        path: str = TRACE_FILE,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        slow_update_ms: float = TRACE_SLOW_UPDATE_MS,
+        slow_query_ms: float = TRACE_SLOW_QUERY_MS,
+        max_file_mb: float = TRACE_FILE_MAX_MB,
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.sample_rate = sample_rate
+        self.slow_update_ms = slow_update_ms
+        self.slow_query_ms = slow_query_ms
+        self.max_file_bytes = int(max_file_mb * 1024 * 1024)
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.slow_update_ms or self.slow_query_ms)
+
+    def export(self, root: Span) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+            self._thread.start()
+        self._queue.put(root)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            roots = [root for root in batch if root is not None]
+            if roots:
+                try:
+                    self._write(roots)
+                except Exception:
+                    logger.exception("Не удалось записать трассировку")
+            if batch[-1] is None:
+                return
+
+    def _write(self, roots: list[Span]) -> None:
+        data = "".join(
+            json.dumps(record, ensure_ascii=False, default=str) + "\n" for root in roots for record in span_records(root)
+        ).encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if self.max_file_bytes and self.path.stat().st_size + len(data) > self.max_file_bytes:
+                os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+        except FileNotFoundError:
+            pass
+        # Одна запись в O_APPEND: строки процессов-обработчиков не перемешиваются
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Дописать накопленное (при остановке бота)."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+tracer = Tracer()
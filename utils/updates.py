@@ -0,0 +1,167 @@
+"""Параллельная обработка апдейтов с сохранением порядка внутри чата.
+
+Апдейты разных чатов обрабатываются одновременно (не больше
+UPDATE_CONCURRENCY), апдейты одного чата — строго по очереди: у каждого
+активного чата своя asyncio.Lock, а она отдаёт управление ожидающим в
+порядке прихода. Поэтому шаги квиза (ConversationHandler) одного
+пользователя не обгоняют друг друга.
+
+Слот общего лимита занимается только после блокировки чата: апдейты,
+ждущие свой чат, не держат слоты и не тормозят другие чаты. Для метрик
+чаты делятся на UPDATE_SHARDS шардов по chat_id.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+from config import UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, UPDATE_SHARDS
+from utils.metrics import UPDATE_SECONDS, UPDATE_WAIT_SECONDS
+from utils.tracing import begin_update, describe, finish_update
+
+
+def chat_key(update: object) -> Optional[int]:
+    """Ключ упорядочивания: id чата, иначе id пользователя; None — без упорядочивания."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class _ChatLane:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обработчик апдейтов для ApplicationBuilder.concurrent_updates().
+
+    max_pending — сколько апдейтов может быть в работе и в ожидании
+    одновременно (ограничение базового класса), concurrency — сколько из
+    них выполняются параллельно.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = UPDATE_CONCURRENCY,
+        shards: int = UPDATE_SHARDS,
+        max_pending: int = UPDATE_MAX_PENDING,
+    ) -> None:
+        super().__init__(max(2, max_pending))
+        self.concurrency = max(1, concurrency)
+        self.shards = max(1, shards)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._lanes: dict[int, _ChatLane] = {}
+        self._queued = [0] * self.shards
+        self._running = [0] * self.shards
+        self._peak = [0] * self.shards
+        self._processed = [0] * self.shards
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = chat_key(update)
+        shard = key % self.shards if key is not None else 0
+        lane = None
+        if key is not None:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _ChatLane()
+            lane.users += 1
+        self._queued[shard] += 1
+        self._peak[shard] = max(self._peak[shard], self._queued[shard])
+        queued_at = time.perf_counter()
+        # Корень трассировки: задача этого апдейта, обработчики выполняются в ней же
+        root = begin_update(update)
+        error = ""
+        started = False
+        try:
+            if lane is not None:
+                await lane.lock.acquire()
+            try:
+                async with self._slots:
+                    self._queued[shard] -= 1
+                    self._running[shard] += 1
+                    started = True
+                    began = time.perf_counter()
+                    UPDATE_WAIT_SECONDS.observe(began - queued_at)
+                    if root is not None:
+                        root.attributes["wait_ms"] = round((began - queued_at) * 1000, 3)
+                    try:
+                        await coroutine
+                    except Exception as e:
+                        error = describe(e)
+                        raise
+                    finally:
+                        UPDATE_SECONDS.observe(time.perf_counter() - began)
+                        self._running[shard] -= 1
+                        self._processed[shard] += 1
+            finally:
+                if lane is not None:
+                    lane.lock.release()
+        finally:
+            if not started:
+                self._queued[shard] -= 1
+                # Отменённый до запуска апдейт: не оставлять корутину неожиданной
+                if hasattr(coroutine, "close"):
+                    coroutine.close()
+            if lane is not None:
+                lane.users -= 1
+                if not lane.users:
+                    del self._lanes[key]
+            if root is not None:
+                finish_update(root, error)
+
+    def stats(self) -> dict[str, Any]:
+        """Глубина очередей: всего и по шардам (queued — ждут чат или слот, peak — максимум)."""
+        return {
+            "concurrency": self.concurrency,
+            "running": sum(self._running),
+            "queued": sum(self._queued),
+            "processed": sum(self._processed),
+            "active_chats": len(self._lanes),
+            "shards": [
+                {
+                    "queued": self._queued[i],
+                    "running": self._running[i],
+                    "peak": self._peak[i],
+                    "processed": self._processed[i],
+                }
+                for i in range(self.shards)
+            ],
+        }
+
+
+@asynccontextmanager
+async def application_running(application: Application) -> AsyncIterator[Application]:
+    """Жизненный цикл Application без Updater (как в run_polling): апдейты кладёт вызывающий.
+
+    При выходе Application обрабатывает уже полученные апдейты и останавливается.
+    """
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        yield application
+    finally:
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,124 @@
+"""Режим вебхука: Telegram присылает апдейты POST-запросами на встроенный HTTP-сервер.
+
+Запрос проверяется по секрету из заголовка X-Telegram-Bot-Api-Secret-Token,
+апдейт кладётся в application.update_queue, ответ 200 уходит сразу —
+обработка идёт так же, как при polling. /healthz отвечает, пока процесс жив,
+/readyz — только когда бот запущен и не останавливается (для балансировщика).
+
+Остановка по SIGINT/SIGTERM: /readyz начинает отвечать 503, сервер перестаёт
+принимать соединения и ждёт начатые запросы (WEBHOOK_DRAIN_TIMEOUT), затем
+Application обрабатывает уже полученные апдейты и останавливается.
+Вебхук в Telegram при остановке не удаляется: его могут обслуживать другие
+экземпляры, а недоставленные апдейты Telegram пришлёт повторно.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Optional, Sequence
+
+from telegram import Update
+from telegram.ext import Application
+
+from config import (
+    WEBHOOK_DRAIN_TIMEOUT,
+    WEBHOOK_LISTEN,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_URL,
+)
+from utils.httpserver import HTTPServer, Request, Response
+from utils.updates import application_running
+
+logger = logging.getLogger("bot")
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class WebhookEndpoint:
+    """Приём апдейтов от Telegram и служебные адреса для одного Application."""
+
+    def __init__(self, application: Application, server: HTTPServer, secret_token: str, path: str = WEBHOOK_PATH) -> None:
+        self.application = application
+        self.server = server
+        self.secret_token = secret_token.encode("utf-8")
+        server.route("POST", path, self.handle_update)
+        server.route("GET", "/healthz", self.healthz)
+        server.route("GET", "/readyz", self.readyz)
+
+    @property
+    def ready(self) -> bool:
+        return self.application.running and not self.server.draining
+
+    async def handle_update(self, request: Request) -> Response:
+        token = request.headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(token, self.secret_token):
+            logger.warning("Вебхук: запрос с неверным секретом отклонён")
+            return Response.text("Forbidden", 403)
+        if not self.application.running:
+            # Telegram повторит доставку позже (в этот или другой экземпляр)
+            return Response.text("Service Unavailable", 503)
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Вебхук: некорректный апдейт ({e})")
+            return Response.text("Bad Request", 400)
+        if update is None:
+            return Response.text("Bad Request", 400)
+        await self.application.update_queue.put(update)
+        return Response.text("OK")
+
+    async def healthz(self, request: Request) -> Response:
+        return Response.text("ok")
+
+    async def readyz(self, request: Request) -> Response:
+        return Response.text("ready") if self.ready else Response.text("not ready", 503)
+
+
+async def serve_webhook(
+    application: Application,
+    allowed_updates: Optional[Sequence[str]] = None,
+    stop_event: Optional[asyncio.Event] = None,
+    host: str = WEBHOOK_LISTEN,
+    port: int = WEBHOOK_PORT,
+    server: Optional[HTTPServer] = None,
+) -> None:
+    """Полный жизненный цикл Application в режиме вебхука (как run_polling, но без Updater).
+
+    Работает, пока не установлен stop_event (по умолчанию — SIGINT/SIGTERM).
+    """
+    loop = asyncio.get_running_loop()
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+    if server is None:
+        server = HTTPServer(host, port, max_connections=WEBHOOK_MAX_CONNECTIONS)
+    WebhookEndpoint(application, server, WEBHOOK_SECRET_TOKEN)
+
+    async with application_running(application):
+        await server.start()
+        try:
+            if WEBHOOK_URL:
+                await application.bot.set_webhook(
+                    url=WEBHOOK_URL + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET_TOKEN,
+                    max_connections=WEBHOOK_MAX_CONNECTIONS,
+                    allowed_updates=list(allowed_updates) if allowed_updates else None,
+                )
+                logger.info(f"Вебхук установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+            await stop_event.wait()
+            logger.info("Остановка вебхука: завершение начатых запросов")
+        finally:
+            await server.drain(WEBHOOK_DRAIN_TIMEOUT)
+
+
+def run_webhook(application: Application, allowed_updates: Optional[Sequence[str]] = None) -> None:
+    """Запустить бота в режиме вебхука (блокирует до остановки)."""
+    asyncio.run(serve_webhook(application, allowed_updates))
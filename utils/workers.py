@@ -0,0 +1,323 @@
+"""Несколько процессов-обработчиков апдейтов (BOT_WORKERS > 1).
+
+Главный процесс только получает апдейты (polling или вебхук) и раздаёт их
+обработчикам по chat_id: все апдейты одного чата попадают в один процесс,
+поэтому шаги квиза и окна ограничителя частоты остаются локальными.
+Обработчик — полный Application со своим пулом подключений и буфером
+аналитики; база общая (SQLite в режиме WAL, запись ждёт busy_timeout).
+Процесс 0 дополнительно выполняет периодические задачи, доставку outbox,
+возобновление рассылок и подготовку изображений портфолио.
+
+Упавший обработчик перезапускается с растущей задержкой, апдейты из его
+очереди переходят новому процессу. Остановка: приёмник перестаёт получать
+апдейты и раздаёт уже полученные, каждый обработчик получает метку конца
+очереди, дорабатывает своё и завершается.
+
+Замер пропускной способности: python -m utils.workers [1 2 4 ...]
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from config import BOT_TOKEN, BOT_WORKERS, BOT_WORKERS_STOP_TIMEOUT
+from utils.updates import application_running, chat_key
+
+logger = logging.getLogger("bot")
+
+# Апдейтов за одно чтение очереди обработчиком
+BATCH_LIMIT = 100
+# Проработавший дольше процесс считается стабильным: задержка перезапуска сбрасывается
+STABLE_UPTIME = 60.0
+MAX_RESTART_DELAY = 30.0
+
+# spawn: в главном процессе уже работают потоки (очереди, HTTP-клиент), fork с ними небезопасен
+_mp = multiprocessing.get_context("spawn")
+
+
+def worker_index(key: Optional[int], workers: int) -> int:
+    """Номер обработчика для чата; апдейты без чата — процессу 0."""
+    return key % workers if key is not None else 0
+
+
+def take_batch(updates: Any, timeout: float, limit: int = BATCH_LIMIT) -> list:
+    """Дождаться элемента очереди и забрать уже пришедшие следом (до limit). Empty — по таймауту."""
+    batch = [updates.get(timeout=timeout)]
+    while len(batch) < limit and batch[-1] is not None:
+        try:
+            batch.append(updates.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _ignore_signals() -> None:
+    # Ctrl+C и SIGTERM приходят всей группе процессов, остановку ведёт главный процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def worker_main(index: int, updates: Any, parent_pid: int) -> None:
+    """Точка входа процесса-обработчика."""
+    _ignore_signals()
+    from bot import build_application  # bot импортирует этот модуль
+    from database.db import start_analytics_sink
+    from utils.logger import setup_logging
+    from utils.metrics import metrics_server
+
+    setup_logging(logging.INFO)
+    start_analytics_sink()
+    if metrics_server.port:
+        # У каждого обработчика свой /metrics
+        metrics_server.port += index
+    asyncio.run(_serve_worker(build_application(primary=index == 0), index, updates, parent_pid))
+
+
+async def _serve_worker(application: Application, index: int, updates: Any, parent_pid: int) -> None:
+    loop = asyncio.get_running_loop()
+    async with application_running(application):
+        logger.info(f"Обработчик {index} запущен (pid {os.getpid()})")
+        while True:
+            try:
+                batch = await loop.run_in_executor(None, take_batch, updates, 1.0)
+            except queue.Empty:
+                if os.getppid() != parent_pid:
+                    logger.error(f"Обработчик {index}: главный процесс завершился, остановка")
+                    return
+                continue
+            for data in batch:
+                if data is None:
+                    logger.info(f"Обработчик {index}: очередь закрыта, остановка")
+                    return
+                await application.update_queue.put(Update.de_json(data, application.bot))
+
+
+class WorkerPool:
+    """Процессы-обработчики: запуск, раздача апдейтов, перезапуск упавших, согласованная остановка.
+
+    target вызывается в новом процессе как target(index, очередь, pid главного процесса, *args).
+    """
+
+    def __init__(
+        self,
+        workers: int = BOT_WORKERS,
+        target: Callable[..., None] = worker_main,
+        args: tuple = (),
+        stop_timeout: float = BOT_WORKERS_STOP_TIMEOUT,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.target = target
+        self.args = args
+        self.stop_timeout = stop_timeout
+        self._queues = [_mp.Queue() for _ in range(self.workers)]
+        self._processes: list[Optional[multiprocessing.process.BaseProcess]] = [None] * self.workers
+        self._started_at = [0.0] * self.workers
+        self._crashes = [0] * self.workers
+        self._routed = [0] * self.workers
+        # Апдейты для обработчика, чья очередь сейчас переносится при перезапуске
+        self._held: list[Optional[list[dict]]] = [None] * self.workers
+        self._stopping = False
+        self._monitor: Optional[asyncio.Task] = None
+
+    def _spawn(self, index: int) -> None:
+        # Не daemon: обработчик сам запускает процессы (подготовка изображений)
+        process = _mp.Process(
+            target=self.target,
+            args=(index, self._queues[index], os.getpid(), *self.args),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    async def start(self, application: Optional[Application] = None) -> None:
+        """Запустить обработчики (post_init приёмника)."""
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor = asyncio.create_task(self._watch())
+        logger.info(f"Запущено обработчиков: {self.workers}")
+
+    def route(self, update: Update) -> int:
+        """Передать апдейт обработчику его чата. Возвращает номер обработчика."""
+        index = worker_index(chat_key(update), self.workers)
+        if self._held[index] is not None:
+            self._held[index].append(update.to_dict())
+        else:
+            self._queues[index].put(update.to_dict())
+        self._routed[index] += 1
+        return index
+
+    async def handle_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        self.route(update)
+
+    async def _watch(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(0.5)
+            for index, process in enumerate(self._processes):
+                if self._stopping:
+                    return
+                if process is not None and not process.is_alive():
+                    await self._restart(index, process.exitcode)
+
+    async def _restart(self, index: int, exitcode: Optional[int]) -> None:
+        if time.monotonic() - self._started_at[index] >= STABLE_UPTIME:
+            self._crashes[index] = 0
+        self._crashes[index] += 1
+        delay = min(MAX_RESTART_DELAY, 2.0 ** (self._crashes[index] - 1))
+        logger.error(f"Обработчик {index} завершился (код {exitcode}), перезапуск через {delay:.0f} с")
+        self._processes[index] = None
+        await asyncio.sleep(delay)
+        if self._stopping:
+            return
+        # Очередь, которую читал упавший процесс, могла остаться заблокированной: новому — новая,
+        # с непрочитанными апдейтами. Чтение блокирующее — в пуле потоков; пришедшие за это время
+        # апдейты придерживаются в памяти и идут после старых, чтобы не обогнать их
+        old = self._queues[index]
+        self._queues[index] = _mp.Queue()
+        self._held[index] = []
+        try:
+            pending = await asyncio.get_running_loop().run_in_executor(None, self._drain, old)
+        finally:
+            held, self._held[index] = self._held[index], None
+        for item in pending + held:
+            self._queues[index].put(item)
+        if pending:
+            logger.info(f"Обработчик {index}: передано новому процессу апдейтов: {len(pending)}")
+        self._spawn(index)
+
+    @staticmethod
+    def _drain(old: Any) -> list[dict]:
+        pending = []
+        while True:
+            try:
+                item = old.get(timeout=0.05)
+            except queue.Empty:
+                break
+            if item is not None:
+                pending.append(item)
+        old.cancel_join_thread()
+        old.close()
+        return pending
+
+    async def stop(self, application: Optional[Application] = None) -> None:
+        """Закрыть очереди и дождаться обработчиков (post_stop приёмника: все апдейты уже розданы)."""
+        self._stopping = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+        for updates in self._queues:
+            updates.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._join)
+        logger.info(f"Обработчики остановлены, роздано апдейтов: {self._routed}")
+
+    def _join(self) -> None:
+        deadline = time.monotonic() + self.stop_timeout
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Обработчик {index} не завершился за {self.stop_timeout:.0f} с, принудительная остановка")
+                process.terminate()
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+        for updates in self._queues:
+            updates.cancel_join_thread()
+            updates.close()
+
+
+def build_receiver(pool: WorkerPool) -> Application:
+    """Application главного процесса: только получает апдейты и раздаёт их обработчикам."""
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .job_queue(None)
+        .post_init(pool.start)
+        .post_stop(pool.stop)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, pool.handle_update))
+    return application
+
+
+# --- Замер пропускной способности ---
+
+BENCH_UPDATES = 4000
+BENCH_CHATS = 1000
+# Время работы обработчика на один апдейт (CPU), мс
+BENCH_WORK_MS = 2.0
+
+
+def _bench_worker(index: int, updates: Any, parent_pid: int, work_ms: float, results: Any) -> None:
+    """Обработчик для замера: разбор апдейта и работа процессора вместо обработчиков бота."""
+    _ignore_signals()
+    results.put(None)
+    handled = 0
+    while True:
+        try:
+            batch = take_batch(updates, 1.0)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                return
+            continue
+        for data in batch:
+            if data is None:
+                results.put(handled)
+                return
+            Update.de_json(data, None)
+            deadline = time.perf_counter() + work_ms / 1000
+            while time.perf_counter() < deadline:
+                pass
+            handled += 1
+
+
+async def bench(workers: int, count: int = BENCH_UPDATES, chats: int = BENCH_CHATS, work_ms: float = BENCH_WORK_MS) -> float:
+    """Апдейтов в секунду при данном числе обработчиков (от первого апдейта до завершения всех)."""
+    results = _mp.Queue()
+    pool = WorkerPool(workers, target=_bench_worker, args=(work_ms, results))
+    await pool.start()
+    loop = asyncio.get_running_loop()
+    for _ in range(workers):
+        await loop.run_in_executor(None, results.get)
+    now = datetime.now()
+    updates = [
+        Update(i, message=Message(i, now, Chat(i % chats, Chat.PRIVATE), from_user=User(i % chats, "u", False), text="x"))
+        for i in range(count)
+    ]
+    started = time.perf_counter()
+    for update in updates:
+        pool.route(update)
+    await pool.stop()
+    elapsed = time.perf_counter() - started
+    handled = 0
+    for _ in range(workers):
+        handled += await loop.run_in_executor(None, results.get)
+    return handled / elapsed
+
+
+if __name__ == "__main__":
+    from utils.logger import setup_logging
+    from utils.workers import bench as run_bench  # функции процессов — из модуля, а не из __main__
+
+    setup_logging(logging.WARNING)
+    counts = [int(x) for x in sys.argv[1:]] or [1, 2, 4]
+    print(f"Апдейтов: {BENCH_UPDATES}, чатов: {BENCH_CHATS}, работа обработчика: {BENCH_WORK_MS} мс, ядер: {os.cpu_count()}")
+    base = None
+    for workers in counts:
+        rate = asyncio.run(run_bench(workers))
+        base = base or rate
+        print(f"обработчиков {workers}: {rate:8.0f} апд/с  (x{rate / base:.2f})")